@@ -5,6 +5,8 @@ from django.utils.safestring import mark_safe
 from simple_history.admin import SimpleHistoryAdmin
 from .models import *
 from .structures import SECTION_MAP
+from .history import deferred_history
+from .refresh import batched_element_refresh
 
 # =========================================================
 # 1. ЕДИНЫЙ ВИДЖЕТ (МАТРИЦА НАСТРОЕК)
@@ -236,8 +238,49 @@ class ChemicalElementAdmin(SimpleHistoryAdmin):
     for m in section_models:
         inlines.append(create_inline(m, m._meta.verbose_name))
 
+    actions = ['publish_selected', 'reject_selected']
+
     def save_model(self, request, obj, form, change):
         if not obj.pk and not obj.created_by_id: obj.created_by = request.user
         super().save_model(request, obj, form, change)
 
-    def status_badge(self, obj): return obj.get_status_display()
\ No newline at end of file
+    def changeform_view(self, request, *args, **kwargs):
+        # Вещество и инлайны секций: одно обновление вещества на сохранение формы (registry.refresh)
+        with batched_element_refresh():
+            return super().changeform_view(request, *args, **kwargs)
+
+    def _set_status(self, request, queryset, status):
+        # Массовая модерация: save() на каждый объект (сигналы, письма), история - пачкой
+        changed = 0
+        with deferred_history(user=request.user):
+            for obj in queryset.exclude(status=status).select_related('created_by'):
+                obj.status = status
+                obj.save()
+                changed += 1
+        self.message_user(request, f"Статус изменен у {changed} веществ.")
+
+    @admin.action(description="Опубликовать выбранные")
+    def publish_selected(self, request, queryset):
+        self._set_status(request, queryset, ChemicalElement.Status.PUBLISHED)
+
+    @admin.action(description="Отклонить выбранные")
+    def reject_selected(self, request, queryset):
+        self._set_status(request, queryset, ChemicalElement.Status.REJECTED)
+
+    def status_badge(self, obj): return obj.get_status_display()
+# =========================================================
+# 5. ЗАДАЧИ ИМПОРТА (только просмотр)
+# =========================================================
+@admin.register(ImportJob)
+class ImportJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'file_name', 'created_by', 'mode', 'status', 'processed_rows', 'total_rows', 'updated_at')
+    list_filter = ('status', 'mode')
+    search_fields = ('file_name', 'file_hash', 'task_id')
+    readonly_fields = [f.name for f in ImportJob._meta.fields]
+
+    def get_queryset(self, request):
+        # Части больших файлов видны внутри основной задачи (parent)
+        return super().get_queryset(request).filter(parent=None)
+
+    def has_add_permission(self, request):
+        return False
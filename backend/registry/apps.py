@@ -8,6 +8,7 @@ class RegistryConfig(AppConfig):
     def ready(self):
         try:
             import registry.signals  # <--- ВАЖНЕЙШАЯ СТРОКА
+            import registry.history  # Отложенная запись истории (deferred_history)
             print("--- Signals Loaded Successfully ---") # Для отладки в логах
         except ImportError:
             pass
\ No newline at end of file
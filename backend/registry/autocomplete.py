@@ -0,0 +1,157 @@
+from django_redis import get_redis_connection
+
+from registry.models import ChemicalElement
+from .cas import normalize_cas
+from .synonyms import normalize_term, split_synonyms
+
+# =========================================================================
+# АВТОДОПОЛНЕНИЕ (suggest): ПРЕФИКСНЫЙ ИНДЕКС В REDIS
+# =========================================================================
+# suggest дергается на каждое нажатие клавиши, поэтому в БД он не ходит.
+# Термины опубликованных веществ (название, слова названия, синонимы, CAS)
+# лежат в одном sorted set с нулевыми весами: ZRANGEBYLEX по префиксу
+# возвращает совпадения за один запрос. Элемент множества -
+# "термин\0вид\0id\0подпись", поэтому префикс термина и есть префикс элемента.
+#
+# Какие элементы принадлежат веществу - в хэше MEMBERS_KEY (id -> элементы
+# через \1): по нему индекс обновляется точечно при публикации, правке и
+# удалении (signals, импорт, load_registry). Черновики в индекс не попадают.
+# Ночная задача rebuild_autocomplete_task собирает индекс заново.
+
+TERMS_KEY = 'registry:autocomplete:terms'
+MEMBERS_KEY = 'registry:autocomplete:members'
+
+# Сколько подсказок отдаем и сколько кандидатов берем из Redis для ранжирования
+AUTOCOMPLETE_LIMIT = 10
+AUTOCOMPLETE_CANDIDATES = 100
+AUTOCOMPLETE_MIN_LENGTH = 2
+
+# Вид термина -> (приоритет в выдаче, тип подсказки для фронтенда)
+KINDS = {
+    'name': (0, "Вещество"),
+    'cas': (1, "CAS"),
+    'synonym': (2, "Синоним"),
+    'word': (3, "Вещество"),
+}
+
+SEPARATOR = '\x00'
+MEMBERS_SEPARATOR = '\x01'
+
+
+def element_members(element_id, name, cas_number, synonyms):
+    """Элементы sorted set для одного вещества."""
+    entries = []
+    if name:
+        entries.append((name, 'name', name))
+        # Слова из середины названия: "техн" находит "Бензол технический"
+        words = name.split()
+        for i in range(1, len(words)):
+            if len(words[i]) >= AUTOCOMPLETE_MIN_LENGTH:
+                entries.append((" ".join(words[i:]), 'word', name))
+    if cas_number:
+        entries.append((cas_number, 'cas', f"{cas_number} ({name})"))
+        # Интеграции и сканеры вводят CAS без дефисов
+        digits = normalize_cas(cas_number)
+        if digits:
+            entries.append((digits, 'cas', f"{cas_number} ({name})"))
+    for synonym in split_synonyms(synonyms):
+        entries.append((synonym, 'synonym', f"{synonym} ({name})"))
+
+    members = set()
+    for term, kind, label in entries:
+        term = normalize_term(term)
+        if term:
+            members.add(SEPARATOR.join((term, kind, str(element_id), label)))
+    return members
+
+
+def published_members(element_ids=None):
+    """{id: элементы} опубликованных веществ (все или из element_ids)."""
+    qs = ChemicalElement.objects.filter(status=ChemicalElement.Status.PUBLISHED)
+    if element_ids is not None:
+        qs = qs.filter(pk__in=element_ids)
+    rows = qs.values_list('id', 'primary_name_ru', 'cas_number', 'sec1_identification__synonyms')
+    return {pk: element_members(pk, name, cas, synonyms) for pk, name, cas, synonyms in rows.iterator()}
+
+
+def decode_members(value):
+    return set(value.decode('utf-8').split(MEMBERS_SEPARATOR)) if value else set()
+
+
+def sync_elements(element_ids, batch_size=1000):
+    """
+    Приводит индекс в соответствие с БД для перечисленных веществ: снятые с публикации
+    и удаленные выпадают, опубликованные - добавляются с актуальными терминами.
+    """
+    element_ids = [int(pk) for pk in element_ids]
+    for start in range(0, len(element_ids), batch_size):
+        sync_batch(element_ids[start:start + batch_size])
+
+
+def sync_batch(element_ids):
+    current = published_members(element_ids)
+    client = get_redis_connection('default')
+
+    def apply(pipe):
+        # WATCH на хэш: если параллельная синхронизация успела его поменять - повторяем
+        old = dict(zip(element_ids, (decode_members(v) for v in pipe.hmget(MEMBERS_KEY, element_ids))))
+        pipe.multi()
+        for pk in element_ids:
+            new = current.get(pk, set())
+            if old[pk] - new:
+                pipe.zrem(TERMS_KEY, *(old[pk] - new))
+            if new - old[pk]:
+                pipe.zadd(TERMS_KEY, {member: 0 for member in new - old[pk]})
+            if new:
+                pipe.hset(MEMBERS_KEY, pk, MEMBERS_SEPARATOR.join(sorted(new)))
+            else:
+                pipe.hdel(MEMBERS_KEY, pk)
+
+    client.transaction(apply, MEMBERS_KEY)
+
+
+def rebuild_index(batch_size=2000):
+    """Полная пересборка: новый индекс пишется во временные ключи и подменяет старый через RENAME."""
+    client = get_redis_connection('default')
+    tmp_terms, tmp_members = f"{TERMS_KEY}:rebuild", f"{MEMBERS_KEY}:rebuild"
+    client.delete(tmp_terms, tmp_members)
+
+    count = 0
+    pipe = client.pipeline(transaction=False)
+    for pk, members in published_members().items():
+        if members:
+            pipe.zadd(tmp_terms, {member: 0 for member in members})
+            pipe.hset(tmp_members, pk, MEMBERS_SEPARATOR.join(sorted(members)))
+        count += 1
+        if count % batch_size == 0:
+            pipe.execute()
+    pipe.execute()
+
+    pipe = client.pipeline()
+    pipe.delete(TERMS_KEY, MEMBERS_KEY)
+    if client.exists(tmp_terms):
+        pipe.rename(tmp_terms, TERMS_KEY)
+        pipe.rename(tmp_members, MEMBERS_KEY)
+    pipe.execute()
+    return count
+
+
+def get_suggestions(q, limit=AUTOCOMPLETE_LIMIT):
+    """Подсказки по префиксу: одно вещество - одна подсказка, лучшая по виду термина и длине."""
+    prefix = normalize_term(q)
+    if len(prefix) < AUTOCOMPLETE_MIN_LENGTH:
+        return []
+    start = prefix.encode('utf-8')
+    # \xff не встречается в UTF-8, поэтому [prefix..[prefix\xff - ровно все термины с этим префиксом
+    candidates = get_redis_connection('default').zrangebylex(
+        TERMS_KEY, b'[' + start, b'[' + start + b'\xff', start=0, num=AUTOCOMPLETE_CANDIDATES
+    )
+
+    best = {}
+    for member in candidates:
+        term, kind, pk, label = member.decode('utf-8').split(SEPARATOR, 3)
+        priority, kind_label = KINDS[kind]
+        rank = (priority, len(term), label)
+        if pk not in best or rank < best[pk][0]:
+            best[pk] = (rank, {"label": label, "type": kind_label, "id": int(pk)})
+    return [item for _, item in sorted(best.values(), key=lambda pair: pair[0])][:limit]
@@ -0,0 +1,285 @@
+import csv
+import io
+from django.db import connection, transaction
+from django.db.models.expressions import RawSQL
+from django.utils import timezone
+
+from registry.models import ChemicalElement, RegistryConfig, Sec1Identification
+from .autocomplete import sync_elements
+from .cas import canonical_cas, normalize_cas
+from .readers import open_import_reader
+from .search import update_search_vectors
+from .services import FALSE_VALUES, TRUE_VALUES, ImportPlan, get_section_models
+from .synonyms import sync_synonyms
+
+# =========================================================================
+# ПЕРВИЧНАЯ ЗАГРУЗКА РЕЕСТРА ЧЕРЕЗ COPY (manage.py load_registry)
+# =========================================================================
+# Для сотен тысяч строк даже пакетный ORM-импорт медленный. Здесь файл
+# потоком уходит в staging-таблицу через COPY FROM STDIN, проверка и
+# подстановка значений списков делаются SQL-запросами по всей таблице сразу,
+# а вещества, секции и первые версии истории вставляются несколькими
+# INSERT ... SELECT. Все в одной транзакции.
+
+STAGING_TABLE = "registry_load_staging"
+ERRORS_TABLE = "registry_load_errors"
+
+
+class CopyStream:
+    """Файлоподобный CSV-поток для COPY FROM STDIN: строки генерируются по мере чтения."""
+    def __init__(self, rows):
+        self.rows = iter(rows)
+        self.buffer = io.StringIO()
+        self.writer = csv.writer(self.buffer)
+        self.count = 0
+
+    def read(self, size=8192):
+        while self.buffer.tell() < size:
+            row = next(self.rows, None)
+            if row is None:
+                break
+            self.writer.writerow(row)
+            self.count += 1
+        data = self.buffer.getvalue()
+        self.buffer.seek(0)
+        self.buffer.truncate()
+        return data
+
+    readline = read
+
+
+def q(name):
+    return connection.ops.quote_name(name)
+
+
+class RegistryLoader:
+    """
+    Загрузка одного файла. Колонки - как в шаблоне импорта (SECTION_MAP) или имена полей БД.
+    Пустая ячейка = NULL; пустые строки пропускаются, строки с ошибками не загружаются.
+    """
+    def __init__(self, user, status=ChemicalElement.Status.DRAFT):
+        self.user = user
+        self.status = status
+        self.now = timezone.now()
+
+    def load(self, file, filename, dry_run=False):
+        with open_import_reader(file, filename) as reader:
+            config_obj = RegistryConfig.objects.first()
+            self.plan = ImportPlan(reader.columns, config_obj.required_fields if config_obj else [])
+
+            missing = self.plan.missing_columns()
+            if missing:
+                raise ValueError(f"В файле нет обязательной колонки '{missing[0]}'")
+
+            # Колонка staging-таблицы для каждого поля файла: c0, c1, ...
+            self.columns = {(col.model, col.field): (f"c{i}", col) for i, col in enumerate(self.plan.columns)}
+
+            with transaction.atomic():
+                with connection.cursor() as cursor:
+                    self.cursor = cursor
+                    rows = self.copy_rows(reader)
+                    self.validate()
+                    errors = self.fetch_errors()
+                    loaded = self.merge()
+                    if dry_run:
+                        transaction.set_rollback(True)
+
+        return {"rows": rows, "loaded": loaded, "errors": errors}
+
+    # --- 1. COPY во временную таблицу --------------------------------------
+    def copy_rows(self, reader):
+        value_columns = ", ".join(f"{name} text" for name, _ in self.columns.values())
+        names = ", ".join(name for name, _ in self.columns.values())
+        indexes = [col.index for _, col in self.columns.values()]
+        cas = self.columns.get((ChemicalElement, 'cas_number'))
+        cas_position = None
+        if cas:
+            # CAS - в канонической записи, его цифры - в отдельной колонке (тот же нормализатор, что у модели)
+            value_columns += ", cas_normalized text"
+            names += ", cas_normalized"
+            cas_position = 1 + indexes.index(cas[1].index)
+
+        self.cursor.execute(
+            f"CREATE TEMP TABLE {STAGING_TABLE} (row_num integer PRIMARY KEY, element_id bigint, {value_columns}) ON COMMIT DROP"
+        )
+        self.cursor.execute(f"CREATE TEMP TABLE {ERRORS_TABLE} (row_num integer, message text) ON COMMIT DROP")
+
+        stream = CopyStream(self.copy_values(row_num, values, indexes, cas_position) for row_num, values in reader)
+        # Пустое поле без кавычек в CSV - это NULL
+        self.cursor.cursor.copy_expert(
+            f"COPY {STAGING_TABLE} (row_num, {names}) FROM STDIN WITH (FORMAT csv)", stream
+        )
+
+        # Полностью пустые строки импорт пропускает молча
+        self.cursor.execute(
+            f"DELETE FROM {STAGING_TABLE} WHERE " + " AND ".join(f"{name} IS NULL" for name, _ in self.columns.values())
+        )
+        self.cursor.execute(f"ANALYZE {STAGING_TABLE}")
+        return stream.count
+
+    @staticmethod
+    def copy_values(row_num, values, indexes, cas_position):
+        row = [row_num] + [values[i] or None for i in indexes]
+        if cas_position is not None:
+            row[cas_position] = canonical_cas(row[cas_position])
+            row.append(normalize_cas(row[cas_position]))
+        return row
+
+    # --- 2. Проверки по всей таблице сразу --------------------------------
+    def add_errors(self, where, message, message_params=(), where_params=()):
+        # message - SQL-выражение текста ошибки (может ссылаться на значения строки)
+        self.cursor.execute(
+            f"INSERT INTO {ERRORS_TABLE} (row_num, message) "
+            f"SELECT row_num, 'Строка ' || row_num || ': ' || {message} FROM {STAGING_TABLE} WHERE {where}",
+            [*message_params, *where_params]
+        )
+
+    def validate(self):
+        plan = self.plan
+        required = plan.system_required + [f for f in plan.required_fields if f not in plan.system_required]
+
+        for (model, field), (name, col) in self.columns.items():
+            human = plan.human_names.get(field, field)
+
+            if field in required:
+                text = f"Отсутствует '{human}'" if field in plan.system_required else f"Поле '{human}' обязательно для заполнения."
+                self.add_errors(f"{name} IS NULL", "%s", [text])
+
+            if col.is_boolean:
+                self.add_errors(
+                    f"{name} IS NOT NULL AND lower({name}) <> ALL(%s)",
+                    f"%s || {name} || %s", [f"{human}: не распознано значение '", "' (ожидается Да/Нет)"],
+                    [TRUE_VALUES + FALSE_VALUES]
+                )
+            elif col.choices:
+                labels, keys = zip(*col.choices.items())
+                self.add_errors(
+                    f"{name} IS NOT NULL AND lower({name}) <> ALL(%s)",
+                    f"%s || {name} || %s", [f"{human}: значения '", "' нет в списке допустимых"],
+                    [list(labels)]
+                )
+                # Подпись из списка -> ключ ("Жидкость" -> "LIQUID") одним UPDATE
+                self.cursor.execute(
+                    f"UPDATE {STAGING_TABLE} s SET {name} = m.key "
+                    f"FROM unnest(%s::text[], %s::text[]) AS m(label, key) WHERE lower(s.{name}) = m.label",
+                    [list(labels), [str(k) for k in keys]]
+                )
+            elif col.max_length:
+                self.add_errors(
+                    f"length({name}) > %s", "%s",
+                    [f"{human}: значение длиннее {col.max_length} символов"], [col.max_length]
+                )
+
+        cas = self.columns.get((ChemicalElement, 'cas_number'))
+        if cas:
+            name = cas[0]
+            # Повтор внутри файла: загружается первая строка
+            self.cursor.execute(
+                f"INSERT INTO {ERRORS_TABLE} (row_num, message) "
+                f"SELECT row_num, 'Строка ' || row_num || ': CAS ''' || {name} || ''' повторяется (уже в строке ' || first_row || ')' "
+                f"FROM (SELECT row_num, {name}, min(row_num) OVER (PARTITION BY {name}) AS first_row "
+                f"      FROM {STAGING_TABLE} WHERE {name} IS NOT NULL) d "
+                f"WHERE row_num <> first_row"
+            )
+            # Занятые номера: правильные - по уникальному cas_normalized (в базе они могут быть записаны
+            # иначе), остальные - по cas_number, как registry.cas.cas_filter
+            table = q(ChemicalElement._meta.db_table)
+            self.add_errors(
+                f"(cas_normalized IN (SELECT cas_normalized FROM {table} WHERE cas_normalized IS NOT NULL)"
+                f" OR (cas_normalized IS NULL AND {name} IN (SELECT cas_number FROM {table} WHERE cas_number IS NOT NULL)))",
+                f"'Вещество с CAS ''' || {name} || ''' уже есть в реестре'"
+            )
+
+        self.cursor.execute(f"DELETE FROM {STAGING_TABLE} WHERE row_num IN (SELECT row_num FROM {ERRORS_TABLE})")
+
+    def fetch_errors(self):
+        self.cursor.execute(f"SELECT message FROM {ERRORS_TABLE} ORDER BY row_num")
+        return [message for (message,) in self.cursor.fetchall()]
+
+    # --- 3. Вставка в реестр ----------------------------------------------
+    def field_value(self, model, field):
+        """SQL-выражение и параметры для значения поля в INSERT ... SELECT."""
+        if field.primary_key:
+            return None
+        if model is not ChemicalElement and field.name == 'element':
+            return "s.element_id", []
+        if model is ChemicalElement:
+            if field.name == 'cas_normalized':
+                return ("s.cas_normalized", []) if (model, 'cas_number') in self.columns else ("NULL", [])
+            if field.name == 'created_by':
+                return "%s", [self.user.pk]
+            if field.name == 'status':
+                return "%s", [self.status]
+            if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False):
+                return "%s", [self.now]
+
+        default = field.get_db_prep_save(field.get_default(), connection)
+        mapped = self.columns.get((model, field.name))
+        if mapped is None:
+            return "%s", [default]
+
+        name, col = mapped
+        if col.is_boolean:
+            return f"COALESCE(lower(s.{name}) = ANY(%s), %s)", [TRUE_VALUES, default]
+        return f"COALESCE(s.{name}, %s)", [default]
+
+    def insert_select(self, model, with_id=False):
+        columns, values, params = [], [], []
+        if with_id:
+            columns.append(q(model._meta.pk.column))
+            values.append("s.element_id")
+        for field in model._meta.concrete_fields:
+            value = self.field_value(model, field)
+            if value is None:
+                continue
+            columns.append(q(field.column))
+            values.append(value[0])
+            params.extend(value[1])
+
+        self.cursor.execute(
+            f"INSERT INTO {q(model._meta.db_table)} ({', '.join(columns)}) "
+            f"SELECT {', '.join(values)} FROM {STAGING_TABLE} s ORDER BY s.row_num",
+            params
+        )
+
+    def seed_history(self, model):
+        """Первая версия ('+') для каждой вставленной записи - как у bulk_create_with_history."""
+        history_model = model.history.model
+        tracked = [q(history_model._meta.get_field(f.attname).column) for f in history_model.tracked_fields]
+        key = q(model._meta.pk.column) if model is ChemicalElement else q(model._meta.get_field('element').column)
+        columns = ", ".join(tracked)
+
+        self.cursor.execute(
+            f"INSERT INTO {q(history_model._meta.db_table)} "
+            f"({columns}, history_date, history_type, history_user_id, history_change_reason) "
+            f"SELECT {', '.join('t.' + c for c in tracked)}, %s, '+', %s, NULL "
+            f"FROM {q(model._meta.db_table)} t JOIN {STAGING_TABLE} s ON s.element_id = t.{key}",
+            [self.now, self.user.pk]
+        )
+
+    def merge(self):
+        # id веществ выдаем заранее из последовательности: по ним связываются секции
+        table = ChemicalElement._meta.db_table
+        self.cursor.execute(
+            f"UPDATE {STAGING_TABLE} SET element_id = nextval(pg_get_serial_sequence(%s, %s))",
+            [table, ChemicalElement._meta.pk.column]
+        )
+        loaded = self.cursor.rowcount
+
+        self.insert_select(ChemicalElement, with_id=True)
+        self.seed_history(ChemicalElement)
+        # Все секции создаем сразу (включая пустые, чтобы админка не падала)
+        for model_cls in get_section_models():
+            self.insert_select(model_cls)
+            self.seed_history(model_cls)
+
+        # Поисковые документы загруженных веществ - одним UPDATE по id из staging
+        update_search_vectors(RawSQL(f"SELECT element_id FROM {STAGING_TABLE}", []))
+        if (Sec1Identification, 'synonyms') in self.columns:
+            sync_synonyms(RawSQL(f"SELECT element_id FROM {STAGING_TABLE}", []))
+        if self.status == ChemicalElement.Status.PUBLISHED:
+            # Сразу опубликованные - в индекс автодополнения (staging удаляется на коммите, id забираем сейчас)
+            self.cursor.execute(f"SELECT element_id FROM {STAGING_TABLE}")
+            ids = [row[0] for row in self.cursor.fetchall()]
+            transaction.on_commit(lambda: sync_elements(ids))
+        return loaded
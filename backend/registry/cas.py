@@ -0,0 +1,89 @@
+import re
+from django.db.models import Q
+
+# =========================================================================
+# НОМЕРА CAS: НОРМАЛИЗАЦИЯ И КОНТРОЛЬНАЯ ЦИФРА
+# =========================================================================
+# CAS - это 2-7 цифр, 2 цифры и контрольная цифра: "50-00-0". В файлах и
+# интеграциях он приходит как угодно ("50000", " 50-00-0 "), поэтому у
+# вещества хранится и каноническая запись (cas_number), и цифры без дефисов
+# (cas_normalized, уникальный индекс) - только если контрольная цифра сходится.
+# Один нормализатор на все пути: модель, сериализатор, импорт, load_registry, поиск.
+
+CAS_MIN_DIGITS = 5
+CAS_MAX_DIGITS = 10
+
+# Запрос похож на CAS целиком ("50-00-0") или на его начало ("50-0", "50-00-")
+CAS_FULL_RE = re.compile(r'^\d{2,7}-\d{2}-\d$')
+CAS_PREFIX_RE = re.compile(r'^\d{2,7}-\d{0,2}-?$')
+CAS_DIGITS_RE = re.compile(r'^\d{%d,%d}$' % (CAS_MIN_DIGITS, CAS_MAX_DIGITS))
+
+
+def cas_check_digit(digits):
+    """Контрольная цифра: сумма цифр (без последней) с весами 1, 2, 3... справа налево, по модулю 10."""
+    return sum(i * int(d) for i, d in enumerate(reversed(digits[:-1]), start=1)) % 10
+
+
+def normalize_cas(value):
+    """'50-00-0', ' 50000 ' -> '50000'; None, если это не CAS или не сходится контрольная цифра."""
+    if not value:
+        return None
+    value = str(value).strip()
+    if not (CAS_FULL_RE.match(value) or CAS_DIGITS_RE.match(value)):
+        return None
+    digits = value.replace('-', '')
+    if cas_check_digit(digits) != int(digits[-1]):
+        return None
+    return digits
+
+
+def format_cas(digits):
+    return f"{digits[:-3]}-{digits[-3:-1]}-{digits[-1]}"
+
+
+def canonical_cas(value):
+    """
+    Значение для cas_number: правильный CAS - в виде "50-00-0", остальное - как ввели, без пробелов
+    по краям (старые и нестандартные номера не теряем). Пустое - None: уникальность не мешает.
+    """
+    if value is None:
+        return None
+    value = str(value).strip()
+    if not value:
+        return None
+    digits = normalize_cas(value)
+    return format_cas(digits) if digits else value
+
+
+def cas_key(value):
+    """Ключ сопоставления CAS: цифры правильного номера (как cas_normalized), иначе сам номер."""
+    return normalize_cas(value) or value
+
+
+def element_cas_key(element):
+    return element.cas_normalized or element.cas_number
+
+
+def cas_filter(values):
+    """
+    Q для поиска веществ по списку CAS (импорт, проверка дублей): правильные номера - по
+    уникальному cas_normalized, в какой бы записи они ни лежали в базе, остальные - по cas_number.
+    """
+    values = [v for v in values if v]
+    digits = {normalize_cas(v) for v in values} - {None}
+    raw = [v for v in values if not normalize_cas(v)]
+    return Q(cas_normalized__in=digits) | Q(cas_number__in=raw)
+
+
+def cas_query(q):
+    """
+    Поиск по CAS для строки запроса: {'cas_normalized': цифры} - точный,
+    {'cas_normalized__startswith': цифры} - по началу номера, None - запрос не похож на CAS.
+    """
+    q = q.strip()
+    digits = normalize_cas(q)
+    if digits:
+        return {'cas_normalized': digits}
+    if CAS_PREFIX_RE.match(q):
+        return {'cas_normalized__startswith': q.replace('-', '')}
+    return None
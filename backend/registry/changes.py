@@ -0,0 +1,97 @@
+from datetime import timedelta, timezone as dt_timezone
+from django.db.models import Exists, OuterRef, Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from registry.models import ChemicalElement
+from .snapshots import snapshot_columns
+
+# =========================================================================
+# ЛЕНТА ИЗМЕНЕНИЙ ОТКРЫТЫХ ДАННЫХ (дельты после водяного знака)
+# =========================================================================
+# Вместо полной выгрузки потребитель забирает только изменения после своей
+# отметки (курсор = время изменения + id). Источники:
+#   - ChemicalElement.updated_at: создание и правка (правка секций тоже
+#     двигает updated_at вещества - см. signals.touch_element);
+#   - история simple_history: удаленные вещества (history_type '-').
+# Отдаются только опубликованные вещества. Снятое с публикации или удаленное
+# вещество, которое когда-то было опубликовано, приходит как "deleted".
+# Запись - те же колонки, что в Parquet-снимке: снимок + дельты = текущий реестр.
+
+CHANGE_FEED_PAGE_SIZE = 500
+CHANGE_FEED_MAX_PAGE_SIZE = 5000
+# Изменения моложе LAG не отдаем: транзакция с более ранним updated_at может
+# закоммититься позже, и потребитель, ушедший вперед по курсору, ее бы пропустил
+CHANGE_FEED_LAG = timedelta(seconds=30)
+
+
+def encode_cursor(changed_at, pk):
+    return f"{changed_at.isoformat()}|{pk}"
+
+
+def parse_cursor(value):
+    """'<ISO-время>|<id>' (курсор ленты) или просто ISO-время (начальная отметка, например из снимка)."""
+    stamp, _, pk = value.partition('|')
+    changed_at = parse_datetime(stamp)
+    if changed_at is None:
+        raise ValueError(f"Неверная отметка: {value}")
+    if timezone.is_naive(changed_at):
+        changed_at = timezone.make_aware(changed_at, dt_timezone.utc)
+    return changed_at, int(pk or 0)
+
+
+def _after(field, changed_at, pk, id_field='id'):
+    return Q(**{f"{field}__gt": changed_at}) | Q(**{field: changed_at, f"{id_field}__gt": pk})
+
+
+def _was_published():
+    history = ChemicalElement.history.model
+    return Exists(history.objects.filter(id=OuterRef('id'), status=ChemicalElement.Status.PUBLISHED))
+
+
+def element_changes(changed_at, pk, until, limit):
+    columns = [name for name, _ in snapshot_columns()]
+    published = ChemicalElement.Status.PUBLISHED
+    rows = (
+        ChemicalElement.objects
+        .filter(_after('updated_at', changed_at, pk), updated_at__lte=until)
+        .filter(Q(status=published) | _was_published())
+        .order_by('updated_at', 'id')
+        .values(*columns)[:limit]
+    )
+    for row in rows:
+        if row['status'] != published:
+            action, element = "deleted", None
+        else:
+            action, element = ("created" if row['created_at'] > changed_at else "updated"), row
+        yield {"id": row['id'], "action": action, "changed_at": row['updated_at'], "element": element}
+
+
+def deleted_changes(changed_at, pk, until, limit):
+    history = ChemicalElement.history.model
+    rows = (
+        history.objects
+        .filter(_after('history_date', changed_at, pk), history_type='-', history_date__lte=until)
+        .filter(_was_published())
+        .order_by('history_date', 'id')
+        .values_list('id', 'history_date')[:limit]
+    )
+    for element_id, history_date in rows:
+        yield {"id": element_id, "action": "deleted", "changed_at": history_date, "element": None}
+
+
+def get_changes(cursor, limit=CHANGE_FEED_PAGE_SIZE):
+    """
+    Страница ленты после курсора: {"changes": [...], "cursor": новая отметка, "has_more": bool}.
+    Оба источника упорядочены по (время, id) - берем limit + 1 из каждого и сливаем.
+    """
+    changed_at, pk = cursor
+    until = timezone.now() - CHANGE_FEED_LAG
+    changes = sorted(
+        [*element_changes(changed_at, pk, until, limit + 1), *deleted_changes(changed_at, pk, until, limit + 1)],
+        key=lambda change: (change['changed_at'], change['id'])
+    )
+    page = changes[:limit]
+    if page:
+        cursor = (page[-1]['changed_at'], page[-1]['id'])
+    return {"changes": page, "cursor": encode_cursor(*cursor), "has_more": len(changes) > limit}
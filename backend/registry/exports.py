@@ -0,0 +1,195 @@
+import csv
+import hashlib
+import io
+import json
+import tempfile
+from django.conf import settings
+from django.core.files.storage import default_storage
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.utils import get_column_letter
+
+from registry.models import ChemicalElement
+from .search import fuzzy_thresholds
+from .services import get_field_info, get_section_relations, style_header_cell, template_columns
+from storages.backends.s3boto3 import S3Boto3Storage
+
+# =========================================================================
+# ЭКСПОРТ (раскладка = шаблон импорта, файл можно загрузить обратно)
+# =========================================================================
+# Строки читаются из БД курсором на стороне сервера (iterator) кусками по
+# EXPORT_CHUNK_SIZE и сразу пишутся в ответ, поэтому память не зависит от
+# числа веществ.
+
+EXPORT_CHUNK_SIZE = 2000
+EXPORT_FORMATS = ('xlsx', 'csv')
+EXPORT_CONTENT_TYPES = {
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    'csv': 'text/csv; charset=utf-8',
+}
+YES_NO = {True: "Да", False: "Нет"}
+
+
+class ExportColumn:
+    """Колонка экспорта: путь для values_list и перевод значения в вид шаблона."""
+    def __init__(self, hex_color, model, header, field, relations):
+        self.hex_color = hex_color
+        self.header = header
+        self.lookup = field if model is ChemicalElement else f"{relations[model]}__{field}"
+
+        field_obj = get_field_info(model, field)
+        self.is_boolean = bool(field_obj) and field_obj.get_internal_type() == 'BooleanField'
+        # Ключ -> подпись ("LIQUID" -> "Жидкость"): импорт понимает подписи
+        self.labels = {k: str(label) for k, label in field_obj.choices} if field_obj and field_obj.choices else {}
+
+    def to_cell(self, value):
+        if value is None:
+            return ""
+        if self.is_boolean:
+            return YES_NO[bool(value)]
+        if self.labels:
+            return self.labels.get(value, value)
+        return value
+
+
+def get_export_columns(config_obj):
+    relations = get_section_relations()
+    return [
+        ExportColumn(hex_color, model, header, field, relations)
+        for hex_color, model, header, field in template_columns(config_obj, all_fields=True)
+    ]
+
+
+def iter_export_rows(queryset, columns, chunk_size=EXPORT_CHUNK_SIZE, on_progress=None):
+    """Строки значений (уже в виде шаблона) без создания объектов моделей."""
+    rows = queryset.values_list(*[col.lookup for col in columns]).iterator(chunk_size=chunk_size)
+    done = 0
+    with fuzzy_thresholds(queryset):
+        for values in rows:
+            yield [col.to_cell(v) for col, v in zip(columns, values)]
+            done += 1
+            # Прогресс фоновой выгрузки - раз в кусок, а не на каждую строку
+            if on_progress and done % chunk_size == 0:
+                on_progress(done)
+
+
+class Echo:
+    """Псевдо-файл для csv.writer: writerow возвращает строку, а не копит ее в памяти."""
+    def write(self, value):
+        return value
+
+
+def stream_csv(queryset, columns):
+    writer = csv.writer(Echo(), delimiter=';')
+    # BOM: Excel сразу открывает файл в UTF-8
+    yield '\ufeff' + writer.writerow([col.header for col in columns])
+    for row in iter_export_rows(queryset, columns):
+        yield writer.writerow(row)
+
+
+def write_csv(queryset, columns, file, on_progress=None):
+    """CSV в бинарный файл (фоновый экспорт). utf-8-sig - тот же BOM, что у stream_csv."""
+    text = io.TextIOWrapper(file, encoding='utf-8-sig', newline='')
+    writer = csv.writer(text, delimiter=';')
+    writer.writerow([col.header for col in columns])
+    writer.writerows(iter_export_rows(queryset, columns, on_progress=on_progress))
+    text.flush()
+    # Файл закрывает вызывающий код
+    text.detach()
+
+
+def write_xlsx(queryset, columns, file, on_progress=None):
+    """Книга в write-only режиме: строки сбрасываются на диск, в памяти только текущая."""
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Форма реестра")
+    ws.freeze_panes = "A2"
+    for i in range(len(columns)):
+        ws.column_dimensions[get_column_letter(i + 1)].width = 25
+
+    header = []
+    for col in columns:
+        cell = WriteOnlyCell(ws, value=col.header)
+        style_header_cell(cell, col.hex_color)
+        header.append(cell)
+    ws.append(header)
+
+    for row in iter_export_rows(queryset, columns, on_progress=on_progress):
+        ws.append(row)
+    wb.save(file)
+
+
+def stream_xlsx(queryset, columns, block_size=64 * 1024):
+    # .xlsx - это zip, его нельзя отдавать до конца записи: собираем во временный файл и отдаем блоками
+    with tempfile.TemporaryFile() as tmp:
+        write_xlsx(queryset, columns, tmp)
+        tmp.seek(0)
+        for block in iter(lambda: tmp.read(block_size), b''):
+            yield block
+
+
+def stream_export(queryset, columns, file_format):
+    if file_format == 'csv':
+        return stream_csv(queryset, columns)
+    return stream_xlsx(queryset, columns)
+
+
+def write_export(queryset, columns, file_format, file, on_progress=None):
+    if file_format == 'csv':
+        write_csv(queryset, columns, file, on_progress)
+    else:
+        write_xlsx(queryset, columns, file, on_progress)
+
+
+# =========================================================================
+# ФОНОВЫЙ ЭКСПОРТ: ФАЙЛ В ХРАНИЛИЩЕ + ССЫЛКА НА СКАЧИВАНИЕ
+# =========================================================================
+# Выгрузка всего реестра не укладывается в таймаут прокси, поэтому ее пишет
+# задача Celery в default_storage (MinIO), а клиент скачивает файл по
+# подписанной ссылке напрямую из хранилища, минуя Django.
+
+# Сколько держим "замок" одинаковой выгрузки, если задача не сняла его сама
+EXPORT_JOB_TIMEOUT = 60 * 60
+
+
+def export_job_key(user_id, params, file_format):
+    """Ключ кэша одинаковых запросов: тот же пользователь (видимость!), фильтры и формат."""
+    raw = json.dumps([user_id, sorted(params.items()), file_format], ensure_ascii=False)
+    return "export-job:" + hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+def export_file_name(file_format, day):
+    return f"registry_export_{day:%Y%m%d}.{file_format}"
+
+
+def export_download_url(key, file_name, disposition='attachment'):
+    """
+    Подписанная ссылка на скачивание (живет EXPORT_URL_EXPIRE секунд).
+    Обычные ссылки MinIO у нас публичные (AWS_QUERYSTRING_AUTH = False), поэтому для выгрузок
+    отдельный экземпляр хранилища с подписью и адресом, доступным из браузера.
+    Локальное хранилище (тесты) подписи не умеет - отдаем обычный url.
+    """
+    if not isinstance(default_storage, S3Boto3Storage):
+        return default_storage.url(key)
+
+    storage = S3Boto3Storage(
+        querystring_auth=True,
+        querystring_expire=settings.EXPORT_URL_EXPIRE,
+        custom_domain=None,
+        endpoint_url=settings.AWS_S3_PUBLIC_ENDPOINT_URL,
+        signature_version='s3v4',
+    )
+    return storage.url(key, parameters={
+        'ResponseContentDisposition': f'{disposition}; filename="{file_name}"',
+    })
+
+
+def export_result(key, rows, file_name):
+    """Результат задачи экспорта. url пересчитывается при каждом запросе статуса - подпись истекает."""
+    return {
+        "status": "DONE",
+        "export": True,
+        "rows": rows,
+        "file": key,
+        "file_name": file_name,
+        "url": export_download_url(key, file_name),
+    }
@@ -0,0 +1,123 @@
+import threading
+import weakref
+from contextlib import contextmanager
+from django.db import transaction
+from django.db.models.signals import pre_save, post_save
+from django.utils import timezone
+from simple_history.models import HistoricalRecords
+from simple_history.utils import get_change_reason_from_object
+
+# =========================================================================
+# ОТЛОЖЕННАЯ ЗАПИСЬ ИСТОРИИ ДЛЯ МАССОВЫХ ОПЕРАЦИЙ
+# =========================================================================
+# Обычно simple_history пишет историю отдельным INSERT на каждый save().
+# Внутри deferred_history() версия снимается в момент save() (те же поля,
+# history_user и history_date), но в БД уходит одним bulk_create на таблицу истории.
+
+_state = threading.local()
+
+DEFERRED_HISTORY_BATCH_SIZE = 500
+
+
+class DeferredHistoryWriter:
+    def __init__(self, user=None, batch_size=DEFERRED_HISTORY_BATCH_SIZE):
+        self.user = user
+        self.batch_size = batch_size
+        self.rows = {}       # Историческая модель -> [версии]
+        self.pending = 0
+        # id(instance) -> instance, которым мы выключили запись истории. Слабые ссылки: буфер
+        # не держит сохраненные объекты до конца блока, память бэкфилла ограничена пачкой
+        self.owned = weakref.WeakValueDictionary()
+
+    def history_user(self, instance):
+        """
+        Тот же порядок, что у simple_history: _history_user, затем пользователь запроса.
+        self.user - только запасной вариант (фоновая задача, команда), реального автора он не перекрывает.
+        """
+        user = getattr(instance, '_history_user', None)
+        if user is None:
+            request = getattr(HistoricalRecords.context, 'request', None)
+            if request is not None and request.user.is_authenticated:
+                user = request.user
+        return user or self.user
+
+    def capture(self, instance, created):
+        history_model = getattr(type(instance), instance._meta.simple_history_manager_attribute).model
+        row = history_model(
+            history_date=getattr(instance, '_history_date', None) or timezone.now(),
+            history_user=self.history_user(instance),
+            history_change_reason=get_change_reason_from_object(instance) or "",
+            history_type="+" if created else "~",
+            **{field.attname: getattr(instance, field.attname) for field in history_model.tracked_fields},
+        )
+        if hasattr(history_model, 'history_relation'):
+            row.history_relation_id = instance.pk
+        self.rows.setdefault(history_model, []).append(row)
+        self.pending += 1
+        if self.pending >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        for history_model, rows in self.rows.items():
+            history_model.objects.bulk_create(rows, batch_size=self.batch_size)
+        self.rows, self.pending = {}, 0
+
+    def release(self):
+        # Возвращаем объектам обычную запись истории
+        for instance in list(self.owned.values()):
+            if hasattr(instance, 'skip_history_when_saving'):
+                del instance.skip_history_when_saving
+        self.owned = weakref.WeakValueDictionary()
+
+
+def _active_writer():
+    return getattr(_state, 'writer', None)
+
+
+@contextmanager
+def deferred_history(user=None, batch_size=DEFERRED_HISTORY_BATCH_SIZE):
+    """
+    Массовая запись (модерация, бэкфилл): история пачками вместо INSERT на каждый save().
+    Все внутри одной транзакции - данные и их история коммитятся вместе.
+    user - history_user по умолчанию (если у объекта нет _history_user и нет запроса).
+    Вложенные вызовы используют внешний буфер.
+    """
+    if _active_writer() is not None:
+        yield _active_writer()
+        return
+
+    writer = DeferredHistoryWriter(user=user, batch_size=batch_size)
+    _state.writer = writer
+    try:
+        with transaction.atomic():
+            yield writer
+            writer.flush()
+    finally:
+        _state.writer = None
+        writer.release()
+
+
+def _is_historical(sender):
+    return hasattr(sender._meta, 'simple_history_manager_attribute')
+
+
+def _defer_history(sender, instance, raw=False, **kwargs):
+    writer = _active_writer()
+    if writer is None or raw or not _is_historical(sender):
+        return
+    # Объект, сохраняемый без истории намеренно (save_without_historical_record), не трогаем
+    if hasattr(instance, 'skip_history_when_saving') and id(instance) not in writer.owned:
+        return
+    instance.skip_history_when_saving = True
+    writer.owned[id(instance)] = instance
+
+
+def _capture_history(sender, instance, created, raw=False, **kwargs):
+    writer = _active_writer()
+    if writer is None or raw or id(instance) not in writer.owned:
+        return
+    writer.capture(instance, created)
+
+
+pre_save.connect(_defer_history, dispatch_uid='registry_deferred_history_pre_save')
+post_save.connect(_capture_history, dispatch_uid='registry_deferred_history_post_save')
@@ -0,0 +1,61 @@
+import statistics
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.template.loader import get_template, render_to_string
+from weasyprint import HTML
+
+from registry.models import ChemicalElement
+from registry.passports import PASSPORT_STYLESHEET, PASSPORT_TEMPLATE, PassportRenderer
+from registry.services import get_section_relations
+
+
+class Command(BaseCommand):
+    help = (
+        "Замер времени рендера PDF-паспорта: холодный WeasyPrint на каждый паспорт (как раньше: стили "
+        "в шаблоне, шрифты заново) против прогретого PassportRenderer."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--element', type=int, help="id вещества (по умолчанию - первое опубликованное)")
+        parser.add_argument('--runs', type=int, default=10, help="Сколько паспортов рендерить в каждом режиме")
+        parser.add_argument('--base-url', default='http://localhost:8000/')
+
+    def handle(self, *args, **options):
+        elements = ChemicalElement.objects.select_related(*get_section_relations().values())
+        if options['element']:
+            element = elements.filter(pk=options['element']).first()
+        else:
+            element = elements.filter(status=ChemicalElement.Status.PUBLISHED).first() or elements.first()
+        if element is None:
+            raise CommandError("Нет веществ для паспорта")
+
+        base_url, runs = options['base_url'], options['runs']
+        stylesheet = get_template(PASSPORT_STYLESHEET).template.source
+
+        def cold():
+            html = render_to_string(PASSPORT_TEMPLATE, {'element': element})
+            html = html.replace('</head>', f'<style>{stylesheet}</style></head>', 1)
+            return HTML(string=html, base_url=base_url).write_pdf()
+
+        renderer = PassportRenderer()
+
+        def warm():
+            return renderer.render(element, base_url)
+
+        self.stdout.write(f"Вещество #{element.pk} '{element.primary_name_ru}', {runs} рендеров на режим")
+        results = {}
+        for label, render in (("Холодный", cold), ("Прогретый", warm)):
+            render()  # Первый вызов - импорт модулей и кэши Python, в замер не идет
+            timings = []
+            for _ in range(runs):
+                started = time.perf_counter()
+                render()
+                timings.append((time.perf_counter() - started) * 1000)
+            results[label] = statistics.median(timings)
+            self.stdout.write(
+                f"{label}: медиана {results[label]:.0f} мс, среднее {statistics.mean(timings):.0f} мс, "
+                f"макс {max(timings):.0f} мс"
+            )
+
+        speedup = results["Холодный"] / results["Прогретый"] if results["Прогретый"] else 0
+        self.stdout.write(self.style.SUCCESS(f"Ускорение: x{speedup:.1f}"))
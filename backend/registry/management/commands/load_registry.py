@@ -0,0 +1,49 @@
+import time
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from registry.bulk_load import RegistryLoader
+from registry.models import ChemicalElement
+
+
+class Command(BaseCommand):
+    help = (
+        "Первичная загрузка реестра из CSV/Excel/JSONL/Parquet через COPY "
+        "(staging-таблица, проверка SQL-запросами, вставка INSERT ... SELECT с историей)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Файл в формате шаблона импорта (.xlsx, .csv, .jsonl, .parquet)")
+        parser.add_argument('--user', required=True, help="Логин автора записей (он же history_user)")
+        parser.add_argument(
+            '--status', default=ChemicalElement.Status.DRAFT,
+            choices=ChemicalElement.Status.values, help="Статус загруженных веществ"
+        )
+        parser.add_argument('--dry-run', action='store_true', help="Проверить и откатить транзакцию")
+        parser.add_argument('--show-errors', type=int, default=50, help="Сколько ошибок вывести")
+
+    def handle(self, *args, **options):
+        User = get_user_model()
+        try:
+            user = User.objects.get(username=options['user'])
+        except User.DoesNotExist:
+            raise CommandError(f"Пользователь '{options['user']}' не найден")
+
+        started = time.time()
+        loader = RegistryLoader(user, status=options['status'])
+        try:
+            with open(options['path'], 'rb') as f:
+                report = loader.load(f, options['path'], dry_run=options['dry_run'])
+        except (OSError, ValueError) as e:
+            raise CommandError(str(e))
+
+        for message in report['errors'][:options['show_errors']]:
+            self.stderr.write(message)
+        if len(report['errors']) > options['show_errors']:
+            self.stderr.write(f"... и еще {len(report['errors']) - options['show_errors']} ошибок")
+
+        verb = "Проверено (без записи)" if options['dry_run'] else "Загружено"
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb}: {report['loaded']} из {report['rows']} строк, ошибок: {len(report['errors'])} "
+            f"за {time.time() - started:.1f} сек."
+        ))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from registry.tasks import rebuild_autocomplete_task
+
+
+class Command(BaseCommand):
+    help = "Пересборка индекса автодополнения (Redis) по опубликованным веществам, например после развертывания."
+
+    def handle(self, *args, **options):
+        report = rebuild_autocomplete_task()
+        self.stdout.write(self.style.SUCCESS(f"В индексе веществ: {report['rows']}"))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from registry.tasks import rebuild_search_index_task
+
+
+class Command(BaseCommand):
+    help = "Пересчет поисковых документов (search_vector) всех веществ, например после обновления."
+
+    def handle(self, *args, **options):
+        report = rebuild_search_index_task()
+        self.stdout.write(self.style.SUCCESS(f"Пересчитано веществ: {report['rows']}"))
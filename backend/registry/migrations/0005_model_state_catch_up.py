@@ -0,0 +1,52 @@
+# Generated by Django 4.2.30 on 2026-10-18 10:04
+
+import django.contrib.postgres.indexes
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # Изменения моделей, которые раньше не попали в миграции (структура, фильтры, индексы списка)
+
+    dependencies = [
+        ('registry', '0004_registryconfig_public_list_fields'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='historicalsec1identification',
+            name='structure_image',
+            field=models.TextField(blank=True, max_length=100, null=True, verbose_name='Иллюстрация структуры'),
+        ),
+        migrations.AddField(
+            model_name='registryconfig',
+            name='filter_fields',
+            field=models.JSONField(blank=True, default=list, verbose_name='Поля для Фильтров (Сайдбар)'),
+        ),
+        migrations.AddField(
+            model_name='sec1identification',
+            name='structure_image',
+            field=models.ImageField(blank=True, null=True, upload_to='structures/', verbose_name='Иллюстрация структуры'),
+        ),
+        migrations.AlterField(
+            model_name='chemicalelement',
+            name='primary_name_ru',
+            field=models.CharField(max_length=500, verbose_name='Название вещества (RU)'),
+        ),
+        migrations.AlterField(
+            model_name='historicalchemicalelement',
+            name='primary_name_ru',
+            field=models.CharField(max_length=500, verbose_name='Название вещества (RU)'),
+        ),
+        migrations.AddIndex(
+            model_name='chemicalelement',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['primary_name_ru'], name='chem_name_gin_idx', opclasses=['gin_trgm_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='chemicalelement',
+            index=models.Index(fields=['status'], name='registry_ch_status_795b8c_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='chemicalelement',
+            index=models.Index(fields=['created_by'], name='registry_ch_created_09a97a_idx'),
+        ),
+    ]
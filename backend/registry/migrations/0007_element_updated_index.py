@@ -0,0 +1,17 @@
+# Generated by Django 4.2.30 on 2026-10-18 10:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('registry', '0006_import_job'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='chemicalelement',
+            index=models.Index(fields=['updated_at', 'id'], name='chem_updated_id_idx'),
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 4.2.30 on 2026-10-18 10:29
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations
+from django.db.models import OuterRef, Subquery
+
+
+def fill_search_vectors(apps, schema_editor):
+    # Постоянная часть документа (как registry.search.SEARCH_DOCUMENT_FIELDS). Поля публичной
+    # таблицы из настроек добавит первый пересчет: manage.py rebuild_search_index
+    from django.contrib.postgres.search import SearchVector
+
+    ChemicalElement = apps.get_model('registry', 'ChemicalElement')
+    vector = (
+        SearchVector('primary_name_ru', weight='A', config='russian')
+        + SearchVector('sec1_identification__synonyms', weight='B', config='russian')
+        + SearchVector('sec1_identification__iupac_name_ru', weight='B', config='russian')
+        + SearchVector('sec1_identification__iupac_name_en', weight='B', config='russian')
+        + SearchVector('sec1_identification__molecular_formula', weight='C', config='simple')
+        + SearchVector('sec1_identification__ec_number', weight='C', config='simple')
+        + SearchVector('cas_number', weight='C', config='simple')
+    )
+    document = ChemicalElement.objects.filter(pk=OuterRef('pk')).annotate(document=vector).values('document')[:1]
+    ChemicalElement.objects.update(search_vector=Subquery(document))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('registry', '0007_element_updated_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chemicalelement',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='chemicalelement',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='chem_search_vector_idx'),
+        ),
+        migrations.RunPython(fill_search_vectors, migrations.RunPython.noop),
+    ]
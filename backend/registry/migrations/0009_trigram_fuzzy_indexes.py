@@ -0,0 +1,22 @@
+# Generated by Django 4.2.30 on 2026-10-18 10:32
+
+import django.contrib.postgres.indexes
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('registry', '0008_element_search_vector'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='chemicalelement',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['cas_number'], name='chem_cas_trgm_idx', opclasses=['gin_trgm_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='sec1identification',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['synonyms'], name='sec1_synonyms_trgm_idx', opclasses=['gin_trgm_ops']),
+        ),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 4.2.30 on 2026-10-18 10:38
+
+from django.db import migrations, models
+
+
+def cas_groups(ChemicalElement):
+    """{цифры CAS: [вещества]} для номеров с верной контрольной цифрой (нормализатор - как у модели)."""
+    from registry.cas import normalize_cas
+
+    groups = {}
+    for element in ChemicalElement.objects.exclude(cas_number=None).order_by('id').only('id', 'cas_number'):
+        digits = normalize_cas(element.cas_number)
+        if digits:
+            groups.setdefault(digits, []).append(element)
+    return groups
+
+
+def check_cas_duplicates(apps, schema_editor):
+    # Один номер в разной записи ("50000" и "50-00-0") у нескольких веществ: после миграции
+    # такие вещества нельзя было бы сохранить (уникальный cas_normalized). Их нужно объединить
+    # или исправить до миграции - останавливаемся и перечисляем их
+    ChemicalElement = apps.get_model('registry', 'ChemicalElement')
+    duplicates = [elements for elements in cas_groups(ChemicalElement).values() if len(elements) > 1]
+    if duplicates:
+        lines = [", ".join(f"#{e.id} '{e.cas_number}'" for e in elements) for elements in duplicates]
+        raise RuntimeError(
+            "Один номер CAS записан у нескольких веществ - объедините или исправьте их и повторите миграцию:\n"
+            + "\n".join(lines)
+        )
+
+
+def fill_cas_normalized(apps, schema_editor):
+    from registry.cas import format_cas
+
+    ChemicalElement = apps.get_model('registry', 'ChemicalElement')
+    elements = []
+    for digits, (element,) in cas_groups(ChemicalElement).items():
+        element.cas_number, element.cas_normalized = format_cas(digits), digits
+        elements.append(element)
+    ChemicalElement.objects.bulk_update(elements, ['cas_number', 'cas_normalized'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('registry', '0009_trigram_fuzzy_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(check_cas_duplicates, migrations.RunPython.noop),
+        migrations.AddField(
+            model_name='chemicalelement',
+            name='cas_normalized',
+            field=models.CharField(editable=False, max_length=10, null=True, unique=True, verbose_name='CAS (цифры)'),
+        ),
+        migrations.AddIndex(
+            model_name='chemicalelement',
+            index=models.Index(fields=['cas_normalized'], name='chem_cas_prefix_idx', opclasses=['varchar_pattern_ops']),
+        ),
+        migrations.RunPython(fill_cas_normalized, migrations.RunPython.noop),
+    ]
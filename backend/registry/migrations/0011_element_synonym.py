@@ -0,0 +1,53 @@
+# Generated by Django 4.2.30 on 2026-10-18 10:40
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_synonyms(apps, schema_editor):
+    # Те же разбор и ключи, что у registry.synonyms.sync_synonyms
+    from registry.synonyms import normalize_term, split_synonyms
+
+    Sec1Identification = apps.get_model('registry', 'Sec1Identification')
+    ElementSynonym = apps.get_model('registry', 'ElementSynonym')
+    rows = []
+    for element_id, synonyms in Sec1Identification.objects.exclude(synonyms='').values_list('element_id', 'synonyms').iterator():
+        keys = set()
+        for name in split_synonyms(synonyms):
+            key = normalize_term(name)
+            if key not in keys:
+                keys.add(key)
+                rows.append(ElementSynonym(element_id=element_id, name=name, key=key))
+        if len(rows) >= 5000:
+            ElementSynonym.objects.bulk_create(rows)
+            rows = []
+    ElementSynonym.objects.bulk_create(rows)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('registry', '0010_element_cas_normalized'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ElementSynonym',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.TextField(verbose_name='Синоним')),
+                ('key', models.TextField(verbose_name='Ключ поиска')),
+                ('element', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='synonym_index', to='registry.chemicalelement')),
+            ],
+            options={
+                'verbose_name': 'Синоним (поиск)',
+                'verbose_name_plural': 'Синонимы (поиск)',
+                'indexes': [models.Index(fields=['key'], name='synonym_key_idx', opclasses=['text_pattern_ops'])],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='elementsynonym',
+            constraint=models.UniqueConstraint(fields=('element', 'key'), name='synonym_element_key_uniq'),
+        ),
+        migrations.RunPython(fill_synonyms, migrations.RunPython.noop),
+    ]
@@ -1,6 +1,7 @@
 from .common import *
 from .core import ChemicalElement, ElementAttachment
-from .identification import Sec1Identification
+from .imports import ImportJob
+from .identification import Sec1Identification, ElementSynonym
 from .physical import Sec2Physical
 from .properties import (
     Sec3ToxSanPin, Sec4ToxAir, Sec5ToxAcute, Sec6ToxRisks,
@@ -1,9 +1,12 @@
 from django.conf import settings
 from simple_history.models import HistoricalRecords
+from django.core.exceptions import ValidationError
 from django.db import models
 # ВАЖНО: Импорт GinIndex для ускорения текстового поиска
 from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from .common import ConfigValidationMixin
+from registry.cas import canonical_cas, normalize_cas
 
 
 class ChemicalElement(ConfigValidationMixin, models.Model):
@@ -21,12 +24,40 @@ class ChemicalElement(ConfigValidationMixin, models.Model):
     # Основные поисковые поля
     cas_number = models.CharField(max_length=50, unique=True, null=True, blank=True, verbose_name="Номер CAS", db_index=True)
     primary_name_ru = models.CharField(max_length=500, verbose_name="Название вещества (RU)")
+    # Цифры CAS без дефисов ("50000"), только для номеров с верной контрольной цифрой (registry.cas).
+    # Точный и префиксный поиск по CAS, дубли "50-00-0"/"50000" ловит уникальность
+    cas_normalized = models.CharField(max_length=10, unique=True, null=True, editable=False, verbose_name="CAS (цифры)")
 
-    history = HistoricalRecords()
+    # Поисковый документ (название, синонимы, IUPAC, формула, номера + поля публичной таблицы).
+    # Заполняется registry.search.update_search_vectors, в форму и историю не попадает
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    history = HistoricalRecords(excluded_fields=['search_vector', 'cas_normalized'])
 
     def __str__(self):
         return f"{self.primary_name_ru} (CAS: {self.cas_number})"
 
+    def sync_cas(self):
+        """Каноническая запись CAS и его цифры. Вызывает save(); bulk-пути (импорт) - сами."""
+        self.cas_number = canonical_cas(self.cas_number)
+        self.cas_normalized = normalize_cas(self.cas_number)
+
+    def clean(self):
+        super().clean()
+        # "50000" и "50-00-0" - один номер: уникальность cas_number этого не видит, проверяем по цифрам
+        self.sync_cas()
+        if self.cas_normalized and ChemicalElement.objects.filter(
+            cas_normalized=self.cas_normalized
+        ).exclude(pk=self.pk).exists():
+            raise ValidationError({'cas_number': f"Вещество с CAS {self.cas_number} уже есть в реестре."})
+
+    def save(self, *args, **kwargs):
+        self.sync_cas()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'cas_number' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'cas_normalized'}
+        super().save(*args, **kwargs)
+
     class Meta:
         verbose_name = "Химическое вещество"
         verbose_name_plural = "Химические вещества"
@@ -45,6 +76,14 @@ class ChemicalElement(ConfigValidationMixin, models.Model):
             models.Index(fields=['status']),
             # 3. Индекс для автора (фильтрация в кабинете)
             models.Index(fields=['created_by']),
+            # 4. Курсор ленты изменений (updated_at, id)
+            models.Index(fields=['updated_at', 'id'], name='chem_updated_id_idx'),
+            # 5. Полнотекстовый поиск (tsvector)
+            GinIndex(name='chem_search_vector_idx', fields=['search_vector']),
+            # 6. Нечеткий поиск по CAS с опечатками (оператор % из pg_trgm)
+            GinIndex(name='chem_cas_trgm_idx', fields=['cas_number'], opclasses=['gin_trgm_ops']),
+            # 7. CAS по началу номера (LIKE 'цифры%'): B-tree с varchar_pattern_ops
+            models.Index(name='chem_cas_prefix_idx', fields=['cas_normalized'], opclasses=['varchar_pattern_ops']),
         ]
 
 
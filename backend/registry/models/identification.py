@@ -1,5 +1,6 @@
 from .core import ChemicalElement
 from django.db import models
+from django.contrib.postgres.indexes import GinIndex
 from simple_history.models import HistoricalRecords
 from .common import ConfigValidationMixin
 
@@ -17,4 +18,24 @@ class Sec1Identification(ConfigValidationMixin, models.Model):
     rtecs_link = models.CharField(max_length=255, blank=True, verbose_name="RTECS")
     history = HistoricalRecords()
 
-    class Meta: verbose_name = "I. Идентификация"
\ No newline at end of file
+    class Meta:
+        verbose_name = "I. Идентификация"
+        # Триграммный индекс для нечеткого поиска по синонимам (registry.search)
+        indexes = [GinIndex(name='sec1_synonyms_trgm_idx', fields=['synonyms'], opclasses=['gin_trgm_ops'])]
+
+class ElementSynonym(models.Model):
+    """
+    Синонимы из Sec1Identification.synonyms по одному в строке, с ключом для поиска
+    (регистр, ё/е и пробелы не важны). Производная таблица: ее заполняет
+    registry.synonyms.sync_synonyms при сохранении секции и импорте, руками не правится.
+    """
+    element = models.ForeignKey(ChemicalElement, on_delete=models.CASCADE, related_name='synonym_index')
+    name = models.TextField(verbose_name="Синоним")
+    key = models.TextField(verbose_name="Ключ поиска")
+
+    class Meta:
+        verbose_name = "Синоним (поиск)"
+        verbose_name_plural = "Синонимы (поиск)"
+        constraints = [models.UniqueConstraint(fields=['element', 'key'], name='synonym_element_key_uniq')]
+        # text_pattern_ops: и точное совпадение, и LIKE 'начало%'
+        indexes = [models.Index(name='synonym_key_idx', fields=['key'], opclasses=['text_pattern_ops'])]
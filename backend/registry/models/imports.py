@@ -0,0 +1,92 @@
+from datetime import timedelta
+from django.conf import settings
+from django.db import models
+from django.db.models import Max
+from django.utils import timezone
+
+
+class ImportJob(models.Model):
+    """
+    Задача импорта, которая переживает перезапуск воркера.
+
+    Хранит хэш файла (повторная загрузка того же файла не запускает импорт заново),
+    контрольную точку - номер последней строки, закоммиченной вместе со своей пачкой,
+    и накопленный отчет (счетчики + ошибки).
+    Большой файл режется на части: каждая часть - дочерняя задача (parent -> shards)
+    со своей контрольной точкой, чтобы параллельные воркеры не спорили за одну строку в БД.
+    """
+    class Status(models.TextChoices):
+        PENDING = 'PENDING', 'В очереди'
+        RUNNING = 'RUNNING', 'Выполняется'
+        DONE = 'DONE', 'Завершен'
+        FAILED = 'FAILED', 'Ошибка'
+
+    created_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='import_jobs', verbose_name="Автор")
+    parent = models.ForeignKey('self', on_delete=models.CASCADE, null=True, blank=True, related_name='shards', verbose_name="Основная задача")
+
+    file_name = models.CharField(max_length=255, blank=True, verbose_name="Имя файла")
+    file_key = models.CharField(max_length=500, verbose_name="Ключ файла в хранилище")
+    file_hash = models.CharField(max_length=64, blank=True, db_index=True, verbose_name="SHA-256 файла")
+    mode = models.CharField(max_length=10, default='create', verbose_name="Режим импорта")
+
+    status = models.CharField(max_length=10, choices=Status.choices, default=Status.PENDING, verbose_name="Статус")
+    task_id = models.CharField(max_length=255, blank=True, db_index=True, verbose_name="ID задачи Celery")
+
+    total_rows = models.PositiveIntegerField(null=True, blank=True, verbose_name="Всего строк")
+    processed_rows = models.PositiveIntegerField(default=0, verbose_name="Обработано строк")
+    committed_row = models.PositiveIntegerField(default=0, verbose_name="Последняя закоммиченная строка")
+    counters = models.JSONField(default=dict, blank=True, verbose_name="Счетчики отчета")
+    errors = models.JSONField(default=list, blank=True, verbose_name="Ошибки")
+
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Создан")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Обновлен")
+
+    def __str__(self):
+        return f"Импорт #{self.pk} {self.file_name} ({self.get_status_display()})"
+
+    def report(self):
+        """Отчет в формате services.import_rows."""
+        return {"success": 0, **self.counters, "errors": list(self.errors)}
+
+    def record_chunk(self, last_row, rows_read, chunk_report):
+        """
+        Контрольная точка пачки. Вызывается внутри транзакции пачки,
+        поэтому данные и чекпоинт коммитятся (или откатываются) вместе.
+        """
+        self.committed_row = last_row
+        self.processed_rows += rows_read
+        for key, value in chunk_report.items():
+            if key == "errors":
+                self.errors.extend(value)
+            else:
+                self.counters[key] = self.counters.get(key, 0) + value
+        self.save(update_fields=['committed_row', 'processed_rows', 'counters', 'errors', 'updated_at'])
+
+    # Задача без движения дольше этого считается потерянной (воркер умер без повторной доставки)
+    STALE_AFTER = timedelta(minutes=30)
+
+    def is_stalled(self):
+        """Можно ли перезапустить задачу: упала или давно не пишет контрольные точки."""
+        if self.status == self.Status.FAILED:
+            return True
+        if self.status == self.Status.DONE:
+            return False
+        last = self.shards.aggregate(last=Max('updated_at'))['last'] or self.updated_at
+        return timezone.now() - max(last, self.updated_at) > self.STALE_AFTER
+
+    def set_status(self, status, error=None):
+        self.status = status
+        fields = ['status', 'updated_at']
+        if error:
+            self.errors.append(error)
+            fields.append('errors')
+        self.save(update_fields=fields)
+
+    class Meta:
+        verbose_name = "Задача импорта"
+        verbose_name_plural = "Задачи импорта"
+        ordering = ['-created_at']
+        indexes = [
+            # Поиск повторной загрузки того же файла
+            models.Index(fields=['created_by', 'file_hash']),
+        ]
@@ -0,0 +1,141 @@
+import hashlib
+import mimetypes
+from functools import lru_cache, partial
+from urllib.parse import urljoin
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.template.loader import get_template, render_to_string
+from weasyprint import CSS, HTML, default_url_fetcher
+from weasyprint.text.fonts import FontConfiguration
+
+from registry.models import ChemicalElement
+from .services import get_section_relations
+
+# =========================================================================
+# PDF-ПАСПОРТА: РЕНДЕР И ХРАНЕНИЕ ГОТОВЫХ ФАЙЛОВ
+# =========================================================================
+# WeasyPrint - секунды CPU на паспорт, поэтому готовый PDF хранится в
+# default_storage под ключом passports/<id>/<версия данных>-<хэш шаблона>.pdf.
+# Версия данных - updated_at вещества: его двигает сохранение самого вещества
+# и любой его секции (signals.touch_element). Новая версия = новый ключ, а
+# прежний файл удаляется при сохранении (invalidate_passports).
+
+PASSPORT_TEMPLATE = 'registry/passport_pdf.html'
+PASSPORT_STYLESHEET = 'registry/passport_pdf.css'
+# Сколько держим отметку о рендере, если задача не сняла ее сама (воркер упал)
+PASSPORT_RENDER_TIMEOUT = 10 * 60
+
+
+@lru_cache(maxsize=1)
+def passport_template_hash():
+    """Хэш исходников шаблона и стилей: после выкладки новых все паспорта пересобираются."""
+    source = "".join(get_template(name).template.source for name in (PASSPORT_TEMPLATE, PASSPORT_STYLESHEET))
+    return hashlib.sha256(source.encode('utf-8')).hexdigest()[:12]
+
+
+def passport_key(element_id, updated_at):
+    return f"passports/{element_id}/{updated_at:%Y%m%d%H%M%S%f}-{passport_template_hash()}.pdf"
+
+
+def passport_pointer(element_id):
+    """Ключ кэша: какой файл паспорта сейчас лежит в хранилище (чтобы удалить его при правке)."""
+    return f"passport-file:{element_id}"
+
+
+class PassportRenderer:
+    """
+    "Прогретый" WeasyPrint на процесс воркера: стили паспорта разобраны один раз, FontConfiguration
+    (поиск и загрузка шрифтов) общая, а картинки и файлы из media/static читаются из хранилища
+    и с диска, а не HTTP-запросами к нашему же серверу.
+    """
+    def __init__(self):
+        self.font_config = FontConfiguration()
+        self.stylesheet = CSS(
+            string=get_template(PASSPORT_STYLESHEET).template.source, font_config=self.font_config
+        )
+
+    def fetch(self, base_url, url):
+        """url_fetcher для WeasyPrint: media - из default_storage, static - через finders, иначе как обычно."""
+        for prefix in {settings.MEDIA_URL, urljoin(base_url, settings.MEDIA_URL)}:
+            if url.startswith(prefix):
+                name = url[len(prefix):]
+                with default_storage.open(name, 'rb') as f:
+                    return {'string': f.read(), 'mime_type': mimetypes.guess_type(name)[0], 'redirected_url': url}
+
+        static_prefix = urljoin(base_url, settings.STATIC_URL)
+        if url.startswith(static_prefix):
+            path = finders.find(url[len(static_prefix):])
+            if path:
+                with open(path, 'rb') as f:
+                    return {'string': f.read(), 'mime_type': mimetypes.guess_type(path)[0], 'redirected_url': url}
+
+        return default_url_fetcher(url)
+
+    def render(self, element, base_url):
+        html = render_to_string(PASSPORT_TEMPLATE, {'element': element})
+        # base_url - для относительных ссылок на картинки/шрифты (их разрешает fetch)
+        document = HTML(string=html, base_url=base_url, url_fetcher=partial(self.fetch, base_url))
+        return document.write_pdf(stylesheets=[self.stylesheet], font_config=self.font_config)
+
+
+@lru_cache(maxsize=1)
+def get_renderer():
+    """Один рендерер на процесс: создается при первом паспорте и живет, пока жив воркер."""
+    return PassportRenderer()
+
+
+def render_passport(element, base_url):
+    return get_renderer().render(element, base_url)
+
+
+def current_passport_key(element_id):
+    """Ключ паспорта для текущей версии данных (ChemicalElement.DoesNotExist, если вещества нет)."""
+    updated_at = ChemicalElement.objects.values_list('updated_at', flat=True).get(pk=element_id)
+    return passport_key(element_id, updated_at)
+
+
+def passport_keys(element_ids):
+    """{id: ключ паспорта текущей версии} одним запросом; несуществующие id пропускаются."""
+    rows = ChemicalElement.objects.filter(pk__in=element_ids).values_list('id', 'updated_at')
+    return {pk: passport_key(pk, updated_at) for pk, updated_at in rows}
+
+
+def get_passport(element_id, base_url):
+    """Ключ готового PDF в хранилище: берется существующий или рендерится и сохраняется."""
+    key = current_passport_key(element_id)
+    if default_storage.exists(key):
+        return key
+
+    # Для PDF нужно подгрузить все данные
+    element = ChemicalElement.objects.select_related(*get_section_relations().values()).get(pk=element_id)
+    key = default_storage.save(passport_key(element.pk, element.updated_at), ContentFile(render_passport(element, base_url)))
+    # Файл прежней версии (другие данные или старый шаблон) больше не нужен
+    previous = cache.get(passport_pointer(element_id))
+    cache.set(passport_pointer(element_id), key, None)
+    if previous and previous != key:
+        default_storage.delete(previous)
+    return key
+
+
+def passport_render_lock(key):
+    """Ключ кэша "этот паспорт уже рендерится" (значение - id задачи)."""
+    return f"passport-render:{key}"
+
+
+def invalidate_passports(element_ids):
+    """
+    Удаляет сохраненные паспорта веществ, если они не соответствуют текущей версии
+    (свежий паспорт мог быть уже пересобран - например, сразу после публикации).
+    """
+    pointers = cache.get_many([passport_pointer(pk) for pk in element_ids])
+    if not pointers:
+        return
+    current = set(passport_keys(element_ids).values())
+    stale = {pointer: key for pointer, key in pointers.items() if key not in current}
+    if stale:
+        cache.delete_many(list(stale))
+        for key in stale.values():
+            default_storage.delete(key)
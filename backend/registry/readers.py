@@ -0,0 +1,269 @@
+import csv
+import io
+import json
+import os
+import re
+from openpyxl import load_workbook
+
+
+# =========================================================================
+# ПОТОКОВОЕ ЧТЕНИЕ ФАЙЛОВ ИМПОРТА
+# =========================================================================
+# Файл не загружается в память целиком: строки отдаются генератором,
+# поэтому расход памяти воркера не зависит от размера книги.
+# Все читатели одинаковые снаружи: columns (заголовки), итерация по
+# (номер строки, [значения-строки]) и row_count (None, если заранее неизвестно).
+
+def clean_header(value):
+    """Нормализует заголовок колонки: пробелы, звездочка обязательности."""
+    # 1. В строку
+    c = str(value if value is not None else "").strip()
+    # 2. Убираем звездочку в конце (индикатор обязательности)
+    if c.endswith("*"):
+        c = c.replace("*", "").strip()
+    # 3. Нормализуем пробелы (два пробела -> один)
+    return re.sub(r'\s+', ' ', c)
+
+
+def cell_to_str(value):
+    """Значение ячейки -> строка (пустая для None), как в старом импорте через pandas."""
+    if value is None:
+        return ""
+    if isinstance(value, float) and value != value:  # NaN из Parquet/JSON
+        return ""
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value).strip()
+
+
+class ExcelRowReader:
+    """
+    Читает первый лист .xlsx в режиме read_only (openpyxl).
+
+    columns - очищенные заголовки первой строки.
+    Итерация отдает (номер строки в Excel, [значения-строки]) без хранения всего листа.
+    """
+    def __init__(self, file):
+        self.workbook = load_workbook(file, read_only=True, data_only=True)
+        self.sheet = self.workbook.worksheets[0]
+        self._rows = self.sheet.iter_rows(values_only=True)
+        header = next(self._rows, None) or ()
+        self.columns = [clean_header(h) for h in header]
+
+    def __iter__(self):
+        width = len(self.columns)
+        for row_num, values in enumerate(self._rows, start=2):
+            values = [cell_to_str(v) for v in values[:width]]
+            if len(values) < width:
+                values += [""] * (width - len(values))
+            yield row_num, values
+
+    @property
+    def row_count(self):
+        """Число строк данных по размеру листа (None, если Excel его не записал)."""
+        max_row = self.sheet.max_row
+        return max_row - 1 if max_row else None
+
+    def close(self):
+        self.workbook.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class CsvRowReader:
+    """
+    CSV из ERP/Excel: кодировка (UTF-8 с BOM или cp1251) и разделитель (, ; tab)
+    определяются по началу файла. Номера строк - как в Excel (данные со 2-й).
+    """
+    SAMPLE_SIZE = 64 * 1024
+
+    def __init__(self, file):
+        sample = file.read(self.SAMPLE_SIZE)
+        file.seek(0)
+        encoding = _guess_encoding(sample)
+
+        try:
+            dialect = csv.Sniffer().sniff(sample.decode(encoding, errors='ignore'), delimiters=',;\t')
+        except csv.Error:
+            dialect = csv.excel
+
+        self.text = io.TextIOWrapper(file, encoding=encoding, newline='')
+        self._rows = csv.reader(self.text, dialect)
+        self.columns = [clean_header(h) for h in next(self._rows, [])]
+
+    def __iter__(self):
+        width = len(self.columns)
+        for row_num, values in enumerate(self._rows, start=2):
+            values = [v.strip() for v in values[:width]]
+            if len(values) < width:
+                values += [""] * (width - len(values))
+            yield row_num, values
+
+    row_count = None
+
+    def close(self):
+        # Отцепляем обертку, чтобы она не закрыла файл хранилища раньше времени
+        self.text.detach()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class JsonLinesRowReader:
+    """
+    JSON Lines: один объект {колонка: значение} на строку файла; номер строки - номер строки файла.
+    Выгрузки ERP опускают пустые поля, поэтому набор колонок - объединение ключей всех
+    объектов: файл проходится дважды (ключи и число строк, затем сами строки).
+    """
+    def __init__(self, file):
+        self.file = file
+        keys, self.row_count = {}, 0
+        for line in iter(self.file.readline, b''):
+            if line.strip():
+                keys.update(dict.fromkeys(json.loads(line)))
+                self.row_count += 1
+        self.file.seek(0)
+        self._keys = list(keys)
+        self.columns = [clean_header(k) for k in self._keys]
+
+    def __iter__(self):
+        for row_num, line in enumerate(iter(self.file.readline, b''), start=1):
+            if line.strip():
+                record = json.loads(line)
+                yield row_num, [cell_to_str(record.get(k)) for k in self._keys]
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class ParquetRowReader:
+    """
+    Parquet читается пачками (pyarrow iter_batches): в памяти только текущая пачка.
+    Номер строки - номер записи (с 1). Число строк известно из метаданных.
+    """
+    BATCH_SIZE = 10000
+
+    def __init__(self, file):
+        import pyarrow.parquet as pq  # Опциональная зависимость: нужна только для Parquet
+
+        self.parquet = pq.ParquetFile(file)
+        self.columns = [clean_header(name) for name in self.parquet.schema_arrow.names]
+
+    def __iter__(self):
+        row_num = 1
+        for batch in self.parquet.iter_batches(batch_size=self.BATCH_SIZE):
+            # Конвертируем по столбцам, потом собираем строки
+            columns = [[cell_to_str(v) for v in column.to_pylist()] for column in batch.columns]
+            for values in zip(*columns):
+                yield row_num, list(values)
+                row_num += 1
+
+    @property
+    def row_count(self):
+        return self.parquet.metadata.num_rows
+
+    def close(self):
+        self.parquet.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _guess_encoding(sample):
+    """UTF-8 (с BOM или без), иначе cp1251 - типичная выгрузка из 1С/Excel."""
+    try:
+        sample.decode('utf-8')
+    except UnicodeDecodeError as e:
+        # Многобайтовый символ мог обрезаться на границе выборки
+        if e.start < len(sample) - 3:
+            return 'cp1251'
+    return 'utf-8-sig'
+
+
+# Расширение файла -> читатель
+IMPORT_READERS = {
+    '.xlsx': ExcelRowReader,
+    '.csv': CsvRowReader,
+    '.jsonl': JsonLinesRowReader,
+    '.ndjson': JsonLinesRowReader,
+    '.parquet': ParquetRowReader,
+}
+
+
+def get_reader_class(filename):
+    """Читатель по расширению файла. ValueError для неподдерживаемого формата."""
+    ext = os.path.splitext(filename)[1].lower()
+    if ext not in IMPORT_READERS:
+        supported = ", ".join(IMPORT_READERS)
+        raise ValueError(f"Неподдерживаемый формат файла '{ext}'. Поддерживаются: {supported}")
+    return IMPORT_READERS[ext]
+
+
+def open_import_reader(file, filename):
+    """Открывает читатель строк для файла импорта нужного формата."""
+    return get_reader_class(filename)(file)
+
+
+class ShardRowReader:
+    """
+    Читает шард импорта (JSON Lines): первая строка - заголовки,
+    дальше [номер строки в исходном файле, [значения]].
+    """
+    def __init__(self, file):
+        self.file = file
+        first = file.readline()
+        self.columns = json.loads(first) if first else []
+
+    def __iter__(self):
+        # readline, а не "for line in file": django File.__iter__ перематывает файл в начало
+        for line in iter(self.file.readline, b''):
+            if line.strip():
+                row_num, values = json.loads(line)
+                yield row_num, values
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def write_shards(reader, save_shard, shard_rows):
+    """
+    Режет поток строк reader на шарды по shard_rows строк.
+    save_shard(номер, bytes) сохраняет шард и возвращает его ключ.
+    Возвращает (ключи шардов, всего строк).
+    """
+    header = json.dumps(reader.columns, ensure_ascii=False) + "\n"
+    keys, lines, total = [], [], 0
+
+    for row_num, values in reader:
+        lines.append(json.dumps([row_num, values], ensure_ascii=False) + "\n")
+        total += 1
+        if len(lines) >= shard_rows:
+            keys.append(save_shard(len(keys), (header + "".join(lines)).encode('utf-8')))
+            lines = []
+
+    if lines or not keys:
+        keys.append(save_shard(len(keys), (header + "".join(lines)).encode('utf-8')))
+
+    return keys, total
@@ -0,0 +1,102 @@
+import threading
+from contextlib import contextmanager
+from django.db import transaction
+from django.utils import timezone
+
+from registry.models import ChemicalElement, RegistryConfig, Sec1Identification
+from .autocomplete import sync_elements
+from .passports import invalidate_passports
+from .search import search_section_models, update_search_vectors
+from .synonyms import sync_synonyms
+
+# =========================================================================
+# ОБНОВЛЕНИЕ ВЕЩЕСТВА ПОСЛЕ ПРАВКИ СЕКЦИЙ
+# =========================================================================
+# Правка секции - это правка вещества: updated_at (водяной знак ленты
+# изменений), поисковый документ, синонимы, паспорт и автодополнение.
+# Сохранение самого вещества тоже пересчитывает поисковый документ.
+# Вложенное сохранение (сериализатор, админка) пишет вещество и до двух
+# десятков секций подряд - внутри batched_element_refresh() они копятся и
+# обрабатываются один раз на вещество в конце блока. Вне блока - сразу.
+
+_state = threading.local()
+
+
+class ElementRefresh:
+    def __init__(self):
+        self.sections = {}  # id вещества -> модели сохраненных/удаленных секций
+        self.saved = set()  # id сохраненных веществ (название и CAS - в поисковом документе)
+
+    def add_section(self, element_id, model):
+        self.sections.setdefault(element_id, set()).add(model)
+
+    def flush(self):
+        refresh_elements(self.sections, self.saved)
+        self.sections, self.saved = {}, set()
+
+
+def _active_refresh():
+    return getattr(_state, 'refresh', None)
+
+
+@contextmanager
+def batched_element_refresh():
+    """Одна транзакция, в конце - одно обновление на вещество. Вложенные вызовы используют внешний."""
+    if _active_refresh() is not None:
+        yield _active_refresh()
+        return
+
+    refresh = ElementRefresh()
+    _state.refresh = refresh
+    try:
+        with transaction.atomic():
+            yield refresh
+            refresh.flush()
+    finally:
+        _state.refresh = None
+
+
+def section_changed(element_id, model):
+    refresh = _active_refresh()
+    if refresh is not None:
+        refresh.add_section(element_id, model)
+    else:
+        refresh_elements({element_id: {model}})
+
+
+def element_saved(element_id):
+    refresh = _active_refresh()
+    if refresh is not None:
+        refresh.saved.add(element_id)
+    else:
+        refresh_elements({}, {element_id})
+
+
+def refresh_elements(sections, saved=()):
+    """
+    sections: {id вещества: {модели секций}}, saved - id сохраненных веществ.
+    Настройки читаются один раз на вызов, поисковый документ пересчитывается одним UPDATE.
+    """
+    if not sections and not saved:
+        return
+    ids = list(sections)
+    if ids:
+        # update() без save(): не плодим версию истории и не вызываем сигналы вещества
+        ChemicalElement.objects.filter(pk__in=ids).update(updated_at=timezone.now())
+
+    config_obj = RegistryConfig.objects.first()
+    search_models = search_section_models(config_obj) if sections else set()
+    search_ids = set(saved) | {pk for pk, models in sections.items() if models & search_models}
+    if search_ids:
+        update_search_vectors(list(search_ids), config_obj)
+    if not ids:
+        return
+
+    # Синонимы - строки ElementSynonym и термины автодополнения
+    synonym_ids = [pk for pk, models in sections.items() if Sec1Identification in models]
+    if synonym_ids:
+        sync_synonyms(synonym_ids)
+        transaction.on_commit(lambda: sync_elements(synonym_ids))
+
+    # Сохраненный PDF устарел: удаляем после коммита (до него паспорт могут пересобрать по старым данным)
+    transaction.on_commit(lambda: invalidate_passports(ids))
@@ -0,0 +1,240 @@
+from contextlib import contextmanager
+from django.contrib.postgres.search import (
+    SearchQuery, SearchRank, SearchVector, TrigramSimilarity, TrigramWordSimilarity,
+)
+from django.db import connection, transaction
+from django.db.models import F, OuterRef, Q, Subquery
+from django.db.models.functions import Greatest
+
+from registry.models import ChemicalElement, RegistryConfig, Sec1Identification
+from .cas import cas_query
+from .synonyms import synonym_match
+from .structures import SECTION_MAP
+
+# =========================================================================
+# ВИДИМОСТЬ, ПОИСК И ФИЛЬТРЫ СПИСКА ВЕЩЕСТВ
+# =========================================================================
+# Один источник правды для списка (ChemicalElementViewSet.get_queryset)
+# и фоновых задач (экспорт), которые получают те же параметры запроса.
+
+def field_lookups():
+    """{поле из SECTION_MAP: путь от ChemicalElement}, например {'ph': 'sec2_physical__ph'}."""
+    lookups = {}
+    for _, _, model_cls, fields_list in SECTION_MAP:
+        prefix = ""
+        if model_cls != ChemicalElement:
+            try:
+                prefix = model_cls._meta.get_field('element').remote_field.name + "__"
+            except: continue
+
+        for _, db_field, _ in fields_list:
+            lookups[db_field] = prefix + db_field
+    return lookups
+
+
+# =========================================================================
+# ПОИСКОВЫЙ ДОКУМЕНТ (tsvector + GIN)
+# =========================================================================
+# Вместо icontains по десяткам полей на присоединенных таблицах у каждого
+# вещества хранится готовый search_vector. Его пересчитывает
+# update_search_vectors: сигналы (сохранение вещества и секций), импорт,
+# load_registry и смена настроек (полный пересчет в фоне).
+
+# Конфигурация 'russian' стеммит русские слова, а латиницу - английским стеммером
+SEARCH_CONFIG = 'russian'
+# Номера и формулы - как есть, без стемминга
+CODE_CONFIG = 'simple'
+
+# (путь, вес, конфигурация): A - название, B - синонимы и IUPAC, C - формула и номера
+SEARCH_DOCUMENT_FIELDS = [
+    ('primary_name_ru', 'A', SEARCH_CONFIG),
+    ('sec1_identification__synonyms', 'B', SEARCH_CONFIG),
+    ('sec1_identification__iupac_name_ru', 'B', SEARCH_CONFIG),
+    ('sec1_identification__iupac_name_en', 'B', SEARCH_CONFIG),
+    ('sec1_identification__molecular_formula', 'C', CODE_CONFIG),
+    ('sec1_identification__ec_number', 'C', CODE_CONFIG),
+    ('cas_number', 'C', CODE_CONFIG),
+]
+
+
+def search_document_fields(config_obj):
+    """Поля документа: постоянные + текстовые поля публичной таблицы из настроек (вес D)."""
+    fields = list(SEARCH_DOCUMENT_FIELDS)
+    known = {lookup for lookup, _, _ in fields}
+    lookups = field_lookups()
+    for db_field in (config_obj.public_list_fields if config_obj else []):
+        lookup = lookups.get(db_field)
+        if lookup is None or lookup in known:
+            continue
+        model_cls = next(m for _, _, m, f in SECTION_MAP if any(field == db_field for _, field, _ in f))
+        field_obj = model_cls._meta.get_field(db_field)
+        # Ключи списков ("LIQUID") и флаги в полнотекстовом поиске бесполезны
+        if field_obj.get_internal_type() in ('CharField', 'TextField') and not field_obj.choices:
+            fields.append((lookup, 'D', SEARCH_CONFIG))
+            known.add(lookup)
+    return fields
+
+
+def search_vector_expression(config_obj):
+    vector = None
+    for lookup, weight, config in search_document_fields(config_obj):
+        part = SearchVector(lookup, weight=weight, config=config)
+        vector = part if vector is None else vector + part
+    return vector
+
+
+def update_search_vectors(element_ids=None, config_obj=None):
+    """
+    Пересчитывает search_vector одним UPDATE (значения секций - через подзапрос с JOIN).
+    element_ids - список, queryset или подзапрос id; None - все вещества.
+    update() не трогает updated_at и не пишет историю.
+    """
+    if config_obj is None:
+        config_obj = RegistryConfig.objects.first()
+    document = (
+        ChemicalElement.objects.filter(pk=OuterRef('pk'))
+        .annotate(document=search_vector_expression(config_obj))
+        .values('document')[:1]
+    )
+    elements = ChemicalElement.objects.all()
+    if element_ids is not None:
+        elements = elements.filter(pk__in=element_ids)
+    return elements.update(search_vector=Subquery(document))
+
+
+def search_section_models(config_obj):
+    """Секции, поля которых входят в поисковый документ: их сохранение требует пересчета."""
+    relations = {lookup.split('__')[0] for lookup, _, _ in search_document_fields(config_obj) if '__' in lookup}
+    return {
+        rel.related_model for rel in ChemicalElement._meta.related_objects
+        if rel.one_to_one and rel.get_accessor_name() in relations
+    }
+
+
+def search_query(q):
+    # websearch: кавычки, "or" и минус работают как в поисковиках
+    return SearchQuery(q, config=SEARCH_CONFIG, search_type='websearch') | \
+        SearchQuery(q, config=CODE_CONFIG, search_type='websearch')
+
+
+# =========================================================================
+# НЕЧЕТКИЙ ПОИСК (pg_trgm)
+# =========================================================================
+# Опечатки ("бензолл", "амиак") полнотекстовый поиск не прощает. Если точных
+# совпадений мало, к ним добавляются триграммные: по названию и синонимам -
+# word similarity (оператор %>, имя может быть частью длинной строки),
+# по CAS - similarity (оператор %). Операторы, а не функции в WHERE, чтобы
+# работали GIN-индексы gin_trgm_ops (chem_name_gin_idx, sec1_synonyms_trgm_idx,
+# chem_cas_trgm_idx).
+
+# Меньше стольких точных совпадений - подключаем нечеткие
+SEARCH_FUZZY_MIN_RESULTS = 3
+# Порог сходства для операторов % и %> (по умолчанию в pg_trgm - 0.3 и 0.6)
+SEARCH_FUZZY_THRESHOLD = 0.4
+# Короче - слишком мало триграмм, находится что попало
+SEARCH_FUZZY_MIN_LENGTH = 4
+
+
+def set_fuzzy_threshold():
+    """Пороги операторов % и %> до конца текущей транзакции (SET LOCAL), соединение их не запоминает."""
+    threshold = str(SEARCH_FUZZY_THRESHOLD)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT set_config('pg_trgm.similarity_threshold', %s, true), "
+            "set_config('pg_trgm.word_similarity_threshold', %s, true)",
+            [threshold, threshold],
+        )
+
+
+def is_fuzzy(qs):
+    # similarity аннотирует только нечеткая ветка filter_elements
+    return 'similarity' in qs.query.annotations
+
+
+@contextmanager
+def fuzzy_thresholds(qs):
+    """
+    Queryset из filter_elements выполняется внутри этого блока: у нечеткого поиска
+    запросы (count, страница, выгрузка) идут в одной транзакции с выставленными порогами.
+    """
+    if not is_fuzzy(qs):
+        yield
+        return
+    with transaction.atomic():
+        set_fuzzy_threshold()
+        yield
+
+
+def fuzzy_match(q):
+    synonyms = Sec1Identification.objects.filter(synonyms__trigram_word_similar=q).values('element_id')
+    return Q(primary_name_ru__trigram_word_similar=q) | Q(cas_number__trigram_similar=q) | Q(pk__in=synonyms)
+
+
+def fuzzy_similarity(q):
+    # Coalesce не нужен: GREATEST в Postgres пропускает NULL (нет секции или CAS)
+    return Greatest(
+        TrigramWordSimilarity(q, 'primary_name_ru'),
+        TrigramWordSimilarity(q, 'sec1_identification__synonyms'),
+        TrigramSimilarity('cas_number', q),
+    )
+
+
+def use_fuzzy(qs, exact, q, mode):
+    """mode: '1' - всегда, '0' - никогда, иначе - только если точных совпадений мало."""
+    if mode in ('0', '1'):
+        return mode == '1'
+    if len(q) < SEARCH_FUZZY_MIN_LENGTH:
+        return False
+    return len(qs.filter(exact).values('pk')[:SEARCH_FUZZY_MIN_RESULTS]) < SEARCH_FUZZY_MIN_RESULTS
+
+
+def filter_elements(qs, user, params):
+    """
+    qs - базовый queryset веществ, user - кто смотрит (может быть AnonymousUser),
+    params - параметры запроса (search, fuzzy + фильтры по полям SECTION_MAP).
+    """
+    # 2. PERMISSIONS
+    if user.is_staff:
+        pass
+    elif user.is_authenticated:
+        qs = qs.filter(Q(status='PUBLISHED') | Q(created_by=user))
+    else:
+        qs = qs.filter(status='PUBLISHED')
+
+    # 3. CAS ИЛИ ПОЛНОТЕКСТОВЫЙ ПОИСК (GIN по search_vector, сортировка по ts_rank)
+    q = params.get('search')
+    cas_lookup = cas_query(q) if q else None
+    if cas_lookup and qs.filter(**cas_lookup).exists():
+        # Запрос - номер CAS или его начало: B-tree по cas_normalized вместо полнотекстового поиска
+        # (ничего не нашлось - это мог быть номер ЕС или код, ищем как обычно)
+        qs = qs.filter(**cas_lookup).order_by('cas_normalized')
+    elif q:
+        q = q.strip()
+        query = search_query(q)
+        # Подстрока названия - как раньше ("бенз" находит "Бензол"), ее обслуживает триграммный индекс.
+        # Синоним целиком или его начало (торговые названия) - по индексу ElementSynonym
+        exact = Q(search_vector=query) | Q(primary_name_ru__icontains=q) | Q(pk__in=synonym_match(q))
+        rank = SearchRank(F('search_vector'), query)
+        if use_fuzzy(qs, exact, q, params.get('fuzzy')):
+            # Точные совпадения (rank > 0) остаются первыми, нечеткие - за ними по сходству.
+            # Queryset ленивый: пороги выставляет тот, кто его выполняет (fuzzy_thresholds)
+            qs = qs.filter(exact | fuzzy_match(q)).annotate(rank=rank, similarity=fuzzy_similarity(q)).order_by(
+                F('rank').desc(nulls_last=True), F('similarity').desc(nulls_last=True), '-updated_at'
+            )
+        else:
+            qs = qs.filter(exact).annotate(rank=rank).order_by(F('rank').desc(nulls_last=True), '-updated_at')
+
+    # 4. ФИЛЬТРАЦИЯ ПО ПОЛЯМ (FACETS)
+    FIELD_LOOKUP_MAP = field_lookups()
+
+    for param, value in params.items():
+        if param in FIELD_LOOKUP_MAP and value:
+            lookup = FIELD_LOOKUP_MAP[param]
+            if str(value).lower() == 'true':
+                qs = qs.filter(**{lookup: True})
+            elif str(value).lower() == 'false':
+                qs = qs.filter(**{lookup: False})
+            else:
+                qs = qs.filter(**{lookup: value})
+
+    return qs
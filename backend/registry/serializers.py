@@ -1,5 +1,7 @@
 from rest_framework import serializers
+from .cas import canonical_cas, normalize_cas
 from .models import *
+from .refresh import batched_element_refresh
 
 # ========================================================
 # 1. СЕРИАЛАЙЗЕР ДЛЯ ФАЙЛОВ
@@ -109,7 +111,8 @@ class ChemicalElementDetailSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = ChemicalElement
-        fields = '__all__'
+        # search_vector и cas_normalized - служебные поля поиска
+        exclude = ('search_vector', 'cas_normalized')
         # УБРАЛИ 'status' отсюда! Теперь он контролируется в __init__
         read_only_fields = ('created_by', 'updated_at')
 
@@ -124,17 +127,31 @@ class ChemicalElementDetailSerializer(serializers.ModelSerializer):
         if request and (request.user.is_staff or getattr(request.user, 'role', '') in ['ADMIN', 'CONTROLLER']):
              self.fields['status'].read_only = False
 
+    def validate_cas_number(self, value):
+        # "50000" и "50-00-0" - один номер (registry.cas)
+        value = canonical_cas(value)
+        digits = normalize_cas(value)
+        others = ChemicalElement.objects.filter(cas_normalized=digits)
+        if self.instance is not None:
+            others = others.exclude(pk=self.instance.pk)
+        if digits and others.exists():
+            raise serializers.ValidationError(f"Вещество с CAS {value} уже есть в реестре.")
+        return value
+
     def create(self, validated_data):
         sections_data = self._extract_section_data(validated_data)
-        element = ChemicalElement.objects.create(**validated_data)
-        self._update_sections(element, sections_data)
-        self._ensure_sections_exist(element)
+        # Вещество и все секции - одна транзакция и одно обновление вещества (registry.refresh)
+        with batched_element_refresh():
+            element = ChemicalElement.objects.create(**validated_data)
+            self._update_sections(element, sections_data)
+            self._ensure_sections_exist(element)
         return element
 
     def update(self, instance, validated_data):
         sections_data = self._extract_section_data(validated_data)
-        super().update(instance, validated_data)
-        self._update_sections(instance, sections_data)
+        with batched_element_refresh():
+            super().update(instance, validated_data)
+            self._update_sections(instance, sections_data)
         return instance
 
     def _extract_section_data(self, data):
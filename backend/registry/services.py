@@ -1,10 +1,18 @@
-import pandas as pd
+import hashlib
+import io
 import re
+import time
+from functools import lru_cache
+import numpy as np
+import pandas as pd
 from openpyxl import Workbook
 from openpyxl.utils import get_column_letter
 from openpyxl.worksheet.datavalidation import DataValidation
 from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
+from django.core.cache import cache
 from django.db import transaction
+from django.utils import timezone
+from simple_history.utils import bulk_create_with_history, bulk_update_with_history
 
 # Импорт моделей
 from registry.models import (
@@ -18,6 +26,11 @@ from registry.models import (
 )
 
 from .structures import SECTION_MAP
+from .readers import clean_header, open_import_reader
+from .autocomplete import sync_elements
+from .cas import canonical_cas, cas_filter, cas_key, element_cas_key
+from .search import update_search_vectors
+from .synonyms import sync_synonyms
 
 def get_field_info(model, field_name):
     try:
@@ -28,201 +41,701 @@ def get_field_info(model, field_name):
 # =========================================================================
 # 1. ГЕНЕРАЦИЯ ШАБЛОНА
 # =========================================================================
-def generate_excel_template():
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Форма реестра"
-    ws.freeze_panes = "A2"
-
-    config_obj = RegistryConfig.objects.first()
+def template_columns(config_obj, all_fields=False):
+    """
+    Колонки шаблона по порядку: (цвет секции, модель, заголовок с "*", поле БД).
+    Общая раскладка для шаблона и экспорта (экспорт можно загрузить обратно импортом).
+    all_fields=True - все колонки SECTION_MAP, без фильтра видимости из настроек.
+    """
     required_in_db = config_obj.required_fields if config_obj else []
-    visible_in_db = config_obj.template_fields if config_obj else []
-
-    header_font = Font(bold=True, color="FFFFFF", size=10)
-    center_align = Alignment(horizontal='center', vertical='center', wrap_text=True)
-    border = Border(left=Side(style='thin'), right=Side(style='thin'))
-
-    current_col = 1
+    visible_in_db = config_obj.template_fields if config_obj and not all_fields else []
 
     for section_name, hex_color, model_cls, fields in SECTION_MAP:
-        # Проверяем, есть ли в секции хоть одно поле, которое нужно показать
-        section_has_visible_fields = False
-        for _, db_f, is_sys in fields:
-            if is_sys or (not visible_in_db) or (db_f in visible_in_db):
-                section_has_visible_fields = True
-                break
-
-        if not section_has_visible_fields:
-            continue
-
-        fill = PatternFill(start_color=hex_color, end_color=hex_color, fill_type="solid")
-
         for excel_header, db_field, is_system_required in fields:
             # Фильтрация по настройкам видимости (если настроены)
             if not is_system_required and visible_in_db and (db_field not in visible_in_db):
                 continue
 
             is_mandatory = is_system_required or (db_field in required_in_db)
-            final_header = excel_header + (" *" if is_mandatory else "")
+            yield hex_color, model_cls, excel_header + (" *" if is_mandatory else ""), db_field
 
-            cell = ws.cell(row=1, column=current_col, value=final_header)
-            cell.font = header_font
-            cell.fill = fill
-            cell.alignment = center_align
-            cell.border = border
 
-            col_letter = get_column_letter(current_col)
-            ws.column_dimensions[col_letter].width = 25
+TEMPLATE_HEADER_FONT = Font(bold=True, color="FFFFFF", size=10)
+TEMPLATE_HEADER_ALIGN = Alignment(horizontal='center', vertical='center', wrap_text=True)
+TEMPLATE_HEADER_BORDER = Border(left=Side(style='thin'), right=Side(style='thin'))
 
-            # Выпадающие списки (Data Validation)
-            field_obj = get_field_info(model_cls, db_field)
-            if field_obj and field_obj.choices:
-                # Собираем варианты выбора
-                options = [str(c[1]).strip() for c in field_obj.choices]
-                # Excel имеет лимит 255 символов на формулу списка внутри ячейки
-                formula_str = ",".join(options).replace("\"", "").replace("'", "")
 
-                if len(formula_str) < 255:
-                    dv = DataValidation(type="list", formula1=f'"{formula_str}"', allow_blank=True)
-                    ws.add_data_validation(dv)
-                    dv.add(f"{col_letter}2:{col_letter}2000")
+def style_header_cell(cell, hex_color):
+    cell.font = TEMPLATE_HEADER_FONT
+    cell.fill = PatternFill(start_color=hex_color, end_color=hex_color, fill_type="solid")
+    cell.alignment = TEMPLATE_HEADER_ALIGN
+    cell.border = TEMPLATE_HEADER_BORDER
+
+
+def generate_excel_template(config_obj=None):
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "Форма реестра"
+    ws.freeze_panes = "A2"
+
+    if config_obj is None:
+        config_obj = RegistryConfig.objects.first()
+
+    for current_col, (hex_color, model_cls, final_header, db_field) in enumerate(template_columns(config_obj), start=1):
+        cell = ws.cell(row=1, column=current_col, value=final_header)
+        style_header_cell(cell, hex_color)
 
-            current_col += 1
+        col_letter = get_column_letter(current_col)
+        ws.column_dimensions[col_letter].width = 25
+
+        # Выпадающие списки (Data Validation)
+        field_obj = get_field_info(model_cls, db_field)
+        if field_obj and field_obj.choices:
+            # Собираем варианты выбора
+            options = [str(c[1]).strip() for c in field_obj.choices]
+            # Excel имеет лимит 255 символов на формулу списка внутри ячейки
+            formula_str = ",".join(options).replace("\"", "").replace("'", "")
+
+            if len(formula_str) < 255:
+                dv = DataValidation(type="list", formula1=f'"{formula_str}"', allow_blank=True)
+                ws.add_data_validation(dv)
+                dv.add(f"{col_letter}2:{col_letter}2000")
 
     return wb
 
+# Готовый .xlsx кэшируется: шаблон меняется только при сохранении настроек
+# (RegistryConfig.updated_at) или при изменении SECTION_MAP/списков выбора в коде
+TEMPLATE_CACHE_TIMEOUT = 60 * 60 * 24 * 30
+
+
+@lru_cache(maxsize=1)
+def section_map_hash():
+    """Хэш раскладки шаблона из кода: секции, колонки и варианты списков."""
+    parts = []
+    for section_name, hex_color, model_cls, fields in SECTION_MAP:
+        parts.append(f"{section_name}|{hex_color}|{model_cls._meta.label}")
+        for excel_header, db_field, is_sys in fields:
+            field_obj = get_field_info(model_cls, db_field)
+            choices = field_obj.choices if field_obj and field_obj.choices else ()
+            parts.append(f"{excel_header}|{db_field}|{is_sys}|{[(k, str(v)) for k, v in choices]}")
+    return hashlib.sha256("\n".join(parts).encode('utf-8')).hexdigest()
+
+
+def excel_template_version(config_obj):
+    """Версия шаблона (она же ETag): время изменения настроек + хэш SECTION_MAP."""
+    updated = config_obj.updated_at.isoformat() if config_obj and config_obj.updated_at else "default"
+    return hashlib.sha256(f"{updated}:{section_map_hash()}".encode('utf-8')).hexdigest()[:32]
+
+
+def get_excel_template(config_obj=None):
+    """
+    Возвращает (байты .xlsx, версия). Книга строится один раз на версию,
+    дальше отдается из кэша (Redis).
+    """
+    if config_obj is None:
+        config_obj = RegistryConfig.objects.first()
+    version = excel_template_version(config_obj)
+    key = f"excel-template:{version}"
+
+    content = cache.get(key)
+    if content is None:
+        buffer = io.BytesIO()
+        generate_excel_template(config_obj).save(buffer)
+        content = buffer.getvalue()
+        cache.set(key, content, TEMPLATE_CACHE_TIMEOUT)
+    return content, version
+
 # =========================================================================
 # 2. ИМПОРТ
 # =========================================================================
+TRUE_VALUES = ['+', '1', 'yes', 'да', 'true', 'есть', 'y']
+# Явные "нет": нужны только проверке файла (при импорте все, что не TRUE, и так False)
+FALSE_VALUES = ['-', '0', 'no', 'нет', 'false', 'n', 'нету', 'отсутствует']
+
 def parse_boolean(value):
     v = str(value).lower().strip()
-    return v in ['+', '1', 'yes', 'да', 'true', 'есть', 'y']
+    return v in TRUE_VALUES
+
+IMPORT_BATCH_SIZE = 500  # Сколько строк Excel пишем в БД одним bulk_create
+IMPORT_SHARD_ROWS = 5000  # Файлы длиннее режутся на части для параллельных воркеров
+
+
+IMPORT_MODE_CREATE = 'create'  # Только новые вещества (дубль CAS - ошибка строки)
+IMPORT_MODE_MERGE = 'merge'    # Найденные по CAS обновляются, неизменные пропускаются
+IMPORT_MODES = (IMPORT_MODE_CREATE, IMPORT_MODE_MERGE)
+
+VALIDATE_CHUNK_SIZE = 5000  # Проверка без записи в БД идет крупными пачками
+VALIDATE_MAX_CELLS = 1000   # Сколько ячеек с ошибками отдаем в матрице (счетчики - всегда полные)
+
+
+def get_section_models():
+    """Все модели-секции (OneToOne sec*), которые должны быть у каждого вещества."""
+    return list(get_section_relations())
+
+
+def get_section_relations():
+    """{Модель секции: имя связи на ChemicalElement}, например {Sec2Physical: 'sec2_physical'}."""
+    return {
+        rel.related_model: rel.get_accessor_name()
+        for rel in ChemicalElement._meta.related_objects
+        if rel.one_to_one and rel.name.startswith('sec')
+    }
+
+
+def _bulk_insert_rows(rows, user):
+    """
+    Пишет пачку уже провалидированных строк: одна вставка на модель.
+    rows: [(row_num, {КлассМодели: {поле: значение}}), ...]
+    История (simple_history) пишется тоже пачкой, а не по сигналу на каждую запись.
+    """
+    elements = [
+        ChemicalElement(
+            created_by=user,
+            status=ChemicalElement.Status.DRAFT,
+            **data[ChemicalElement]
+        )
+        for _, data in rows
+    ]
+    # bulk_create не вызывает save(): цифры CAS заполняем сами
+    for element in elements:
+        element.sync_cas()
+    elements = bulk_create_with_history(elements, ChemicalElement, default_user=user)
+
+    # Все секции создаем сразу (включая пустые, чтобы админка не падала)
+    for model_cls in get_section_models():
+        sections = [
+            model_cls(element=element, **data.get(model_cls, {}))
+            for element, (_, data) in zip(elements, rows)
+        ]
+        bulk_create_with_history(sections, model_cls, default_user=user)
+
+    # bulk_create идет мимо сигналов: поисковые документы пачки - одним UPDATE, синонимы - пачкой
+    update_search_vectors([element.pk for element in elements])
+    if any('synonyms' in data.get(Sec1Identification, {}) for _, data in rows):
+        sync_synonyms([element.pk for element in elements])
+    return elements
+
+
+def _bulk_merge_rows(rows, user):
+    """
+    Режим merge: вещества ищутся по CAS одним запросом (со всеми секциями),
+    значения сравниваются с текущими, в БД уходят только реальные изменения
+    (bulk_update по измененным полям + одна запись истории на измененный объект).
+    Возвращает {"success": записано, "updated": обновлено, "unchanged": без изменений}.
+    """
+    relations = get_section_relations()
+    cas_values = [data[ChemicalElement].get('cas_number') for _, data in rows]
+    existing = {
+        element_cas_key(element): element
+        for element in ChemicalElement.objects.filter(cas_filter(cas_values)).select_related(*relations.values())
+    }
+
+    new_rows = []
+    changed = {}        # Модель -> {pk: объект} для bulk_update
+    changed_fields = {} # Модель -> множество измененных полей
+    missing = {}        # Модель -> [новые секции для существующих веществ]
+    touched = []        # Вещества, у которых изменились только секции
+    stats = {"success": 0, "updated": 0, "unchanged": 0}
+    now = timezone.now()
+
+    for (row_num, data), cas in zip(rows, cas_values):
+        element = existing.get(cas_key(cas)) if cas else None
+        if element is None:
+            new_rows.append((row_num, data))
+            continue
 
-def process_excel_import(file, user):
-    try:
-        df = pd.read_excel(file)
-
-        # === УЛУЧШЕННАЯ ОЧИСТКА ЗАГОЛОВКОВ ===
-        clean_cols = []
-        for col in df.columns:
-            # 1. В строку
-            c = str(col).strip()
-            # 2. Убираем звездочку в конце (индикатор обязательности)
-            if c.endswith("*"):
-                c = c.replace("*", "").strip()
-            # 3. Нормализуем пробелы (два пробела -> один)
-            c = re.sub(r'\s+', ' ', c)
-            clean_cols.append(c)
-
-        df.columns = clean_cols
-        # Заменяем NaN на пустую строку, чтобы не падать
-        df = df.fillna("")
+        row_changed = False
+        for model_cls, values in data.items():
+            target = element if model_cls is ChemicalElement else getattr(element, relations[model_cls], None)
 
-    except Exception as e:
-        return {"success": 0, "errors": [f"Ошибка чтения файла (структура Excel): {str(e)}"]}
+            if target is None:
+                missing.setdefault(model_cls, []).append(model_cls(element=element, **values))
+                row_changed = True
+                continue
 
-    report = {"success": 0, "errors": []}
+            diff = [f for f, v in values.items() if getattr(target, f) != v]
+            if not diff:
+                continue
 
-    # 1. Создаем карты маппинга
-    FLAT_MAP = {}      # Заголовок Excel (чистый) -> (КлассМодели, ИмяПоляБД)
-    HUMAN_NAMES = {}   # ИмяПоляБД -> Заголовок Excel (для красивых ошибок)
+            for f in diff:
+                setattr(target, f, values[f])
+            if model_cls is ChemicalElement:
+                target.updated_at = now
+                diff.append('updated_at')
+            changed.setdefault(model_cls, {})[target.pk] = target
+            changed_fields.setdefault(model_cls, set()).update(diff)
+            row_changed = True
+
+        if row_changed:
+            stats["updated"] += 1
+            if element.pk not in changed.get(ChemicalElement, {}):
+                touched.append(element.pk)
+        else:
+            stats["unchanged"] += 1
+
+    for model_cls, objs in changed.items():
+        bulk_update_with_history(
+            list(objs.values()), model_cls, sorted(changed_fields[model_cls]), default_user=user
+        )
+    for model_cls, objs in missing.items():
+        bulk_create_with_history(objs, model_cls, default_user=user)
+    # bulk-операции идут мимо сигналов: updated_at вещества (лента изменений) двигаем сами
+    if touched:
+        ChemicalElement.objects.filter(pk__in=touched).update(updated_at=now)
+    updated_ids = touched + list(changed.get(ChemicalElement, {}))
+    # Изменились синонимы (или появилась секция I) - пересобираем строки синонимов
+    synonym_ids = [obj.element_id for obj in missing.get(Sec1Identification, [])]
+    if 'synonyms' in changed_fields.get(Sec1Identification, ()):
+        synonym_ids += [obj.element_id for obj in changed[Sec1Identification].values()]
+    if synonym_ids:
+        sync_synonyms(synonym_ids)
+    if updated_ids:
+        update_search_vectors(updated_ids)
+        # Импортируем внутри функции, чтобы избежать кольцевых ссылок (passports использует services)
+        from .passports import invalidate_passports
+        transaction.on_commit(lambda: invalidate_passports(updated_ids))
+        # Обновленные опубликованные вещества могли сменить название, CAS или синонимы
+        transaction.on_commit(lambda: sync_elements(updated_ids))
+
+    if new_rows:
+        _bulk_insert_rows(new_rows, user)
+
+    stats["success"] = len(new_rows) + stats["updated"]
+    return stats
+
+
+def _write_rows(rows, user, mode):
+    """Пишет пачку в выбранном режиме. Возвращает счетчики для отчета."""
+    if mode == IMPORT_MODE_MERGE:
+        return _bulk_merge_rows(rows, user)
+    _bulk_insert_rows(rows, user)
+    return {"success": len(rows)}
+
+
+def _add_counts(report, counts):
+    for key, value in counts.items():
+        report[key] = report.get(key, 0) + value
+
+
+def _flush_import_batch(batch, user, report, mode=IMPORT_MODE_CREATE):
+    """Сохраняет пачку строк. При ошибке БД откатывает пачку и повторяет построчно."""
+    rows = batch
+    if mode == IMPORT_MODE_CREATE:
+        # Дубли CAS ловим заранее (одним запросом), чтобы одна строка не роняла всю пачку
+        cas_values = [data[ChemicalElement].get('cas_number') for _, data in batch]
+        taken = {
+            digits or cas for digits, cas in
+            ChemicalElement.objects.filter(cas_filter(cas_values)).values_list('cas_normalized', 'cas_number')
+        }
+
+        rows = []
+        for (row_num, data), cas in zip(batch, cas_values):
+            if cas and cas_key(cas) in taken:
+                report["errors"].append(f"Строка {row_num}: Вещество с CAS '{cas}' уже есть в реестре")
+                continue
+            if cas:
+                taken.add(cas_key(cas))
+            rows.append((row_num, data))
 
-    for _, _, model, fields in SECTION_MAP:
-        for ex_head, db_field, _ in fields:
-            # Нормализуем и ключ маппинга тоже, чтобы совпадало наверняка
-            clean_head = re.sub(r'\s+', ' ', ex_head.strip())
-            FLAT_MAP[clean_head] = (model, db_field)
-            HUMAN_NAMES[db_field] = ex_head
+    if not rows:
+        return
 
-    # 2. Итерация по строкам
-    for index, row in df.iterrows():
-        row_num = index + 2 # В Excel строки начинаются с 1, плюс заголовок
+    try:
+        with transaction.atomic():
+            counts = _write_rows(rows, user, mode)
+        _add_counts(report, counts)
+        return
+    except Exception:
+        pass
+
+    # Пачка не прошла (например, слишком длинное значение) - ищем виноватые строки
+    for row_num, data in rows:
         try:
             with transaction.atomic():
-                extracted_data = {}
-
-                # A. Парсинг данных
-                for col_name in df.columns:
-                    col_name_clean = str(col_name).strip()
-
-                    if col_name_clean not in FLAT_MAP:
-                        continue # Колонка не из нашего шаблона
-
-                    target_model, target_field = FLAT_MAP[col_name_clean]
-                    raw_value = str(row[col_name]).strip()
-
-                    if not raw_value:
-                        continue
-
-                    field_obj = get_field_info(target_model, target_field)
-                    final_value = raw_value
-
-                    # Если поле с выбором (choices), пытаемся найти ключ по значению
-                    # (Пользователь видит "Твердое вещество", а в базу надо писать "SOLID")
-                    if field_obj and field_obj.choices:
-                        for k, label in field_obj.choices:
-                            if raw_value.lower() == str(label).lower() or raw_value.lower() == str(k).lower():
-                                final_value = k
-                                break
-
-                    # Если булево поле
-                    if field_obj and field_obj.get_internal_type() == 'BooleanField':
-                        final_value = parse_boolean(raw_value)
-
-                    # Собираем данные по моделям
-                    if target_model not in extracted_data:
-                        extracted_data[target_model] = {}
-                    extracted_data[target_model][target_field] = final_value
-
-                # Б. ВАЛИДАЦИЯ (Динамическая)
-                config_obj = RegistryConfig.objects.first()
-                required_list = config_obj.required_fields if config_obj else []
-
-                if required_list:
-                    for field_name in required_list:
-                        # Ищем это поле среди всех собранных данных
-                        found_val = False
-                        for model_class, fields_dict in extracted_data.items():
-                            if field_name in fields_dict:
-                                val = fields_dict[field_name]
-                                if val is not None and val != "":
-                                    found_val = True
-                                    break
-
-                        # Если не нашли значение для обязательного поля
-                        if not found_val:
-                            human_name = HUMAN_NAMES.get(field_name, field_name)
-                            raise ValueError(f"Поле '{human_name}' обязательно для заполнения.")
-
-                # В. Системная валидация (Главное название)
-                if ChemicalElement not in extracted_data or 'primary_name_ru' not in extracted_data[ChemicalElement]:
-                     # Если вся строка пустая - пропускаем молча
-                     if not row.empty and any(str(x).strip() for x in row):
-                        raise ValueError("Отсутствует 'Название вещества (RU)'")
-                     continue
-
-                # Г. Сохранение в БД
-                # Сначала главную модель
-                element = ChemicalElement.objects.create(
-                    created_by=user,
-                    status=ChemicalElement.Status.DRAFT,
-                    **extracted_data[ChemicalElement]
-                )
-
-                # Потом все секции
-                for model_cls, fields_dict in extracted_data.items():
-                    if model_cls == ChemicalElement: continue
-                    model_cls.objects.create(element=element, **fields_dict)
-
-                # Создаем пустые записи для недостающих секций (чтобы админка не падала)
-                for rel_obj in ChemicalElement._meta.related_objects:
-                    if rel_obj.one_to_one and rel_obj.name.startswith('sec'):
-                        if not hasattr(element, rel_obj.name):
-                            rel_obj.related_model.objects.create(element=element)
-
-                report["success"] += 1
-
+                counts = _write_rows([(row_num, data)], user, mode)
+            _add_counts(report, counts)
         except Exception as e:
             report["errors"].append(f"Строка {row_num}: {str(e)}")
 
-    return report
\ No newline at end of file
+
+FILE_READ_ERROR = "Ошибка чтения файла (структура файла): {}"
+
+
+def file_sha256(f):
+    """SHA-256 загруженного файла (по частям, без чтения целиком в память)."""
+    digest = hashlib.sha256()
+    for part in f.chunks():
+        digest.update(part)
+    f.seek(0)
+    return digest.hexdigest()
+
+
+def process_file_import(file, filename, user, on_progress=None, mode=IMPORT_MODE_CREATE):
+    """
+    Импорт .xlsx/.csv/.jsonl/.parquet (формат - по расширению filename).
+    Строки читаются потоково, поэтому файл любого размера держит в памяти
+    только текущую пачку строк.
+    on_progress(n) вызывается после каждой пачки с числом обработанных строк.
+    mode: IMPORT_MODE_CREATE или IMPORT_MODE_MERGE (обновление по CAS).
+    """
+    try:
+        reader = open_import_reader(file, filename)
+    except Exception as e:
+        return {"success": 0, "errors": [FILE_READ_ERROR.format(str(e))]}
+
+    with reader:
+        return import_rows(reader, user, on_progress=on_progress, mode=mode)
+
+
+def process_excel_import(file, user, on_progress=None, mode=IMPORT_MODE_CREATE):
+    """Импорт .xlsx (openpyxl read_only)."""
+    return process_file_import(file, 'import.xlsx', user, on_progress=on_progress, mode=mode)
+
+
+class ImportColumn:
+    """Одна колонка файла, привязанная к полю модели, с заранее готовым конвертером."""
+    def __init__(self, index, header, model, field):
+        self.index = index
+        self.header = header
+        self.model = model
+        self.field = field
+
+        field_obj = get_field_info(model, field)
+        self.is_boolean = bool(field_obj) and field_obj.get_internal_type() == 'BooleanField'
+        self.max_length = getattr(field_obj, 'max_length', None) if not self.is_boolean else None
+        # CAS приводится к канонической записи: по ней ищутся дубли и существующие вещества
+        self.is_cas = model is ChemicalElement and field == 'cas_number'
+
+        # Словарь "подпись/ключ в нижнем регистре" -> ключ
+        # (Пользователь видит "Твердое вещество", а в базу надо писать "SOLID")
+        self.choices = {}
+        if field_obj and field_obj.choices:
+            # reversed: при совпадении побеждает первый вариант, как в старом цикле
+            for k, label in reversed(field_obj.choices):
+                self.choices[str(label).lower()] = k
+                self.choices[str(k).lower()] = k
+
+    def convert(self, values):
+        """Конвертирует весь столбец пачки сразу (pandas), а не ячейку за ячейкой."""
+        if self.is_boolean:
+            return values.str.lower().isin(TRUE_VALUES)
+        if self.is_cas:
+            return values.map(canonical_cas)
+        if self.choices:
+            keys = values.str.lower().map(self.choices)
+            # Неизвестные значения оставляем как есть (как и раньше)
+            return keys.where(keys.notna(), values)
+        return values
+
+    def check(self, values, filled):
+        """
+        Проверка столбца целиком (dry-run). values - pd.Series строк, filled - маска непустых.
+        Возвращает [(позиция в пачке, текст ошибки), ...].
+        """
+        lowered = values.str.lower()
+        if self.is_boolean:
+            bad = filled & ~lowered.isin(TRUE_VALUES + FALSE_VALUES)
+            message = "Не распознано значение '{}' (ожидается Да/Нет)"
+        elif self.choices:
+            bad = filled & lowered.map(self.choices).isna()
+            message = "Значение '{}' нет в списке допустимых"
+        elif self.max_length:
+            bad = filled & (values.str.len() > self.max_length)
+            message = "Значение '{:.30}...' длиннее " + str(self.max_length) + " символов"
+        else:
+            return []
+        return [(i, message.format(values.iat[i])) for i in np.flatnonzero(bad.to_numpy())]
+
+
+class ImportPlan:
+    """
+    Собирается один раз на файл из SECTION_MAP и строки заголовков.
+    Хранит колонки с конвертерами и обязательные поля, чтобы не выяснять это
+    заново для каждой ячейки.
+    """
+    def __init__(self, headers, required_fields=None):
+        FLAT_MAP = {}      # Заголовок Excel (чистый) или имя поля БД -> (КлассМодели, ИмяПоляБД)
+        self.human_names = {}   # ИмяПоляБД -> Заголовок Excel (для красивых ошибок)
+
+        for _, _, model, fields in SECTION_MAP:
+            for ex_head, db_field, _ in fields:
+                # Нормализуем и ключ маппинга тоже, чтобы совпадало наверняка
+                FLAT_MAP[clean_header(ex_head)] = (model, db_field)
+                self.human_names[db_field] = ex_head
+
+        # Выгрузки из ERP (CSV/JSON/Parquet) часто используют имена полей БД
+        for _, _, model, fields in SECTION_MAP:
+            for _, db_field, _ in fields:
+                FLAT_MAP.setdefault(db_field, (model, db_field))
+
+        self.columns = []
+        for index, header in enumerate(headers):
+            if header in FLAT_MAP:
+                model, field = FLAT_MAP[header]
+                self.columns.append(ImportColumn(index, header, model, field))
+
+        self.required_fields = list(required_fields or [])
+        # Системно-обязательные колонки (третий элемент в SECTION_MAP)
+        self.system_required = [
+            db_field for _, _, _, fields in SECTION_MAP for _, db_field, is_sys in fields if is_sys
+        ]
+
+    def convert(self, chunk):
+        """
+        chunk: [(row_num, [значения]), ...] -> [(row_num, extracted_data, is_blank), ...]
+        extracted_data: {КлассМодели: {поле: значение}}, пустые ячейки пропущены.
+        """
+        if not chunk:
+            return []
+
+        # Пачка как матрица строк: пустые ячейки и пустые строки считаем векторно
+        raw = np.array([values for _, values in chunk], dtype=object).reshape(len(chunk), -1)
+        filled_cells = raw != ""
+        blank_rows = ~filled_cells.any(axis=1)
+
+        converted = []
+        for col in self.columns:
+            values = pd.Series(raw[:, col.index], dtype=object)
+            converted.append((col, col.convert(values).to_numpy(dtype=object), filled_cells[:, col.index]))
+
+        result = []
+        for i, (row_num, _) in enumerate(chunk):
+            extracted_data = {}
+            for col, col_values, filled in converted:
+                if filled[i]:
+                    extracted_data.setdefault(col.model, {})[col.field] = col_values[i]
+            result.append((row_num, extracted_data, bool(blank_rows[i])))
+        return result
+
+    def validate(self, extracted_data):
+        """Проверка обязательных полей (настройки + системные). Бросает ValueError."""
+        for field_name in self.required_fields:
+            # Ищем это поле среди всех собранных данных
+            found_val = any(
+                fields_dict.get(field_name) not in (None, "")
+                for fields_dict in extracted_data.values()
+            )
+            # Если не нашли значение для обязательного поля
+            if not found_val:
+                human_name = self.human_names.get(field_name, field_name)
+                raise ValueError(f"Поле '{human_name}' обязательно для заполнения.")
+
+        # Системная валидация (Главное название)
+        if 'primary_name_ru' not in extracted_data.get(ChemicalElement, {}):
+            raise ValueError("Отсутствует 'Название вещества (RU)'")
+
+
+    def missing_columns(self):
+        """Обязательные поля, для которых в файле вообще нет колонки."""
+        present = {col.field for col in self.columns}
+        fields = self.system_required + [f for f in self.required_fields if f not in self.system_required]
+        return [self.human_names.get(f, f) for f in fields if f not in present]
+
+    def check(self, chunk):
+        """
+        Проверка пачки без записи в БД, по столбцам.
+        Возвращает (ошибки [(row_num, колонка, текст)], [(row_num, cas)] непустых строк).
+        """
+        if not chunk:
+            return [], []
+
+        raw = np.array([values for _, values in chunk], dtype=object).reshape(len(chunk), -1)
+        filled_cells = raw != ""
+        keep = filled_cells.any(axis=1)  # Пустые строки импорт пропускает молча
+        row_nums = [row_num for row_num, _ in chunk]
+
+        errors = []
+        cas_column = None
+        for col in self.columns:
+            filled = filled_cells[:, col.index] & keep
+            values = pd.Series(raw[:, col.index], dtype=object)
+            for i, message in col.check(values, pd.Series(filled)):
+                errors.append((row_nums[i], col.header, message))
+
+            if col.field in self.system_required:
+                message = f"Отсутствует '{self.human_names.get(col.field, col.field)}'"
+            elif col.field in self.required_fields:
+                message = f"Поле '{self.human_names.get(col.field, col.field)}' обязательно для заполнения."
+            else:
+                message = None
+            if message:
+                for i in np.flatnonzero(keep & ~filled_cells[:, col.index]):
+                    errors.append((row_nums[i], col.header, message))
+
+            if col.is_cas:
+                cas_column = col
+
+        cas_rows = [
+            (row_nums[i], canonical_cas(raw[i, cas_column.index]) if cas_column else "")
+            for i in np.flatnonzero(keep)
+        ]
+        return errors, cas_rows
+
+
+def iter_chunks(rows, size):
+    """Режет поток строк на пачки по size штук."""
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def import_rows(reader, user, on_progress=None, mode=IMPORT_MODE_CREATE, resume_after=0, on_chunk=None):
+    """
+    Общий движок импорта для любого читателя строк (Excel, шард и т.д.).
+
+    resume_after: строки с номером <= resume_after уже закоммичены (перезапуск задачи) - пропускаем.
+    on_chunk(последняя строка, прочитано строк, отчет пачки) вызывается внутри транзакции
+    пачки: так контрольная точка задачи коммитится вместе с данными.
+    """
+    report = {"success": 0, "errors": []}
+    if mode == IMPORT_MODE_MERGE:
+        report.update({"updated": 0, "unchanged": 0})
+
+    # Настройки и план колонок собираем один раз на файл
+    config_obj = RegistryConfig.objects.first()
+    plan = ImportPlan(reader.columns, config_obj.required_fields if config_obj else [])
+
+    rows = reader
+    if resume_after:
+        rows = (row for row in reader if row[0] > resume_after)
+
+    for chunk in iter_chunks(rows, IMPORT_BATCH_SIZE):
+        batch = []  # Провалидированные строки, ждущие записи в БД
+        chunk_report = {key: ([] if key == "errors" else 0) for key in report}
+
+        for row_num, extracted_data, is_blank in plan.convert(chunk):
+            # Если вся строка пустая - пропускаем молча
+            if is_blank:
+                continue
+            try:
+                plan.validate(extracted_data)
+            except Exception as e:
+                chunk_report["errors"].append(f"Строка {row_num}: {str(e)}")
+                continue
+            batch.append((row_num, extracted_data))
+
+        # Сохранение в БД (пачками) + контрольная точка в одной транзакции
+        with transaction.atomic():
+            if batch:
+                _flush_import_batch(batch, user, chunk_report, mode)
+            if on_chunk:
+                on_chunk(chunk[-1][0], len(chunk), chunk_report)
+
+        report["errors"].extend(chunk_report.pop("errors"))
+        _add_counts(report, chunk_report)
+
+        if on_progress:
+            on_progress(len(chunk))
+
+    # Ошибки выводим в порядке строк файла
+    report["errors"].sort(key=_error_row_number)
+    return report
+
+
+def validate_rows(reader, mode=IMPORT_MODE_CREATE):
+    """
+    Dry-run: проверяет весь файл по столбцам и ничего не пишет в БД.
+    Проверки: обязательные поля (настройки + SECTION_MAP), списки выбора, Да/Нет,
+    длина строк, повторы CAS в файле и (в режиме create) CAS, уже занятые в реестре -
+    одним запросом на весь файл.
+
+    Отчет: rows/valid_rows - счетчики строк, columns - число ошибок по колонкам,
+    matrix - [{"row": N, "cells": {колонка: ошибка}}] (не больше VALIDATE_MAX_CELLS ячеек),
+    errors - те же ошибки строками "Строка N: ...", как в отчете импорта.
+    """
+    config_obj = RegistryConfig.objects.first()
+    plan = ImportPlan(reader.columns, config_obj.required_fields if config_obj else [])
+    cas_header = plan.human_names.get('cas_number', 'cas_number')
+
+    cells = {}          # row_num -> {колонка: ошибка}
+    cas_first_row = {}  # CAS -> первая строка, где он встретился
+    cas_rows = []
+    rows = 0
+
+    def add(row_num, column, message):
+        cells.setdefault(row_num, {}).setdefault(column, message)
+
+    for chunk in iter_chunks(reader, VALIDATE_CHUNK_SIZE):
+        errors, chunk_cas = plan.check(chunk)
+        for row_num, column, message in errors:
+            add(row_num, column, message)
+        rows += len(chunk_cas)
+
+        for row_num, cas in chunk_cas:
+            if not cas:
+                continue
+            if cas in cas_first_row:
+                add(row_num, cas_header, f"CAS '{cas}' повторяется (уже в строке {cas_first_row[cas]})")
+            else:
+                cas_first_row[cas] = row_num
+                cas_rows.append((row_num, cas))
+
+    # Занятые CAS - один запрос на весь файл (в режиме merge это не ошибка, а обновление)
+    if mode == IMPORT_MODE_CREATE and cas_rows:
+        taken = {
+            digits or cas for digits, cas in
+            ChemicalElement.objects.filter(cas_filter([cas for _, cas in cas_rows]))
+            .values_list('cas_normalized', 'cas_number')
+        }
+        for row_num, cas in cas_rows:
+            if cas_key(cas) in taken:
+                add(row_num, cas_header, f"Вещество с CAS '{cas}' уже есть в реестре")
+
+    file_errors = [f"В файле нет обязательной колонки '{name}'" for name in plan.missing_columns()]
+
+    columns, matrix, errors, shown = {}, [], [], 0
+    for row_num in sorted(cells):
+        row_cells = cells[row_num]
+        for column, message in row_cells.items():
+            columns[column] = columns.get(column, 0) + 1
+            errors.append(f"Строка {row_num}: {column}: {message}")
+        if shown < VALIDATE_MAX_CELLS:
+            matrix.append({"row": row_num, "cells": row_cells})
+            shown += len(row_cells)
+
+    return {
+        "rows": rows,
+        # Без обязательной колонки не пройдет ни одна строка
+        "valid_rows": 0 if file_errors else rows - len(cells),
+        "file_errors": file_errors,
+        "columns": columns,
+        "matrix": matrix,
+        "truncated": len(matrix) < len(cells),
+        "errors": file_errors + errors[:VALIDATE_MAX_CELLS],
+    }
+
+
+def merge_import_reports(reports):
+    """Склеивает отчеты шардов в один отчет того же формата."""
+    merged = {"success": 0, "errors": []}
+    for report in reports:
+        merged["errors"].extend(report.get("errors", []))
+        _add_counts(merged, {k: v for k, v in report.items() if k != "errors"})
+    merged["errors"].sort(key=_error_row_number)
+    return merged
+
+
+def import_progress_meta(done, total, started_at, label='Импорт'):
+    """meta для update_state: процент, счетчики строк и оценка оставшегося времени (сек)."""
+    elapsed = max(time.time() - started_at, 0.001)
+    meta = {'processed': done, 'total': total, 'eta': None}
+    if total:
+        done = min(done, total)
+        meta['progress'] = int(done * 100 / total)
+        meta['message'] = f'{label}: {done} из {total} строк'
+        if done:
+            meta['eta'] = int((total - done) * elapsed / done)
+    else:
+        meta['progress'] = None
+        meta['message'] = f'{label}: {done} строк'
+    return meta
+
+
+def _error_row_number(message):
+    match = re.match(r'Строка (\d+):', message)
+    return int(match.group(1)) if match else 0
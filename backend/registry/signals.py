@@ -1,8 +1,65 @@
-from django.db.models.signals import pre_save
+from django.db.models.signals import pre_save, post_save, post_delete
 from django.dispatch import receiver
 from django.db import transaction
-from .models import ChemicalElement
-from .tasks import send_status_email_task
+from .models import ChemicalElement, RegistryConfig
+from .autocomplete import sync_elements
+from .passports import invalidate_passports
+from .refresh import element_saved, section_changed
+from .services import get_excel_template, get_section_models
+from .tasks import prerender_passport, rebuild_search_index_task, send_status_email_task
+
+
+@receiver(post_save, sender=RegistryConfig)
+def rebuild_excel_template(sender, instance, **kwargs):
+    # Новая версия шаблона собирается один раз сразу после сохранения настроек,
+    # а не первым (и сотым параллельным) скачиванием
+    transaction.on_commit(lambda: get_excel_template(instance))
+    # Поля публичной таблицы входят в поисковый документ - пересчитываем его у всех веществ в фоне
+    transaction.on_commit(lambda: rebuild_search_index_task.delay())
+
+def touch_element(sender, instance, raw=False, **kwargs):
+    # Правка секции - это правка вещества (registry.refresh): внутри batched_element_refresh()
+    # сериализатор и админка обновляют вещество один раз, а не на каждую из ~20 секций
+    if not raw:
+        section_changed(instance.element_id, sender)
+
+
+@receiver(post_save, sender=ChemicalElement)
+@receiver(post_delete, sender=ChemicalElement)
+def drop_element_passport(sender, instance, raw=False, **kwargs):
+    if not raw:
+        drop_passport(instance.pk)
+
+
+@receiver(post_save, sender=ChemicalElement)
+def refresh_search_vector(sender, instance, raw=False, **kwargs):
+    # Название и CAS - часть поискового документа; во вложенном сохранении - вместе с секциями
+    if not raw:
+        element_saved(instance.pk)
+
+
+@receiver(post_save, sender=ChemicalElement)
+@receiver(post_delete, sender=ChemicalElement)
+def sync_element_autocomplete(sender, instance, raw=False, **kwargs):
+    # Публикация, снятие с публикации, смена названия/CAS и удаление
+    if not raw:
+        refresh_autocomplete(instance.pk)
+
+
+def refresh_autocomplete(element_id):
+    # После коммита: индекс строится по тому, что видят другие запросы
+    transaction.on_commit(lambda: sync_elements([element_id]))
+
+
+def drop_passport(element_id):
+    # Сохраненный PDF устарел: удаляем после коммита (до него паспорт могут пересобрать по старым данным)
+    transaction.on_commit(lambda: invalidate_passports([element_id]))
+
+
+for section_model in get_section_models():
+    post_save.connect(touch_element, sender=section_model, dispatch_uid=f'touch_element_save_{section_model.__name__}')
+    post_delete.connect(touch_element, sender=section_model, dispatch_uid=f'touch_element_delete_{section_model.__name__}')
+
 
 @receiver(pre_save, sender=ChemicalElement)
 def notify_status_change(sender, instance, **kwargs):
@@ -18,6 +75,10 @@ def notify_status_change(sender, instance, **kwargs):
 
     # Если статус изменился
     if old_instance.status != instance.status:
+        if instance.status == 'PUBLISHED':
+            # Паспорт рендерится в фоне сразу после публикации, а не первым посетителем
+            transaction.on_commit(lambda: prerender_passport(instance.pk))
+
         # Формируем тему и тело письма
         subject = f"Изменение статуса вещества: {instance.primary_name_ru}"
         message = ""
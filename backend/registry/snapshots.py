@@ -0,0 +1,164 @@
+import json
+import os
+import tempfile
+from itertools import islice
+from django.core.files.base import ContentFile, File
+from django.core.files.storage import default_storage
+from django.utils import timezone
+
+from registry.models import ChemicalElement
+from .services import get_section_relations
+
+# =========================================================================
+# НОЧНОЙ СНИМОК РЕЕСТРА В PARQUET (для аналитики)
+# =========================================================================
+# Все опубликованные вещества со всеми секциями - одна плоская таблица
+# (колонки "вещество" + "секция__поле"), разложенная по классу опасности
+# (hive-разбиение) в snapshots/registry/<время>/. Строки читаются кусками
+# по SNAPSHOT_BATCH_SIZE и сразу собираются в колонки pyarrow, поэтому
+# память не зависит от размера реестра.
+# Стабильная точка входа - snapshots/registry/latest.json (манифест последнего
+# снимка) и API /api/registry/snapshot/latest/.
+
+SNAPSHOT_ROOT = "snapshots/registry"
+SNAPSHOT_LATEST = f"{SNAPSHOT_ROOT}/latest.json"
+SNAPSHOT_BATCH_SIZE = 10000
+SNAPSHOT_KEEP = 7
+SNAPSHOT_PARTITION = 'sec11_class__sanpin_class'
+
+# Служебные поля в снимок не попадают (автор - персональные данные)
+SNAPSHOT_SKIP_FIELDS = {'created_by', 'search_vector', 'cas_normalized'}
+
+
+def snapshot_columns():
+    """[(имя колонки = путь для values_list, поле модели)]: поля вещества, затем все поля секций."""
+    columns = [
+        (field.name, field) for field in ChemicalElement._meta.concrete_fields
+        if field.name not in SNAPSHOT_SKIP_FIELDS
+    ]
+    for model_cls, relation in get_section_relations().items():
+        for field in model_cls._meta.concrete_fields:
+            if field.primary_key or field.name == 'element':
+                continue
+            columns.append((f"{relation}__{field.name}", field))
+    return columns
+
+
+def arrow_type(pa, field):
+    internal = field.get_internal_type()
+    if internal == 'BooleanField':
+        return pa.bool_()
+    if internal in ('AutoField', 'BigAutoField', 'IntegerField', 'BigIntegerField', 'PositiveIntegerField'):
+        return pa.int64()
+    if internal == 'FloatField':
+        return pa.float64()
+    if internal == 'DateTimeField':
+        return pa.timestamp('us', tz='UTC')
+    # CharField/TextField/FileField (имя файла) и все прочее - строкой
+    return pa.string()
+
+
+def iter_snapshot_batches(pa, queryset, schema, stats, batch_size=SNAPSHOT_BATCH_SIZE):
+    """RecordBatch по batch_size строк: кусок строк из курсора -> колонки pyarrow."""
+    rows = queryset.values_list(*schema.names).iterator(chunk_size=batch_size)
+    while True:
+        chunk = list(islice(rows, batch_size))
+        if not chunk:
+            break
+        arrays = [
+            pa.array(values, type=schema.field(i).type)
+            for i, values in enumerate(zip(*chunk))
+        ]
+        stats['rows'] += len(chunk)
+        yield pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+def write_partitions(pa, batches, schema, directory):
+    """
+    Hive-разбиение по SNAPSHOT_PARTITION: <колонка>=<значение>/part-0.parquet, сама колонка в файлы не пишется.
+    Пишем сами, а не через pyarrow.dataset: тот читает пачки в своих потоках, а курсору Django
+    нужен поток (и соединение с БД), в котором открыт запрос. Значений класса опасности единицы -
+    открытых писателей столько же. Возвращает {относительный путь: путь на диске}.
+    """
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+
+    index = schema.get_field_index(SNAPSHOT_PARTITION)
+    file_schema = schema.remove(index)
+    writers, paths = {}, {}
+    try:
+        for batch in batches:
+            keys = batch.column(index)
+            for value in keys.unique().to_pylist():
+                mask = pc.is_null(keys) if value is None else pc.equal(keys, value)
+                part = batch.filter(mask).remove_column(index)
+                if value not in writers:
+                    folder = "__HIVE_DEFAULT_PARTITION__" if value is None else value
+                    relative = f"{SNAPSHOT_PARTITION}={folder}/part-0.parquet"
+                    paths[relative] = os.path.join(directory, relative)
+                    os.makedirs(os.path.dirname(paths[relative]), exist_ok=True)
+                    writers[value] = pq.ParquetWriter(paths[relative], file_schema)
+                writers[value].write_batch(part)
+    finally:
+        for writer in writers.values():
+            writer.close()
+    return paths
+
+
+def save_replacing(key, content):
+    # AWS_S3_FILE_OVERWRITE = False: при существующем ключе хранилище выдало бы новое имя
+    if default_storage.exists(key):
+        default_storage.delete(key)
+    return default_storage.save(key, content)
+
+
+def read_manifest(key=SNAPSHOT_LATEST):
+    if not default_storage.exists(key):
+        return None
+    with default_storage.open(key, 'rb') as f:
+        return json.loads(f.read().decode('utf-8'))
+
+
+def write_registry_snapshot(batch_size=SNAPSHOT_BATCH_SIZE):
+    """Пишет снимок в хранилище, обновляет latest.json и удаляет старые снимки. Возвращает манифест."""
+    import pyarrow as pa  # Опциональная зависимость: нужна только для снимков
+
+    now = timezone.now()
+    prefix = f"{SNAPSHOT_ROOT}/{now:%Y%m%dT%H%M%SZ}"
+    schema = pa.schema([pa.field(name, arrow_type(pa, field)) for name, field in snapshot_columns()])
+    queryset = ChemicalElement.objects.filter(status=ChemicalElement.Status.PUBLISHED).order_by('id')
+    stats = {'rows': 0}
+
+    files = []
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = write_partitions(pa, iter_snapshot_batches(pa, queryset, schema, stats, batch_size), schema, tmp)
+        for relative, path in sorted(paths.items()):
+            with open(path, 'rb') as f:
+                files.append(default_storage.save(f"{prefix}/{relative}", File(f)))
+
+    manifest = {
+        "created_at": now.isoformat(),
+        "prefix": prefix,
+        "rows": stats['rows'],
+        "partitioning": [SNAPSHOT_PARTITION],
+        "columns": schema.names,
+        "files": files,
+    }
+    content = json.dumps(manifest, ensure_ascii=False).encode('utf-8')
+    default_storage.save(f"{prefix}/manifest.json", ContentFile(content))
+    save_replacing(SNAPSHOT_LATEST, ContentFile(content))
+
+    prune_snapshots()
+    return manifest
+
+
+def prune_snapshots(keep=SNAPSHOT_KEEP):
+    """Оставляем keep последних снимков: имена папок - время, сортируются по порядку. Вызывается после записи."""
+    folders, _ = default_storage.listdir(SNAPSHOT_ROOT)
+    for folder in sorted(folders)[:-keep]:
+        manifest = read_manifest(f"{SNAPSHOT_ROOT}/{folder}/manifest.json")
+        if manifest is None:
+            continue
+        for key in manifest['files']:
+            default_storage.delete(key)
+        default_storage.delete(f"{SNAPSHOT_ROOT}/{folder}/manifest.json")
@@ -0,0 +1,50 @@
+import re
+
+from registry.models import ElementSynonym, Sec1Identification
+
+# =========================================================================
+# СИНОНИМЫ: ТАБЛИЦА ДЛЯ ТОЧНОГО И ПРЕФИКСНОГО ПОИСКА
+# =========================================================================
+# В карточке синонимы - одно текстовое поле через запятую. Для поиска по
+# торговым названиям (таможня) каждый синоним лежит отдельной строкой
+# ElementSynonym с нормализованным ключом под B-tree индексом.
+# sync_synonyms вызывают: сигнал сохранения секции I, импорт (create/merge),
+# load_registry и миграция с первичным заполнением.
+
+
+def normalize_term(text):
+    """Ключ поиска: регистр, ё/е и лишние пробелы не важны."""
+    return " ".join(text.casefold().replace('ё', 'е').split())
+
+
+def split_synonyms(synonyms):
+    return [s.strip() for s in re.split(r'[,;\n]', synonyms or '') if s.strip()]
+
+
+def synonym_rows(element_id, synonyms):
+    seen, rows = set(), []
+    for name in split_synonyms(synonyms):
+        key = normalize_term(name)
+        if key not in seen:
+            seen.add(key)
+            rows.append(ElementSynonym(element_id=element_id, name=name, key=key))
+    return rows
+
+
+def sync_synonyms(element_ids):
+    """
+    Пересобирает строки синонимов веществ по текущему полю synonyms.
+    element_ids - список, queryset или подзапрос id.
+    """
+    rows = []
+    for element_id, synonyms in Sec1Identification.objects.filter(element_id__in=element_ids).values_list('element_id', 'synonyms'):
+        rows.extend(synonym_rows(element_id, synonyms))
+    ElementSynonym.objects.filter(element_id__in=element_ids).delete()
+    ElementSynonym.objects.bulk_create(rows, batch_size=1000)
+    return len(rows)
+
+
+def synonym_match(q):
+    """id веществ, у которых есть синоним, совпадающий с запросом или начинающийся с него."""
+    key = normalize_term(q)
+    return ElementSynonym.objects.filter(key__startswith=key).values('element_id')
@@ -1,48 +1,454 @@
-import io
 import os
-from celery import shared_task
+import shutil
+import tempfile
+import time
+import uuid
+import zipfile
+from celery import chord, shared_task
+from celery.exceptions import Ignore
+from celery.result import AsyncResult, allow_join_result
+from django.core.cache import cache
+from django.core.files.base import ContentFile, File
 from django.contrib.auth import get_user_model
 from django.core.files.storage import default_storage
 from django.core.mail import send_mail
 from django.conf import settings
-from .services import process_excel_import
+from django.db import transaction
+from django.db.models import Sum
+from django.utils import timezone
+from .models import ChemicalElement, ImportJob, RegistryConfig
+from .autocomplete import rebuild_index
+from .exports import (
+    export_download_url, export_file_name, export_job_key, export_result, get_export_columns, write_export
+)
+from .readers import ShardRowReader, open_import_reader, write_shards
+from .services import (
+    FILE_READ_ERROR, IMPORT_MODE_CREATE, IMPORT_SHARD_ROWS,
+    import_progress_meta, import_rows, merge_import_reports, validate_rows
+)
+from .search import filter_elements, fuzzy_thresholds, update_search_vectors
+from .snapshots import write_registry_snapshot
+from .passports import (
+    PASSPORT_RENDER_TIMEOUT, get_passport, passport_keys, passport_render_lock, passport_template_hash
+)
 
 User = get_user_model()
 
-@shared_task(bind=True)
-def import_excel_task(self, file_path_key, user_id):
+# Задачи импорта подтверждаются брокеру только после выполнения: если воркер умер
+# (деплой, OOM), брокер отдаст задачу другому воркеру, и она продолжит с контрольной точки
+RESUMABLE = dict(bind=True, acks_late=True, reject_on_worker_lost=True)
+
+
+def _run_job_rows(job, reader, on_progress=None):
+    """Импорт строк задачи с ее контрольной точки; чекпоинт пишется вместе с каждой пачкой."""
+    return import_rows(
+        reader, job.created_by, on_progress=on_progress, mode=job.mode,
+        resume_after=job.committed_row, on_chunk=job.record_chunk
+    )
+
+
+@shared_task(**RESUMABLE)
+def import_excel_task(self, job_id):
+    job = ImportJob.objects.select_related('created_by').get(pk=job_id)
+    if job.status == ImportJob.Status.DONE:
+        return _import_result(job.report())
+
     try:
-        user = User.objects.get(id=user_id)
+        job.set_status(ImportJob.Status.RUNNING)
+
+        # Перезапуск после нарезки: части уже есть, доделываем незавершенные
+        if job.shards.exists():
+            return _run_shards(self, job)
 
         # Статус: Скачивание
         self.update_state(state='PROGRESS', meta={'progress': 5, 'message': 'Скачивание...'})
 
+        if not default_storage.exists(job.file_key):
+            job.set_status(ImportJob.Status.FAILED, f"Файл не найден: {job.file_key}")
+            return _import_result(job.report())
+
+        started_at = time.time()
+
+        # Файл читаем потоком прямо из хранилища (без f.read() в память).
+        # S3/MinIO буферизует объект во временный файл на диске (AWS_S3_MAX_MEMORY_SIZE).
+        # Формат (xlsx/csv/jsonl/parquet) - по расширению ключа
+        with default_storage.open(job.file_key, 'rb') as f:
+            try:
+                reader = open_import_reader(f, job.file_key)
+            except Exception as e:
+                default_storage.delete(job.file_key)
+                job.set_status(ImportJob.Status.FAILED, FILE_READ_ERROR.format(str(e)))
+                return _import_result(job.report())
+
+            with reader:
+                total = reader.row_count
+
+                # Небольшой файл - импортируем здесь же, с реальным прогрессом по строкам.
+                # Если число строк заранее неизвестно (CSV, JSONL) - его посчитает нарезка на шарды
+                if total is not None and total <= IMPORT_SHARD_ROWS:
+                    job.total_rows = total
+                    job.save(update_fields=['total_rows'])
+
+                    def on_progress(n):
+                        self.update_state(state='PROGRESS', meta=import_progress_meta(job.processed_rows, total, started_at))
+
+                    _run_job_rows(job, reader, on_progress=on_progress)
+                    return _finish_job(job)
+
+                # Большой файл - режем на шарды (один проход по книге)
+                self.update_state(state='PROGRESS', meta={'progress': 0, 'message': 'Разбиение файла на части...'})
+
+                def save_shard(number, content):
+                    return default_storage.save(f"{job.file_key}.shards/{number:05d}.jsonl", ContentFile(content))
+
+                shard_keys, total = write_shards(reader, save_shard, IMPORT_SHARD_ROWS)
+
+        # Части фиксируем одной транзакцией: после перезапуска нарезка не повторяется
+        with transaction.atomic():
+            job.total_rows = total
+            job.save(update_fields=['total_rows'])
+            ImportJob.objects.bulk_create([
+                ImportJob(
+                    created_by=job.created_by, parent=job, file_name=job.file_name,
+                    file_key=key, mode=job.mode, task_id=job.task_id
+                )
+                for key in shard_keys
+            ])
+        return _run_shards(self, job)
+
+    except Ignore:
+        raise
+    except Exception as e:
+        job.set_status(ImportJob.Status.FAILED, f"Системная ошибка: {str(e)}")
+        return _import_result(job.report())
+
+
+def _run_shards(task, job):
+    """Части параллельно, отчеты склеивает callback. Итог хорда станет результатом задачи."""
+    workflow = chord(
+        [import_shard_task.s(shard.id, time.time()) for shard in job.shards.order_by('pk')],
+        merge_import_reports_task.s(job.id)
+    )
+    # allow_join_result нужен только в EAGER режиме (тесты): там хорд выполняется синхронно
+    with allow_join_result():
+        return task.replace(workflow)
+
+
+def _finish_job(job):
+    """Итог задачи: статус DONE и уборка исходного файла."""
+    if default_storage.exists(job.file_key):
+        default_storage.delete(job.file_key)
+    job.set_status(ImportJob.Status.DONE)
+    return _import_result(job.report())
+
+
+def _import_result(report):
+    result = {
+        "status": "DONE",
+        "imported": report.get('success', 0),
+        "errors": report.get('errors', [])
+    }
+    # Режим merge: сколько найденных по CAS обновлено и сколько пропущено без изменений
+    for key in ('updated', 'unchanged'):
+        if key in report:
+            result[key] = report[key]
+    return result
+
+
+@shared_task(**RESUMABLE)
+def import_shard_task(self, shard_id, started_at):
+    """Импорт одной части большого файла. Прогресс пишет в статус родительской задачи."""
+    shard = ImportJob.objects.select_related('created_by', 'parent').get(pk=shard_id)
+    if shard.status == ImportJob.Status.DONE:
+        return shard.report()
+
+    try:
+        shard.set_status(ImportJob.Status.RUNNING)
+        parent = shard.parent
+
+        def on_progress(n):
+            done = parent.shards.aggregate(done=Sum('processed_rows'))['done'] or 0
+            self.update_state(
+                task_id=parent.task_id, state='PROGRESS',
+                meta=import_progress_meta(done, parent.total_rows, started_at)
+            )
+
+        with default_storage.open(shard.file_key, 'rb') as f:
+            with ShardRowReader(f) as reader:
+                _run_job_rows(shard, reader, on_progress=on_progress)
+
+        _finish_job(shard)
+        return shard.report()
+
+    except Exception as e:
+        shard.set_status(ImportJob.Status.FAILED, f"Системная ошибка ({shard.file_key}): {str(e)}")
+        return shard.report()
+
+
+@shared_task
+def merge_import_reports_task(reports, job_id):
+    """Callback хорда: общий отчет из сохраненных отчетов частей + уборка исходного файла."""
+    job = ImportJob.objects.get(pk=job_id)
+    merged = merge_import_reports([shard.report() for shard in job.shards.order_by('pk')])
+    job.errors = merged.pop("errors")
+    job.counters = merged
+    job.processed_rows = job.total_rows or 0
+    job.save(update_fields=['errors', 'counters', 'processed_rows', 'updated_at'])
+
+    # Часть упала - задача остается незавершенной: повторная загрузка файла доделает ее
+    if job.shards.exclude(status=ImportJob.Status.DONE).exists():
+        job.set_status(ImportJob.Status.FAILED)
+        return _import_result(job.report())
+    return _finish_job(job)
+
+
+@shared_task(bind=True)
+def validate_import_task(self, file_path_key, mode=IMPORT_MODE_CREATE):
+    """Dry-run импорта: проверка файла целиком без записи в БД. Файл после проверки удаляется."""
+    try:
+        self.update_state(state='PROGRESS', meta={'progress': None, 'message': 'Проверка файла...'})
+
         if not default_storage.exists(file_path_key):
-             return {"imported": 0, "errors": [f"Файл не найден: {file_path_key}"]}
+            return {"status": "DONE", "dry_run": True, "errors": [f"Файл не найден: {file_path_key}"]}
+
+        try:
+            with default_storage.open(file_path_key, 'rb') as f:
+                try:
+                    reader = open_import_reader(f, file_path_key)
+                except Exception as e:
+                    return {"status": "DONE", "dry_run": True, "errors": [FILE_READ_ERROR.format(str(e))]}
+
+                with reader:
+                    report = validate_rows(reader, mode=mode)
+        finally:
+            default_storage.delete(file_path_key)
 
-        # Скачиваем из S3/MinIO в память
-        with default_storage.open(file_path_key, 'rb') as f:
-            file_content = f.read()
+        return {"status": "DONE", "dry_run": True, **report}
 
-        file_in_memory = io.BytesIO(file_content)
+    except Exception as e:
+        return {"status": "DONE", "dry_run": True, "errors": [f"Системная ошибка: {str(e)}"]}
 
-        # Статус: Парсинг
-        self.update_state(state='PROGRESS', meta={'progress': 10, 'message': 'Парсинг Excel...'})
 
-        # Запуск сервиса
-        report = process_excel_import(file_in_memory, user)
+@shared_task(bind=True)
+def export_elements_task(self, user_id, params, file_format='xlsx'):
+    """
+    Фоновый экспорт: те же права, поиск и фильтры, что у списка (params - параметры запроса).
+    Файл пишется во временный файл воркера и сохраняется в default_storage (exports/<task_id>.<формат>).
+    """
+    try:
+        user = User.objects.get(pk=user_id)
+        queryset = filter_elements(ChemicalElement.objects.all(), user, params)
+        columns = get_export_columns(RegistryConfig.objects.first())
+        with fuzzy_thresholds(queryset):
+            total = queryset.count()
+        started_at = time.time()
 
-        # Чистим за собой (удаляем временный файл из S3)
-        default_storage.delete(file_path_key)
+        def on_progress(done):
+            self.update_state(state='PROGRESS', meta=import_progress_meta(done, total, started_at, label='Экспорт'))
 
-        return {
-            "status": "DONE",
-            "imported": report.get('success', 0),
-            "errors": report.get('errors', [])
-        }
+        on_progress(0)
+        with tempfile.TemporaryFile() as tmp:
+            write_export(queryset, columns, file_format, tmp, on_progress)
+            tmp.seek(0)
+            key = default_storage.save(f"exports/{self.request.id}.{file_format}", File(tmp))
 
+        return export_result(key, total, export_file_name(file_format, timezone.localdate()))
     except Exception as e:
-        return {"imported": 0, "errors": [f"Системная ошибка: {str(e)}"]}
+        # Ошибка - результат задачи, а не FAILURE: фронтенд получает понятный ответ при опросе
+        return {"status": "ERROR", "message": f"Системная ошибка: {str(e)}"}
+    finally:
+        # Снимаем отметку "такая выгрузка уже идет", только если она наша
+        job_key = export_job_key(user_id, params, file_format)
+        if cache.get(job_key) == self.request.id:
+            cache.delete(job_key)
+
+
+@shared_task(bind=True)
+def render_passport_task(self, element_id, base_url, lock_key=None, batch=None):
+    """
+    Рендер PDF-паспорта в хранилище. Идет в отдельную очередь "pdf" (CELERY_TASK_ROUTES),
+    которую слушает свой воркер с ограниченной concurrency - WeasyPrint не отнимает воркеры API и импорта.
+    batch - (id, всего, started_at) пакета паспортов: прогресс пишется в его статус.
+    """
+    try:
+        key = get_passport(element_id, base_url)
+    except Exception as e:
+        # WeasyPrint или хранилище: ошибка - результат задачи, опрос статуса увидит ERROR
+        return {"status": "ERROR", "message": f"Паспорт {element_id}: {str(e)}"}
+    finally:
+        # Снимаем отметку "паспорт рендерится", только если она наша
+        if lock_key and cache.get(lock_key) == self.request.id:
+            cache.delete(lock_key)
+        if batch:
+            _passport_batch_progress(self, *batch)
+
+    file_name = f"passport_{element_id}.pdf"
+    return {
+        "status": "DONE",
+        "export": True,
+        "file": key,
+        "file_name": file_name,
+        "disposition": "inline",
+        "url": export_download_url(key, file_name, disposition='inline'),
+    }
+
+
+def start_passport_render(element_id, key, base_url):
+    """
+    Рендер паспорта версии key - один на все запросы: если он уже идет, возвращаем его задачу.
+    Возвращает (AsyncResult, duplicate).
+    """
+    lock_key = passport_render_lock(key)
+    task_id = str(uuid.uuid4())
+    if not cache.add(lock_key, task_id, PASSPORT_RENDER_TIMEOUT):
+        running = cache.get(lock_key)
+        if running and not AsyncResult(running).ready():
+            return AsyncResult(running), True
+        cache.set(lock_key, task_id, PASSPORT_RENDER_TIMEOUT)
+    return render_passport_task.apply_async((element_id, base_url, lock_key), task_id=task_id), False
+
+
+def prerender_passport(element_id):
+    """Рендер паспорта заранее (после публикации), чтобы первый посетитель получил готовый файл."""
+    keys = passport_keys([element_id])
+    if element_id in keys and not default_storage.exists(keys[element_id]):
+        start_passport_render(element_id, keys[element_id], settings.PASSPORT_BASE_URL)
+
+
+# Обход опубликованных веществ после выкладки нового шаблона: за запуск ставим
+# в очередь "pdf" не больше PASSPORT_PRERENDER_MAX_ITEMS рендеров, остальное - в следующий
+PASSPORT_PRERENDER_MAX_ITEMS = 2000
+PASSPORT_PRERENDER_CHUNK = 500
+# Хэш шаблона, для которого все паспорта уже есть: пока шаблон тот же, задача ничего не делает
+PASSPORT_PRERENDER_DONE_KEY = "passports-prerendered-template"
+
+
+@shared_task
+def rerender_stale_passports_task():
+    """Периодически (CELERY_BEAT_SCHEDULE): паспорта всех опубликованных веществ под текущий шаблон."""
+    template_hash = passport_template_hash()
+    if cache.get(PASSPORT_PRERENDER_DONE_KEY) == template_hash:
+        return {"status": "DONE", "queued": 0}
+
+    ids = list(ChemicalElement.objects.filter(status=ChemicalElement.Status.PUBLISHED).order_by('id').values_list('id', flat=True))
+    queued = 0
+    for start in range(0, len(ids), PASSPORT_PRERENDER_CHUNK):
+        for pk, key in passport_keys(ids[start:start + PASSPORT_PRERENDER_CHUNK]).items():
+            if default_storage.exists(key):
+                continue
+            if queued >= PASSPORT_PRERENDER_MAX_ITEMS:
+                return {"status": "DONE", "queued": queued, "more": True}
+            start_passport_render(pk, key, settings.PASSPORT_BASE_URL)
+            queued += 1
+
+    # Шаблон отмечается пройденным, только когда недостающих паспортов не осталось:
+    # поставленные рендеры могут упасть, следующий запуск их повторит
+    if not queued:
+        cache.set(PASSPORT_PRERENDER_DONE_KEY, template_hash, None)
+    return {"status": "DONE", "queued": queued}
+
+
+# Пакет паспортов: не больше PASSPORT_BATCH_MAX_ITEMS веществ за раз. Сколько рендеров идет
+# одновременно, ограничивает concurrency воркера очереди "pdf"
+PASSPORT_BATCH_MAX_ITEMS = 500
+
+
+def passport_batch_done_key(batch_id):
+    # Счетчик готовых паспортов пакета: рендеры идут параллельно, считаем атомарным INCR
+    return f"passport-batch-done:{batch_id}"
+
+
+def _passport_batch_progress(task, batch_id, total, started_at):
+    """Прогресс в статус пакета после каждого рендера (как import_shard_task - в статус импорта)."""
+    try:
+        done = cache.incr(passport_batch_done_key(batch_id))
+    except ValueError:
+        return  # счетчик истек - пакет давно собран
+    task.update_state(
+        task_id=batch_id, state='PROGRESS',
+        meta=import_progress_meta(done, total, started_at, label='Паспорта')
+    )
+
+
+@shared_task(bind=True)
+def passport_batch_task(self, element_ids, base_url):
+    """
+    ZIP с паспортами веществ в хранилище (exports/<task_id>.zip). Готовые PDF берутся из хранилища,
+    недостающие рендерятся задачами render_passport_task, архив собирает callback хорда -
+    задача не ждет подзадачи и не держит воркер, если очередь "pdf" стоит.
+    """
+    keys = passport_keys(element_ids[:PASSPORT_BATCH_MAX_ITEMS])
+    files = {pk: key for pk, key in keys.items() if default_storage.exists(key)}
+    missing = [pk for pk in keys if pk not in files]
+    if not missing:
+        return build_passport_zip(self.request.id, files, [])
+
+    # Готовые PDF уже посчитаны, дальше счетчик растет с каждым рендером
+    started_at = time.time()
+    cache.set(passport_batch_done_key(self.request.id), len(files), PASSPORT_RENDER_TIMEOUT * len(missing))
+    self.update_state(state='PROGRESS', meta=import_progress_meta(len(files), len(keys), started_at, label='Паспорта'))
+    batch = (self.request.id, len(keys), started_at)
+    workflow = chord(
+        [render_passport_task.s(pk, base_url, batch=batch) for pk in missing],
+        passport_batch_zip_task.s(self.request.id, list(files.items()), missing)
+    )
+    # Итог хорда станет результатом задачи (как в _run_shards)
+    with allow_join_result():
+        return self.replace(workflow)
+
+
+@shared_task
+def passport_batch_zip_task(results, batch_id, ready, missing):
+    """Callback пакета: results - итоги render_passport_task в порядке missing."""
+    cache.delete(passport_batch_done_key(batch_id))
+    files, errors = dict(ready), []
+    for pk, result in zip(missing, results):
+        if result.get('status') == 'ERROR':
+            errors.append(result['message'])
+        else:
+            files[pk] = result['file']
+    return build_passport_zip(batch_id, files, errors)
+
+
+def build_passport_zip(batch_id, files, errors):
+    with tempfile.TemporaryFile() as tmp:
+        # PDF уже сжаты - складываем без сжатия
+        with zipfile.ZipFile(tmp, 'w', zipfile.ZIP_STORED) as archive:
+            for pk in sorted(files):
+                with default_storage.open(files[pk], 'rb') as src, archive.open(f"passport_{pk}.pdf", 'w') as dst:
+                    shutil.copyfileobj(src, dst)
+        tmp.seek(0)
+        key = default_storage.save(f"exports/{batch_id}.zip", File(tmp))
+
+    result = export_result(key, len(files), f"passports_{timezone.localdate():%Y%m%d}.zip")
+    result["errors"] = errors
+    return result
+
+
+SEARCH_INDEX_CHUNK = 5000
+
+
+@shared_task
+def rebuild_search_index_task():
+    """Полный пересчет поисковых документов (после смены настроек) - пачками по id, короткими транзакциями."""
+    config_obj = RegistryConfig.objects.first()
+    ids = list(ChemicalElement.objects.order_by('id').values_list('id', flat=True))
+    for start in range(0, len(ids), SEARCH_INDEX_CHUNK):
+        update_search_vectors(ids[start:start + SEARCH_INDEX_CHUNK], config_obj)
+    return {"status": "DONE", "rows": len(ids)}
+
+
+@shared_task
+def rebuild_autocomplete_task():
+    """Полная пересборка индекса подсказок (ночью и после выкладки) - точечные обновления делают сигналы."""
+    return {"status": "DONE", "rows": rebuild_index()}
+
+
+@shared_task
+def snapshot_registry_task():
+    """Ночной снимок опубликованного реестра в Parquet (расписание - CELERY_BEAT_SCHEDULE)."""
+    manifest = write_registry_snapshot()
+    return {"status": "DONE", "rows": manifest["rows"], "prefix": manifest["prefix"]}
 
 
 @shared_task
@@ -1,8 +1,9 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from .views import (
-    DownloadTemplateView, ImportElementsView,
-    ChemicalElementViewSet, StatisticsView, TaskStatusView, PublicConfigView
+    DownloadTemplateView, ImportElementsView, ValidateImportView,
+    ChemicalElementViewSet, StatisticsView, TaskStatusView, PublicConfigView, RegistrySnapshotView,
+    ChangeFeedView
 )
 
 router = DefaultRouter()
@@ -14,6 +15,9 @@ urlpatterns = [
     # Импорт и экспорт
     path('import/template/', DownloadTemplateView.as_view(), name='download-template'),
     path('import/upload/', ImportElementsView.as_view(), name='import-upload'),
+    path('import/validate/', ValidateImportView.as_view(), name='import-validate'),
+    path('snapshot/latest/', RegistrySnapshotView.as_view(), name='snapshot-latest'),
+    path('changes/', ChangeFeedView.as_view(), name='change-feed'),
 
     # Новое: Асинхронный статус и Статистика
     path('tasks/<str:task_id>/', TaskStatusView.as_view(), name='task-status'),
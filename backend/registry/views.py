@@ -1,14 +1,17 @@
 import os
+import uuid
+from urllib.parse import urlencode
 from django.conf import settings
 from django.db.models import Count, TextField, Value, Q, F
 from django.db.models.functions import Cast, Coalesce
-from django.contrib.postgres.search import TrigramSimilarity
-from django.template.loader import render_to_string
-from django.http import HttpResponse
+from django.http import FileResponse, HttpResponse, HttpResponseRedirect, StreamingHttpResponse
+from django.utils import timezone
 from django.core.files.storage import default_storage
-from django.core.files.base import ContentFile
 from django.utils.decorators import method_decorator
 from django.views.decorators.cache import cache_page
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+from django.core.cache import cache
 
 from rest_framework import viewsets, filters, status
 from rest_framework.views import APIView
@@ -17,17 +20,31 @@ from rest_framework.parsers import MultiPartParser, FormParser
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.decorators import action
 from celery.result import AsyncResult
-from weasyprint import HTML
+from storages.backends.s3boto3 import S3Boto3Storage
 
-from .models import ChemicalElement, RegistryConfig, ElementAttachment, Sec1Identification
+from .models import ChemicalElement, RegistryConfig, ElementAttachment, Sec1Identification, ImportJob
 from .permissions import IsOwnerOrReadOnly
 from .serializers import (
     ChemicalElementDetailSerializer,
     ChemicalElementListSerializer,
     ElementAttachmentSerializer
 )
-from .services import generate_excel_template
-from .tasks import import_excel_task
+from .services import excel_template_version, get_excel_template, file_sha256, IMPORT_MODE_CREATE, IMPORT_MODES
+from .exports import (
+    EXPORT_CONTENT_TYPES, EXPORT_FORMATS, EXPORT_JOB_TIMEOUT,
+    export_download_url, export_file_name, export_job_key, get_export_columns, stream_export
+)
+from .tasks import (
+    PASSPORT_BATCH_MAX_ITEMS, export_elements_task, import_excel_task, passport_batch_task,
+    start_passport_render, validate_import_task, _import_result
+)
+from .readers import get_reader_class
+from .changes import CHANGE_FEED_MAX_PAGE_SIZE, CHANGE_FEED_PAGE_SIZE, get_changes, parse_cursor
+from .search import filter_elements, fuzzy_thresholds
+from .cas import cas_query
+from .autocomplete import get_suggestions
+from .snapshots import read_manifest
+from .passports import current_passport_key
 from .structures import SECTION_MAP
 
 
@@ -78,13 +95,68 @@ class DownloadTemplateView(APIView):
     permission_classes = [AllowAny]
 
     def get(self, request):
-        wb = generate_excel_template()
-        response = HttpResponse(content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
-        response['Content-Disposition'] = 'attachment; filename=tmpl.xlsx'
-        wb.save(response)
+        # Один легкий запрос настроек; сама книга - из кэша по версии
+        config = RegistryConfig.objects.first()
+        version = excel_template_version(config)
+        etag = f'"{version}"'
+        last_modified = int(config.updated_at.timestamp()) if config and config.updated_at else None
+
+        # Повторное скачивание той же версии - 304 без тела
+        not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if not_modified is None:
+            content, _ = get_excel_template(config)
+            response = HttpResponse(content, content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
+            response['Content-Disposition'] = 'attachment; filename=tmpl.xlsx'
+        else:
+            response = not_modified
+
+        response['ETag'] = etag
+        if last_modified:
+            response['Last-Modified'] = http_date(last_modified)
+        # Браузер хранит файл, но каждый раз сверяет версию
+        patch_cache_control(response, no_cache=True)
         return response
 
 
+class RegistrySnapshotView(APIView):
+    """Стабильная ссылка на последний Parquet-снимок: манифест + ссылки на файлы разделов."""
+    permission_classes = [AllowAny]
+
+    def get(self, request):
+        manifest = read_manifest()
+        if manifest is None:
+            return Response({"error": "Снимок еще не сформирован"}, status=404)
+        manifest['files'] = [
+            {"key": key, "url": export_download_url(key, os.path.basename(key))}
+            for key in manifest['files']
+        ]
+        return Response(manifest)
+
+
+class ChangeFeedView(APIView):
+    """
+    Лента изменений опубликованного реестра: ?since=<ISO-время> для начала (например created_at снимка),
+    дальше ?cursor=<cursor из ответа>. next - ссылка на следующую страницу.
+    """
+    permission_classes = [AllowAny]
+
+    def get(self, request):
+        value = request.query_params.get('cursor') or request.query_params.get('since')
+        if not value:
+            return Response({"error": "Укажите since или cursor"}, status=400)
+        try:
+            cursor = parse_cursor(value)
+            limit = min(int(request.query_params.get('limit', CHANGE_FEED_PAGE_SIZE)), CHANGE_FEED_MAX_PAGE_SIZE)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=400)
+
+        data = get_changes(cursor, max(limit, 1))
+        data['next'] = request.build_absolute_uri(
+            f"{request.path}?{urlencode({'cursor': data['cursor'], 'limit': limit})}"
+        )
+        return Response(data)
+
+
 class ImportElementsView(APIView):
     permission_classes = [IsAuthenticated]
     parser_classes = [MultiPartParser]
@@ -93,10 +165,53 @@ class ImportElementsView(APIView):
         f = request.FILES.get('file')
         if not f: return Response({"error":"no file"}, 400)
 
-        file_path = f"imports/{request.user.id}_{f.name}"
-        saved_path = default_storage.save(file_path, ContentFile(f.read()))
-
-        task = import_excel_task.delay(saved_path, request.user.id)
+        # Формат определяется по расширению: .xlsx, .csv, .jsonl/.ndjson, .parquet
+        try:
+            get_reader_class(f.name)
+        except ValueError as e:
+            return Response({"error": str(e)}, 400)
+
+        # create - только новые вещества, merge - обновление существующих по CAS
+        mode = request.data.get('mode') or IMPORT_MODE_CREATE
+        if mode not in IMPORT_MODES:
+            return Response({"error": f"Неизвестный режим импорта: {mode}"}, 400)
+
+        return self.start(request, f, mode)
+
+    @staticmethod
+    def save_upload(request, f):
+        # Отдаем файл хранилищу как есть: большие загрузки уже лежат во временном файле
+        return default_storage.save(f"imports/{request.user.id}_{f.name}", f)
+
+    def start(self, request, f, mode):
+        # Тот же файл (по SHA-256) повторно не импортируем: отдаем уже идущую или готовую задачу
+        file_hash = file_sha256(f)
+        job = ImportJob.objects.filter(
+            created_by=request.user, parent=None, file_hash=file_hash, mode=mode
+        ).order_by('-created_at').first()
+
+        if job and not job.is_stalled():
+            code = 200 if job.status == ImportJob.Status.DONE else 202
+            return Response({"task_id": job.task_id, "job_id": job.id, "duplicate": True}, code)
+
+        # Новая задача или продолжение упавшей/зависшей с ее контрольной точки
+        if job is None:
+            job = ImportJob(created_by=request.user, file_name=f.name, file_hash=file_hash, mode=mode)
+        if job.pk is None or (not job.shards.exists() and not default_storage.exists(job.file_key)):
+            job.file_key = self.save_upload(request, f)
+        job.status = ImportJob.Status.PENDING
+        job.task_id = str(uuid.uuid4())
+        job.save()
+
+        import_excel_task.apply_async((job.id,), task_id=job.task_id)
+        return Response({"task_id": job.task_id, "job_id": job.id}, 202)
+
+
+class ValidateImportView(ImportElementsView):
+    """Dry-run: та же загрузка, но файл только проверяется (ничего не пишется в БД)."""
+
+    def start(self, request, f, mode):
+        task = validate_import_task.delay(self.save_upload(request, f), mode)
         return Response({"task_id": task.id}, 202)
 
 
@@ -106,8 +221,27 @@ class TaskStatusView(APIView):
     def get(self, req, task_id):
         res = AsyncResult(task_id)
         data = {'status': res.status}
-        if res.ready():
+        if res.failed():
+            # Исключение задачи в JSON не сериализуется - отдаем текст
+            data['result'] = {'status': 'ERROR', 'message': str(res.result)}
+        elif res.ready():
             data['result'] = res.result
+            if isinstance(res.result, dict) and res.result.get('status') == 'ERROR':
+                # Задача поймала ошибку сама (экспорт, паспорт) - для клиента это тоже неуспех
+                data['status'] = 'ERROR'
+            elif isinstance(res.result, dict) and res.result.get('export'):
+                # Подписанная ссылка на выгрузку истекает - выдаем свежую
+                data['result'] = {**res.result, 'url': export_download_url(
+                    res.result['file'], res.result['file_name'], res.result.get('disposition', 'attachment')
+                )}
+        elif res.status == 'PENDING':
+            # Результат Celery мог истечь (CELERY_RESULT_EXPIRES) - отчет импорта хранится в БД
+            job = ImportJob.objects.filter(task_id=task_id, parent=None).first()
+            if job and job.status == ImportJob.Status.DONE:
+                data = {'status': 'SUCCESS', 'result': _import_result(job.report())}
+        elif res.status == 'PROGRESS' and isinstance(res.info, dict):
+            # Прогресс импорта: progress (%), processed/total (строки), eta (сек), message
+            data['progress'] = res.info
         return Response(data)
 
 
@@ -143,78 +277,77 @@ class ChemicalElementViewSet(viewsets.ModelViewSet):
             # Если нужно показывать hazard_class в списке, джойним только эту таблицу
             qs = qs.select_related('sec11_class')
 
-        # 2. PERMISSIONS
-        if user.is_staff:
-            pass
-        elif user.is_authenticated:
-            qs = qs.filter(Q(status='PUBLISHED') | Q(created_by=user))
-        else:
-            qs = qs.filter(status='PUBLISHED')
+        # 2-4. Права, поиск, фильтры - общие со списком и фоновым экспортом
+        return filter_elements(qs, user, self.request.query_params)
 
-        # 3. SMART SEARCH (ОПТИМИЗИРОВАННЫЙ)
-        q = self.request.query_params.get('search')
-        if q:
-            q = q.strip()
-            # Базовый быстрый поиск (использует индексы)
-            base_search = Q(primary_name_ru__icontains=q) | Q(cas_number__icontains=q)
-
-            # Расширенный поиск по другим полям (если настроено)
-            config = RegistryConfig.objects.first()
-            if config and config.public_list_fields:
-                extra_search = Q()
-                searchable_fields = set(config.public_list_fields)
-                # Убираем уже добавленные в base_search
-                searchable_fields.discard('primary_name_ru')
-                searchable_fields.discard('cas_number')
-
-                for _, _, model_cls, fields_list in SECTION_MAP:
-                    if model_cls == ChemicalElement: continue # Пропускаем, уже обработали
-
-                    prefix = ""
-                    try:
-                        prefix = model_cls._meta.get_field('element').remote_field.name + "__"
-                    except: continue
-
-                    for _, db_field, _ in fields_list:
-                        if db_field in searchable_fields:
-                            extra_search |= Q(**{f"{prefix}{db_field}__icontains": q})
-
-                qs = qs.filter(base_search | extra_search).distinct()
-            else:
-                # Если конфига нет, ищем только по базе + синонимам (самое чаcтое)
-                qs = qs.filter(
-                    base_search |
-                    Q(sec1_identification__synonyms__icontains=q) |
-                    Q(sec1_identification__molecular_formula__icontains=q)
-                ).distinct()
-
-        # 4. ФИЛЬТРАЦИЯ ПО ПОЛЯМ (FACETS)
-        FIELD_LOOKUP_MAP = {}
-        for _, _, model_cls, fields_list in SECTION_MAP:
-            prefix = ""
-            if model_cls != ChemicalElement:
-                try:
-                    prefix = model_cls._meta.get_field('element').remote_field.name + "__"
-                except: continue
-
-            for _, db_field, _ in fields_list:
-                FIELD_LOOKUP_MAP[db_field] = prefix + db_field
-
-        for param, value in self.request.query_params.items():
-            if param in FIELD_LOOKUP_MAP and value:
-                lookup = FIELD_LOOKUP_MAP[param]
-                if str(value).lower() == 'true':
-                    qs = qs.filter(**{lookup: True})
-                elif str(value).lower() == 'false':
-                    qs = qs.filter(**{lookup: False})
-                else:
-                    qs = qs.filter(**{lookup: value})
-
-        return qs
+    def paginate_queryset(self, queryset):
+        # count и страница нечеткого поиска - в одной транзакции с порогами pg_trgm
+        with fuzzy_thresholds(queryset):
+            return super().paginate_queryset(queryset)
 
     def perform_create(self, serializer):
         serializer.save(created_by=self.request.user)
 
+    # === ЭКСПОРТ (XLSX/CSV, раскладка шаблона импорта) ===
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        # Те же поиск и фильтры, что у списка; параметр не "format" - его занимает DRF
+        file_format = request.query_params.get('file_format', 'xlsx')
+        if file_format not in EXPORT_FORMATS:
+            return Response({"error": f"Неизвестный формат: {file_format}"}, status=400)
+
+        columns = get_export_columns(RegistryConfig.objects.first())
+        response = StreamingHttpResponse(
+            stream_export(self.get_queryset(), columns, file_format),
+            content_type=EXPORT_CONTENT_TYPES[file_format]
+        )
+        filename = export_file_name(file_format, timezone.localdate())
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+
+    @action(detail=False, methods=['post'], url_path='export/async', permission_classes=[IsAuthenticated])
+    def export_async(self, request):
+        # Большие выгрузки - задачей Celery: файл в хранилище, прогресс и ссылка через TaskStatusView
+        params = request.query_params.dict()
+        file_format = params.pop('file_format', 'xlsx')
+        if file_format not in EXPORT_FORMATS:
+            return Response({"error": f"Неизвестный формат: {file_format}"}, status=400)
+
+        # Та же выгрузка уже идет - отдаем ее задачу, а не запускаем вторую
+        job_key = export_job_key(request.user.id, params, file_format)
+        task_id = str(uuid.uuid4())
+        if not cache.add(job_key, task_id, EXPORT_JOB_TIMEOUT):
+            running = cache.get(job_key)
+            if running and not AsyncResult(running).ready():
+                return Response({"task_id": running, "duplicate": True}, 202)
+            cache.set(job_key, task_id, EXPORT_JOB_TIMEOUT)
+
+        export_elements_task.apply_async((request.user.id, params, file_format), task_id=task_id)
+        return Response({"task_id": task_id}, 202)
+
+    # === ПАКЕТ PDF-ПАСПОРТОВ (ZIP) ===
+    @action(detail=False, methods=['post'], url_path='passports', permission_classes=[IsAuthenticated])
+    def passports(self, request):
+        # ?ids=1,2,3 и/или фильтры списка (например класс опасности); прогресс и ссылка - через TaskStatusView
+        params = request.query_params.dict()
+        ids = params.pop('ids', '')
+        queryset = filter_elements(ChemicalElement.objects.all(), request.user, params)
+        if ids:
+            try:
+                queryset = queryset.filter(pk__in=[int(pk) for pk in ids.split(',') if pk.strip()])
+            except ValueError:
+                return Response({"error": "ids - список чисел через запятую"}, status=400)
+
+        with fuzzy_thresholds(queryset):
+            element_ids = list(queryset.order_by('id').values_list('id', flat=True)[:PASSPORT_BATCH_MAX_ITEMS + 1])
+        if not element_ids:
+            return Response({"error": "Нет веществ для паспортов"}, status=400)
+        if len(element_ids) > PASSPORT_BATCH_MAX_ITEMS:
+            return Response({"error": f"Не больше {PASSPORT_BATCH_MAX_ITEMS} паспортов за раз - уточните фильтр"}, status=400)
+
+        task = passport_batch_task.delay(element_ids, request.build_absolute_uri('/'))
+        return Response({"task_id": task.id, "total": len(element_ids)}, 202)
+
     # === ЗАГРУЗКА СТРУКТУРЫ (ИЗОБРАЖЕНИЕ) ===
     @action(detail=True, methods=['post'], parser_classes=[MultiPartParser, FormParser])
     def upload_structure(self, request, pk=None):
@@ -252,33 +385,8 @@ class ChemicalElementViewSet(viewsets.ModelViewSet):
     # === ПОДСКАЗКИ (AUTOCOMPLETE) ===
     @action(detail=False, methods=['get'], permission_classes=[AllowAny])
     def suggest(self, request):
-        q = request.query_params.get('search', '').strip()
-        if len(q) < 2: return Response([])
-
-        # Используем оптимизированный QS, но ограничиваем кол-во
-        qs = ChemicalElement.objects.filter(
-            Q(primary_name_ru__icontains=q) |
-            Q(cas_number__icontains=q) |
-            Q(status='PUBLISHED')
-        ).select_related('created_by')[:10]
-
-        suggestions = []
-        for elem in qs:
-            if q.lower() in elem.primary_name_ru.lower():
-                suggestions.append({"label": elem.primary_name_ru, "type": "Вещество", "id": elem.id})
-            elif elem.cas_number and q in elem.cas_number:
-                suggestions.append({"label": f"{elem.cas_number} ({elem.primary_name_ru})", "type": "CAS", "id": elem.id})
-            else:
-                suggestions.append({"label": elem.primary_name_ru, "type": "Совпадение", "id": elem.id})
-
-        # Убираем дубли
-        seen = set()
-        unique = []
-        for s in suggestions:
-            if s['label'] not in seen:
-                unique.append(s)
-                seen.add(s['label'])
-        return Response(unique[:10])
+        # Только опубликованные вещества, из префиксного индекса в Redis (registry.autocomplete)
+        return Response(get_suggestions(request.query_params.get('search', '')))
 
     # === ФАСЕТЫ (СЧЕТЧИКИ ФИЛЬТРОВ) ===
     @action(detail=False, methods=['get'], permission_classes=[AllowAny])
@@ -299,9 +407,10 @@ class ChemicalElementViewSet(viewsets.ModelViewSet):
         q = request.query_params.get('search')
         if q:
             # Упрощенная фильтрация для фасетов (только по основным полям для скорости)
+            cas_lookup = cas_query(q)
             qs = qs.filter(
                 Q(primary_name_ru__icontains=q) |
-                Q(cas_number__icontains=q)
+                (Q(**cas_lookup) if cas_lookup else Q(cas_number__icontains=q))
             )
 
         # Перебираем поля и считаем агрегации
@@ -346,20 +455,31 @@ class ChemicalElementViewSet(viewsets.ModelViewSet):
     # === ГЕНЕРАЦИЯ PDF ПАСПОРТА ===
     @action(detail=True, methods=['get'], permission_classes=[AllowAny])
     def pdf(self, r, pk=None):
-        # Для PDF нужно подгрузить все данные
-        elem = ChemicalElement.objects.select_related(
-            'sec1_identification', 'sec2_physical', 'sec3_sanpin', 'sec4_air',
-            'sec5_acute', 'sec6_risks', 'sec8_ecotox', 'sec9_soil',
-            'sec10_water', 'sec11_class', 'sec12_ghs', 'sec13_label',
-            'sec14_safety', 'sec15_storage', 'sec16_waste', 'sec17_incidents',
-            'sec18_intl', 'sec20_docs', 'sec21_companies', 'sec22_volumes',
-            'sec23_extra'
-        ).get(pk=pk)
-
-        html = render_to_string('registry/passport_pdf.html', {'element': elem})
-        # Используем base_url чтобы weasyprint мог найти картинки/шрифты
-        pdf_file = HTML(string=html, base_url=r.build_absolute_uri('/')).write_pdf()
-
-        response = HttpResponse(pdf_file, content_type='application/pdf')
-        response['Content-Disposition'] = f'inline; filename="passport_{pk}.pdf"'
-        return response
\ No newline at end of file
+        # Готовый паспорт отдаем сразу; иначе рендер в очереди "pdf", клиент опрашивает TaskStatusView
+        try:
+            key = current_passport_key(pk)
+        except ChemicalElement.DoesNotExist:
+            return Response({"error": "Вещество не найдено"}, status=404)
+        if default_storage.exists(key):
+            return self.passport_response(key, pk)
+
+        # Один рендер на версию паспорта, сколько бы запросов ни пришло
+        result, duplicate = start_passport_render(int(pk), key, r.build_absolute_uri('/'))
+        if duplicate:
+            return Response({"task_id": result.id, "duplicate": True}, 202)
+        if result.ready():
+            # Рендер уже завершился (eager-режим в тестах)
+            rendered = result.get()
+            if rendered.get('status') == 'ERROR':
+                return Response({"error": rendered['message']}, status=500)
+            return self.passport_response(rendered['file'], pk)
+        return Response({"task_id": result.id}, 202)
+
+    @staticmethod
+    def passport_response(key, pk):
+        filename = f"passport_{pk}.pdf"
+        if isinstance(default_storage, S3Boto3Storage):
+            # Файл отдает MinIO по подписанной ссылке, а не воркер Django
+            return HttpResponseRedirect(export_download_url(key, filename, disposition='inline'))
+        return FileResponse(default_storage.open(key), content_type='application/pdf',
+                            as_attachment=False, filename=filename)
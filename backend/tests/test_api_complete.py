@@ -99,6 +99,178 @@ class TestAdminActions:
         assert response.status_code == 200
         assert response['Content-Type'] == 'application/pdf'
 
+    def test_pdf_served_from_storage_until_section_saved(self, api_client, supplier, django_capture_on_commit_callbacks):
+        """Паспорт рендерится один раз на версию; правка секции удаляет сохраненный файл."""
+        from django.core.files.storage import default_storage
+        from registry import passports
+
+        elem = ChemicalElement.objects.create(created_by=supplier, status='PUBLISHED', primary_name_ru="Кэш PDF")
+        with patch.object(passports, 'render_passport', return_value=b'%PDF-1.4 cached') as render:
+            first = api_client.get(f'/api/registry/elements/{elem.id}/pdf/')
+            second = api_client.get(f'/api/registry/elements/{elem.id}/pdf/')
+            assert b''.join(second.streaming_content) == b'%PDF-1.4 cached'
+            assert render.call_count == 1
+            old_key = passports.get_passport(elem.id, '/')
+            assert default_storage.exists(old_key)
+
+            with django_capture_on_commit_callbacks(execute=True):
+                Sec2Physical.objects.create(element=elem, color="Белый")
+            assert not default_storage.exists(old_key)
+
+            api_client.get(f'/api/registry/elements/{elem.id}/pdf/')
+            assert render.call_count == 2
+        assert first.status_code == 200
+        assert api_client.get('/api/registry/elements/999999/pdf/').status_code == 404
+
+    def test_pdf_concurrent_requests_share_render(self, api_client, supplier):
+        """Пока паспорт рендерится, запросы получают 202 с id той же задачи."""
+        from django.core.cache import cache
+        from registry.passports import current_passport_key, passport_render_lock
+
+        elem = ChemicalElement.objects.create(created_by=supplier, status='PUBLISHED', primary_name_ru="Очередь PDF")
+        lock_key = passport_render_lock(current_passport_key(elem.id))
+        cache.set(lock_key, 'running-pdf-task')
+        try:
+            response = api_client.get(f'/api/registry/elements/{elem.id}/pdf/')
+        finally:
+            cache.delete(lock_key)
+        assert response.status_code == 202
+        assert response.data == {'task_id': 'running-pdf-task', 'duplicate': True}
+
+    def test_pdf_render_error_is_reported(self, api_client, supplier):
+        """Сбой рендера - ответ с текстом ошибки, отметка о рендере снята (следующий запрос попробует снова)."""
+        from django.core.cache import cache
+        from registry import passports
+
+        elem = ChemicalElement.objects.create(created_by=supplier, status='PUBLISHED', primary_name_ru="Сбой PDF")
+        with patch.object(passports, 'render_passport', side_effect=ValueError("шрифт не найден")):
+            response = api_client.get(f'/api/registry/elements/{elem.id}/pdf/')
+        assert response.status_code == 500
+        assert "шрифт не найден" in response.data['error']
+        assert cache.get(passports.passport_render_lock(passports.current_passport_key(elem.id))) is None
+
+    def test_passport_batch_zip(self, auth_client, supplier):
+        """Пакет паспортов: ZIP в хранилище, готовые PDF не рендерятся повторно, лимит на размер пакета."""
+        import zipfile
+        from django.core.files.storage import default_storage
+        from registry import passports, tasks
+
+        elements = [
+            ChemicalElement.objects.create(created_by=supplier, status='PUBLISHED', primary_name_ru=f"Пакет {i}")
+            for i in range(3)
+        ]
+        ids = ",".join(str(e.id) for e in elements)
+        with patch.object(passports, 'render_passport', return_value=b'%PDF-1.4 batch') as render:
+            passports.get_passport(elements[0].id, '/')
+            response = auth_client.post(f'/api/registry/elements/passports/?ids={ids}')
+            assert response.status_code == 202 and response.data['total'] == 3
+            assert render.call_count == 3
+
+        result = auth_client.get(f"/api/registry/tasks/{response.data['task_id']}/").data['result']
+        assert result['rows'] == 3 and result['errors'] == []
+        with default_storage.open(result['file']) as f:
+            archive = zipfile.ZipFile(f)
+            assert sorted(archive.namelist()) == sorted(f"passport_{e.id}.pdf" for e in elements)
+            assert archive.read(f"passport_{elements[1].id}.pdf") == b'%PDF-1.4 batch'
+
+        with patch.object(tasks, 'PASSPORT_BATCH_MAX_ITEMS', 2), patch('registry.views.PASSPORT_BATCH_MAX_ITEMS', 2):
+            assert auth_client.post(f'/api/registry/elements/passports/?ids={ids}').status_code == 400
+
+        # Сбой рендера одного паспорта - строка в errors, остальные попадают в архив
+        broken = ChemicalElement.objects.create(created_by=supplier, status='PUBLISHED', primary_name_ru="Пакет сбой")
+        with patch.object(passports, 'render_passport', side_effect=ValueError("шрифт не найден")):
+            response = auth_client.post(f'/api/registry/elements/passports/?ids={elements[0].id},{broken.id}')
+        result = auth_client.get(f"/api/registry/tasks/{response.data['task_id']}/").data['result']
+        assert result['rows'] == 1 and "шрифт не найден" in result['errors'][0]
+
+    def test_passport_batch_reports_progress_per_item(self, auth_client, supplier):
+        """Статус пакета растет с каждым отрендеренным паспортом, а не замирает до сборки ZIP."""
+        from django.core.cache import cache
+        from registry import passports
+        from registry.tasks import passport_batch_done_key
+
+        elements = [
+            ChemicalElement.objects.create(created_by=supplier, status='PUBLISHED', primary_name_ru=f"Прогресс {i}")
+            for i in range(3)
+        ]
+        seen = []
+
+        def render(element, base_url):
+            # Промежуточный статус пакета - так же, как его видит фронтенд при опросе
+            batch_id = cache.keys(passport_batch_done_key('*'))[0].split(':')[-1]
+            status = auth_client.get(f'/api/registry/tasks/{batch_id}/').data
+            seen.append((status['status'], status['progress']['processed']))
+            return b'%PDF-1.4 progress'
+
+        with patch.object(passports, 'render_passport', return_value=b'%PDF-1.4 ready'):
+            passports.get_passport(elements[0].id, '/')
+        with patch.object(passports, 'render_passport', side_effect=render):
+            ids = ",".join(str(e.id) for e in elements)
+            response = auth_client.post(f'/api/registry/elements/passports/?ids={ids}')
+
+        assert seen == [('PROGRESS', 1), ('PROGRESS', 2)]
+        result = auth_client.get(f"/api/registry/tasks/{response.data['task_id']}/").data
+        assert result['status'] == 'SUCCESS' and result['result']['rows'] == 3
+        assert cache.keys(passport_batch_done_key('*')) == []
+
+    def test_passport_prerendered_on_publish(self, supplier, django_capture_on_commit_callbacks):
+        """Публикация ставит рендер паспорта в очередь; периодический обход дорисовывает недостающие."""
+        from django.core.cache import cache
+        from django.core.files.storage import default_storage
+        from registry import passports
+        from registry.tasks import PASSPORT_PRERENDER_DONE_KEY, rerender_stale_passports_task
+
+        elem = ChemicalElement.objects.create(created_by=supplier, status='PENDING', primary_name_ru="Публикация")
+        other = ChemicalElement.objects.create(created_by=supplier, status='PUBLISHED', primary_name_ru="Без паспорта")
+        with patch.object(passports, 'render_passport', return_value=b'%PDF-1.4 published') as render:
+            with django_capture_on_commit_callbacks(execute=True):
+                elem.status = 'PUBLISHED'
+                elem.save()
+            assert render.call_count == 1
+            assert default_storage.exists(passports.current_passport_key(elem.id))
+
+            cache.delete(PASSPORT_PRERENDER_DONE_KEY)
+            assert rerender_stale_passports_task.delay().get()['queued'] == 1
+            assert default_storage.exists(passports.current_passport_key(other.id))
+            # Все паспорта есть - шаблон отмечен пройденным, следующие запуски ничего не делают
+            assert rerender_stale_passports_task.delay().get()['queued'] == 0
+            assert cache.get(PASSPORT_PRERENDER_DONE_KEY) is not None
+            assert render.call_count == 2
+        cache.delete(PASSPORT_PRERENDER_DONE_KEY)
+
+    def test_failed_prerender_is_retried(self, supplier):
+        """Упавший рендер не отмечает шаблон пройденным - следующий обход ставит его снова."""
+        from django.core.cache import cache
+        from django.core.files.storage import default_storage
+        from registry import passports
+        from registry.tasks import PASSPORT_PRERENDER_DONE_KEY, rerender_stale_passports_task
+
+        elem = ChemicalElement.objects.create(created_by=supplier, status='PUBLISHED', primary_name_ru="Сбой обхода")
+        cache.delete(PASSPORT_PRERENDER_DONE_KEY)
+        with patch.object(passports, 'render_passport', side_effect=ValueError("шрифт не найден")):
+            assert rerender_stale_passports_task.delay().get()['queued'] == 1
+        assert cache.get(PASSPORT_PRERENDER_DONE_KEY) is None
+
+        with patch.object(passports, 'render_passport', return_value=b'%PDF-1.4 retry') as render:
+            assert rerender_stale_passports_task.delay().get()['queued'] == 1
+            assert render.call_count == 1
+        assert default_storage.exists(passports.current_passport_key(elem.id))
+        cache.delete(PASSPORT_PRERENDER_DONE_KEY)
+
+    def test_passport_renderer_fetches_media_from_storage(self):
+        """Картинки из media рендерер берет из хранилища, а не HTTP-запросом к серверу."""
+        from django.conf import settings
+        from django.core.files.base import ContentFile
+        from django.core.files.storage import default_storage
+        from registry.passports import get_renderer
+
+        name = default_storage.save('structures/benzene.png', ContentFile(b'\x89PNG fake'))
+        with patch('registry.passports.default_url_fetcher') as http_fetch:
+            fetched = get_renderer().fetch('http://testserver/', settings.MEDIA_URL + name)
+        assert fetched['string'] == b'\x89PNG fake' and fetched['mime_type'] == 'image/png'
+        http_fetch.assert_not_called()
+        assert get_renderer() is get_renderer()
+
     def test_statistics(self, api_client, supplier):
         ChemicalElement.objects.create(created_by=supplier, status='PUBLISHED')
         ChemicalElement.objects.create(created_by=supplier, status='DRAFT')
@@ -0,0 +1,63 @@
+import io
+import pytest
+from django.core.management import call_command
+from registry.models import ChemicalElement, Sec2Physical, Sec8EcoTox
+
+
+@pytest.mark.django_db
+class TestLoadRegistryCommand:
+
+    def test_copy_load_with_validation_and_history(self, supplier, tmp_path):
+        """COPY-загрузка: значения списков и Да/Нет, ошибки по строкам, секции и первая версия истории."""
+        ChemicalElement.objects.create(primary_name_ru="Уже есть", cas_number="67-64-1", created_by=supplier)
+        path = tmp_path / "legacy.csv"
+        path.write_text(
+            "Название вещества (RU);CAS номер;Агрегатное состояние;Биоаккумуляция (+/-);Цвет\n"
+            "Бензол;71-43-2;Жидкость;да;Бесцветный\n"
+            "Толуол;108-88-3;GAS;нет;\n"
+            ";;;;\n"
+            "Ацетон;67-64-1;;;\n"
+            "Дубль;71-43-2;;;\n"
+            ";50-00-0;Плазма;может быть;\n",
+            encoding='utf-8'
+        )
+        out, err = io.StringIO(), io.StringIO()
+
+        call_command('load_registry', str(path), user=supplier.username, status='PUBLISHED', stdout=out, stderr=err)
+
+        assert "Загружено: 2 из 6 строк, ошибок: 5" in out.getvalue()
+        errors = err.getvalue()
+        assert "Строка 5: Вещество с CAS '67-64-1' уже есть в реестре" in errors
+        assert "Строка 6: CAS '71-43-2' повторяется (уже в строке 2)" in errors
+        assert "Строка 7: Отсутствует 'Название вещества (RU)'" in errors
+        assert "значения 'Плазма' нет в списке допустимых" in errors
+
+        benzene = ChemicalElement.objects.get(cas_number='71-43-2')
+        assert benzene.status == 'PUBLISHED' and benzene.created_by == supplier
+        assert benzene.cas_normalized == '71432'
+        assert benzene.sec2_physical.appearance == 'LIQUID'
+        assert benzene.sec2_physical.color == 'Бесцветный'
+        assert benzene.sec8_ecotox.bioaccumulation is True
+        assert hasattr(benzene, 'sec23_extra')
+
+        toluene = ChemicalElement.objects.get(cas_number='108-88-3')
+        assert toluene.sec2_physical.odor == Sec2Physical._meta.get_field('odor').default
+        assert Sec8EcoTox.objects.get(element=toluene).bioaccumulation is False
+
+        version = benzene.history.get()
+        assert version.history_type == '+' and version.history_user == supplier
+        assert benzene.sec2_physical.history.get().appearance == 'LIQUID'
+
+        # Новые записи получают id из той же последовательности
+        later = ChemicalElement.objects.create(primary_name_ru="После загрузки", created_by=supplier)
+        assert later.pk > toluene.pk
+
+    def test_dry_run_rolls_back(self, supplier, tmp_path):
+        path = tmp_path / "legacy.csv"
+        path.write_text("primary_name_ru,cas_number\nБензол,71-43-2\n", encoding='utf-8')
+        out = io.StringIO()
+
+        call_command('load_registry', str(path), user=supplier.username, dry_run=True, stdout=out)
+
+        assert "Проверено (без записи): 1 из 1 строк" in out.getvalue()
+        assert ChemicalElement.objects.count() == 0
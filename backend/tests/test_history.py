@@ -0,0 +1,83 @@
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from registry.models import ChemicalElement, Sec2Physical
+from registry.history import deferred_history
+
+
+@pytest.mark.django_db
+class TestDeferredHistory:
+
+    def test_deferred_history_matches_regular_saves(self, supplier, admin_user):
+        """Отложенная история: те же версии (тип, поля, автор), но один INSERT на таблицу истории."""
+        elements = [
+            ChemicalElement.objects.create(primary_name_ru=f"Вещество {i}", created_by=supplier, status='PENDING')
+            for i in range(5)
+        ]
+
+        with CaptureQueriesContext(connection) as ctx:
+            with deferred_history(user=admin_user):
+                for elem in elements:
+                    elem.status = 'PUBLISHED'
+                    elem.save()
+                    Sec2Physical.objects.create(element=elem, color="Белый")
+
+        history_inserts = [q for q in ctx.captured_queries if q['sql'].startswith('INSERT INTO "registry_historical')]
+        assert len(history_inserts) == 2
+
+        for elem in elements:
+            latest = elem.history.first()
+            assert latest.history_type == '~'
+            assert latest.status == 'PUBLISHED'
+            assert latest.history_user == admin_user
+            assert elem.history.count() == 2
+            section = elem.sec2_physical.history.get()
+            assert section.history_type == '+' and section.color == "Белый"
+
+        # Версии в порядке сохранения, дата - момент save(), а не момент записи пачки
+        dates = [elem.history.first().history_date for elem in elements]
+        assert dates == sorted(dates)
+
+        # После выхода из режима история снова пишется как обычно
+        elements[0].status = 'DRAFT'
+        elements[0].save()
+        assert elements[0].history.count() == 3
+
+    def test_deferred_history_does_not_hold_saved_objects(self, supplier):
+        """Бэкфилл: сохраненные объекты не копятся в буфере до конца блока."""
+        import gc
+
+        with deferred_history(batch_size=10) as writer:
+            for i in range(25):
+                ChemicalElement.objects.create(primary_name_ru=f"Бэкфилл {i}", created_by=supplier)
+            gc.collect()
+            assert len(writer.owned) == 0
+
+        assert ChemicalElement.history.count() == 25
+
+    def test_deferred_history_keeps_skipped_saves(self, supplier):
+        """save_without_historical_record внутри режима по-прежнему не создает версию."""
+        elem = ChemicalElement.objects.create(primary_name_ru="Без истории", created_by=supplier)
+
+        with deferred_history():
+            elem.primary_name_ru = "Тихо"
+            elem.save_without_historical_record()
+
+        assert elem.history.count() == 1
+
+    def test_deferred_history_prefers_request_user(self, supplier, admin_user, rf):
+        """user по умолчанию не перекрывает автора запроса - как у обычного save()."""
+        from simple_history.models import HistoricalRecords
+
+        elem = ChemicalElement.objects.create(primary_name_ru="Автор", created_by=supplier)
+        request = rf.get('/')
+        request.user = supplier
+        HistoricalRecords.context.request = request
+        try:
+            with deferred_history(user=admin_user):
+                elem.status = 'PUBLISHED'
+                elem.save()
+        finally:
+            del HistoricalRecords.context.request
+
+        assert elem.history.first().history_user == supplier
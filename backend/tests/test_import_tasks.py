@@ -0,0 +1,155 @@
+import io
+import pytest
+import pandas as pd
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from registry.models import ChemicalElement, ImportJob
+from registry import tasks
+
+
+def save_excel(rows, name="imports/test.xlsx"):
+    output = io.BytesIO()
+    pd.DataFrame(rows).to_excel(output, index=False)
+    return default_storage.save(name, ContentFile(output.getvalue()))
+
+
+def run_import(key, user, **kwargs):
+    job = ImportJob.objects.create(created_by=user, file_key=key, task_id=f"task-{key}", **kwargs)
+    return tasks.import_excel_task.apply((job.id,), task_id=job.task_id).get()
+
+
+@pytest.mark.django_db
+class TestImportTasks:
+
+    def test_sharded_import_merges_reports(self, supplier, monkeypatch):
+        """Большой файл режется на шарды, отчеты склеиваются в один (в EAGER режиме)."""
+        monkeypatch.setattr(tasks, 'IMPORT_SHARD_ROWS', 3)
+        rows = [{'Название вещества (RU)': f'Шард {i}', 'CAS номер': f'300-00-{i}'} for i in range(8)]
+        rows[5]['Название вещества (RU)'] = ''
+        key = save_excel(rows)
+
+        result = run_import(key, supplier)
+
+        assert result["status"] == "DONE"
+        assert result['imported'] == 7
+        assert result['errors'] == ["Строка 7: Отсутствует 'Название вещества (RU)'"]
+        assert ChemicalElement.objects.count() == 7
+        assert not default_storage.exists(key)
+        assert not default_storage.exists(f"{key}.shards/00000.jsonl")
+        job = ImportJob.objects.get(parent=None)
+        assert job.status == ImportJob.Status.DONE
+        assert job.shards.count() == 3
+        assert job.report()['success'] == 7
+
+    def test_validate_task_does_not_write(self, supplier):
+        """Dry-run задача: отчет с матрицей ошибок, в БД ничего не появляется, файл удаляется."""
+        key = save_excel([
+            {'Название вещества (RU)': 'Ацетон', 'CAS номер': '67-64-1'},
+            {'Название вещества (RU)': '', 'CAS номер': '71-43-2'},
+        ])
+
+        result = tasks.validate_import_task.delay(key).get()
+
+        assert result['dry_run'] is True
+        assert result['rows'] == 2 and result['valid_rows'] == 1
+        assert result['matrix'] == [{'row': 3, 'cells': {'Название вещества (RU)': "Отсутствует 'Название вещества (RU)'"}}]
+        assert ChemicalElement.objects.count() == 0
+        assert not default_storage.exists(key)
+
+    def test_progress_meta(self):
+        from registry.services import import_progress_meta
+        meta = import_progress_meta(250, 1000, started_at=0)
+        assert meta['progress'] == 25
+        assert meta['processed'] == 250 and meta['total'] == 1000
+        assert meta['eta'] is not None
+
+    def test_import_formats_share_pipeline(self, supplier):
+        """CSV (cp1251, ';'), JSON Lines и Parquet идут тем же конвейером; колонки - заголовки или имена полей БД."""
+        csv_key = default_storage.save(
+            "imports/erp.csv",
+            ContentFile("Название вещества (RU);cas_number;Цвет\nАцетон;67-64-1;Бесцветный\n".encode('cp1251'))
+        )
+        jsonl_key = default_storage.save(
+            "imports/erp.jsonl",
+            ContentFile(
+                '{"primary_name_ru": "Бензол", "cas_number": "71-43-2", "bioaccumulation": true}\n'
+                '\n'
+                '{"primary_name_ru": "", "cas_number": "1-1-1"}\n'.encode('utf-8')
+            )
+        )
+        parquet = io.BytesIO()
+        pd.DataFrame({'primary_name_ru': ['Толуол'], 'cas_number': ['108-88-3'], 'Цвет': [None]}).to_parquet(parquet)
+        parquet_key = default_storage.save("imports/erp.parquet", ContentFile(parquet.getvalue()))
+
+        assert run_import(csv_key, supplier)['imported'] == 1
+        result = run_import(jsonl_key, supplier)
+        assert result['imported'] == 1
+        assert result['errors'] == ["Строка 3: Отсутствует 'Название вещества (RU)'"]
+        assert run_import(parquet_key, supplier)['imported'] == 1
+
+        assert ChemicalElement.objects.get(cas_number='67-64-1').sec2_physical.color == 'Бесцветный'
+        assert ChemicalElement.objects.get(cas_number='71-43-2').sec8_ecotox.bioaccumulation is True
+        assert ChemicalElement.objects.filter(cas_number='108-88-3').exists()
+
+    def test_jsonl_columns_missing_from_first_record(self, supplier):
+        """Поля, которых нет в первом объекте (ERP опускает пустые), импортируются из следующих."""
+        key = default_storage.save(
+            "imports/sparse.jsonl",
+            ContentFile(
+                '{"primary_name_ru": "Ацетон"}\n'
+                '{"primary_name_ru": "Бензол", "cas_number": "71-43-2", "Цвет": "Бесцветный"}\n'.encode('utf-8')
+            )
+        )
+        assert run_import(key, supplier)['imported'] == 2
+        assert ChemicalElement.objects.get(cas_number='71-43-2').sec2_physical.color == 'Бесцветный'
+
+    def test_restarted_job_resumes_from_checkpoint(self, supplier, monkeypatch):
+        """Перезапуск задачи: закоммиченные пачки не импортируются повторно, отчет накапливается."""
+        from registry import services
+        monkeypatch.setattr(services, 'IMPORT_BATCH_SIZE', 2)
+        key = save_excel([{'Название вещества (RU)': f'Вещество {i}', 'CAS номер': f'400-00-{i}'} for i in range(5)])
+        job = ImportJob.objects.create(created_by=supplier, file_key=key, task_id='task-resume')
+
+        # Воркер "умирает" на третьей пачке: две пачки (строки 2-5) уже закоммичены
+        real_flush = services._flush_import_batch
+        calls = []
+
+        def dying_flush(batch, *args):
+            calls.append(batch)
+            if len(calls) == 3:
+                raise SystemExit("worker lost")
+            return real_flush(batch, *args)
+
+        monkeypatch.setattr(services, '_flush_import_batch', dying_flush)
+        with pytest.raises(SystemExit):
+            tasks.import_excel_task.apply((job.id,), task_id=job.task_id)
+
+        job.refresh_from_db()
+        assert job.committed_row == 5
+        assert ChemicalElement.objects.count() == 4
+
+        monkeypatch.setattr(services, '_flush_import_batch', real_flush)
+        result = tasks.import_excel_task.apply((job.id,), task_id=job.task_id).get()
+
+        assert result['imported'] == 5
+        assert result['errors'] == []
+        assert ChemicalElement.objects.count() == 5
+
+    def test_same_file_upload_is_idempotent(self, auth_client):
+        """Повторная загрузка того же файла возвращает прежнюю задачу, а не импортирует заново."""
+        output = io.BytesIO()
+        pd.DataFrame([{'Название вещества (RU)': 'Ацетон', 'CAS номер': '67-64-1'}]).to_excel(output, index=False)
+
+        def upload():
+            file = ContentFile(output.getvalue(), name='same.xlsx')
+            return auth_client.post('/api/registry/import/upload/', {'file': file}, format='multipart')
+
+        first = upload()
+        assert first.status_code == 202
+        second = upload()
+
+        assert second.status_code == 200
+        assert second.data['duplicate'] is True
+        assert second.data['task_id'] == first.data['task_id']
+        assert ImportJob.objects.count() == 1
+        assert ChemicalElement.objects.count() == 1
@@ -119,4 +119,163 @@ class TestRegistryWorkFlow:
         assert len(result['errors']) > 0
         # Проверяем наличие текста об ошибке
         errors_str = str(result['errors'])
-        assert "CAS номер" in errors_str or "cas_number" in errors_str
\ No newline at end of file
+        assert "CAS номер" in errors_str or "cas_number" in errors_str
+
+    def test_template_cached_with_etag(self, api_client):
+        """Шаблон отдается из кэша по версии; та же версия -> 304, сохранение настроек -> новая версия."""
+        config = RegistryConfig.objects.create(required_fields=['cas_number'])
+
+        first = api_client.get('/api/registry/import/template/')
+        assert first.status_code == 200
+        etag = first['ETag']
+        assert first['Last-Modified']
+
+        again = api_client.get('/api/registry/import/template/', HTTP_IF_NONE_MATCH=etag)
+        assert again.status_code == 304
+        assert again.content == b''
+
+        config.required_fields = ['cas_number', 'ph']
+        config.save()
+        changed = api_client.get('/api/registry/import/template/', HTTP_IF_NONE_MATCH=etag)
+        assert changed.status_code == 200
+        assert changed['ETag'] != etag
+        assert changed.content != first.content
+
+    def test_export_round_trips_through_import(self, api_client, supplier):
+        """Экспорт: фильтры как у списка, раскладка шаблона - файл загружается обратно без изменений."""
+        from registry.services import IMPORT_MODE_MERGE, process_excel_import, process_file_import
+
+        df = pd.DataFrame([
+            {'Название вещества (RU)': 'Ацетон', 'CAS номер': '67-64-1', 'Агрегатное состояние': 'Жидкость', 'Биоаккумуляция (+/-)': 'да'},
+            {'Название вещества (RU)': 'Бензол', 'CAS номер': '71-43-2', 'Цвет': 'Бесцветный'},
+        ])
+        output = io.BytesIO()
+        df.to_excel(output, index=False)
+        output.seek(0)
+        process_excel_import(output, supplier)
+        ChemicalElement.objects.update(status='PUBLISHED')
+        ChemicalElement.objects.create(primary_name_ru='Черновик', created_by=supplier)
+
+        # Гость видит только опубликованные; поиск сужает выборку
+        response = api_client.get('/api/registry/elements/export/')
+        assert response.status_code == 200
+        assert response['Content-Disposition'].endswith('.xlsx"')
+        xlsx = b''.join(response.streaming_content)
+
+        csv_response = api_client.get('/api/registry/elements/export/', {'file_format': 'csv', 'search': 'Бензол'})
+        lines = b''.join(csv_response.streaming_content).decode('utf-8-sig').splitlines()
+        assert len(lines) == 2
+        assert lines[0].startswith('Название вещества (RU) *;CAS номер;')
+        assert 'Бесцветный' in lines[1]
+
+        report = process_excel_import(io.BytesIO(xlsx), supplier, mode=IMPORT_MODE_MERGE)
+        assert report == {'success': 0, 'errors': [], 'updated': 0, 'unchanged': 2}
+
+        csv_report = process_file_import(io.BytesIO('\n'.join(lines).encode('utf-8')), 'export.csv', supplier, mode=IMPORT_MODE_MERGE)
+        assert csv_report['unchanged'] == 1
+
+        assert api_client.get('/api/registry/elements/export/', {'file_format': 'pdf'}).status_code == 400
+
+    def test_async_export_to_storage(self, auth_client, supplier):
+        """Фоновый экспорт: файл в хранилище, ссылка в статусе задачи, одинаковые запросы не дублируются."""
+        from django.core.cache import cache
+        from django.core.files.storage import default_storage
+        from registry.exports import export_job_key
+
+        ChemicalElement.objects.create(primary_name_ru='Ацетон', cas_number='67-64-1', created_by=supplier)
+        ChemicalElement.objects.create(primary_name_ru='Бензол', cas_number='71-43-2', created_by=supplier)
+
+        response = auth_client.post('/api/registry/elements/export/async/?file_format=csv&search=Ацетон')
+        assert response.status_code == 202
+        task_id = response.data['task_id']
+
+        result = auth_client.get(f'/api/registry/tasks/{task_id}/').data['result']
+        assert result['rows'] == 1 and result['file_name'].endswith('.csv')
+        assert result['url']
+        with default_storage.open(result['file']) as f:
+            lines = f.read().decode('utf-8-sig').splitlines()
+        assert len(lines) == 2 and lines[1].startswith('Ацетон;67-64-1')
+        # Задача сняла отметку о себе - следующий такой же запрос запустит новую выгрузку
+        assert cache.get(export_job_key(supplier.id, {'search': 'Ацетон'}, 'csv')) is None
+
+        # Пока такая же выгрузка идет, возвращаем ее задачу
+        cache.set(export_job_key(supplier.id, {}, 'xlsx'), 'running-export-task')
+        response = auth_client.post('/api/registry/elements/export/async/')
+        assert response.data == {'task_id': 'running-export-task', 'duplicate': True}
+        cache.delete(export_job_key(supplier.id, {}, 'xlsx'))
+
+    def test_async_export_error_is_reported(self, auth_client, supplier, monkeypatch):
+        """Сбой выгрузки - ответ со статусом ERROR и текстом, а не 500 при опросе."""
+        def broken(*args, **kwargs):
+            raise ValueError("диск заполнен")
+        monkeypatch.setattr('registry.tasks.write_export', broken)
+
+        task_id = auth_client.post('/api/registry/elements/export/async/?file_format=csv').data['task_id']
+        response = auth_client.get(f'/api/registry/tasks/{task_id}/')
+        assert response.status_code == 200
+        assert response.data['status'] == 'ERROR'
+        assert "диск заполнен" in response.data['result']['message']
+
+    def test_parquet_snapshot_of_published(self, supplier):
+        """Снимок: только опубликованные, секции плоскими колонками, разбиение по классу опасности."""
+        import pyarrow.parquet as pq
+        from rest_framework.test import APIClient
+        from django.core.files.storage import default_storage
+        from registry.tasks import snapshot_registry_task
+
+        published = ChemicalElement.objects.create(primary_name_ru='Ацетон', cas_number='67-64-1', created_by=supplier, status='PUBLISHED')
+        Sec2Physical.objects.create(element=published, color='Бесцветный')
+        ChemicalElement.objects.create(primary_name_ru='Черновик', created_by=supplier)
+
+        assert snapshot_registry_task.delay().get()['rows'] == 1
+
+        response = APIClient().get('/api/registry/snapshot/latest/')
+        assert response.status_code == 200
+        assert response.data['rows'] == 1 and 'created_by' not in response.data['columns']
+        [part] = response.data['files']
+        assert '/sec11_class__sanpin_class=' in part['key'] and part['url']
+
+        with default_storage.open(part['key']) as f:
+            table = pq.read_table(f)
+        row = table.to_pylist()[0]
+        assert row['primary_name_ru'] == 'Ацетон' and row['sec2_physical__color'] == 'Бесцветный'
+        assert table.num_rows == 1
+
+    def test_change_feed_since_watermark(self, supplier, monkeypatch):
+        """Лента изменений: правка секции двигает updated_at, снятие с публикации и удаление - deleted."""
+        from datetime import timedelta
+        from rest_framework.test import APIClient
+        from registry import changes
+
+        monkeypatch.setattr(changes, 'CHANGE_FEED_LAG', timedelta(0))
+        client = APIClient()
+        acetone = ChemicalElement.objects.create(primary_name_ru='Ацетон', created_by=supplier, status='PUBLISHED')
+        benzene = ChemicalElement.objects.create(primary_name_ru='Бензол', created_by=supplier, status='PUBLISHED')
+        draft = ChemicalElement.objects.create(primary_name_ru='Черновик', created_by=supplier)
+        Sec2Physical.objects.create(element=draft, color='Серый')
+
+        first = client.get('/api/registry/changes/', {'since': '2000-01-01T00:00:00+00:00', 'limit': 1}).data
+        assert [c['action'] for c in first['changes']] == ['created'] and first['has_more']
+        second = client.get('/api/registry/changes/', {'cursor': first['cursor']}).data
+        assert [c['id'] for c in second['changes']] == [benzene.id]
+        assert second['changes'][0]['element']['primary_name_ru'] == 'Бензол'
+
+        # Правка только секции - вещество снова в ленте
+        watermark = second['cursor']
+        before = acetone.updated_at
+        Sec2Physical.objects.create(element=acetone, color='Бесцветный')
+        acetone.refresh_from_db()
+        assert acetone.updated_at > before
+        section_feed = client.get('/api/registry/changes/', {'cursor': watermark}).data
+        assert [(c['id'], c['action']) for c in section_feed['changes']] == [(acetone.id, 'updated')]
+        assert section_feed['changes'][0]['element']['sec2_physical__color'] == 'Бесцветный'
+        benzene.status = 'DRAFT'
+        benzene.save()
+        acetone_id = acetone.id
+        acetone.delete()
+
+        feed = client.get('/api/registry/changes/', {'cursor': watermark}).data
+        actions = {c['id']: c['action'] for c in feed['changes']}
+        assert actions == {benzene.id: 'deleted', acetone_id: 'deleted'}
+        assert not feed['has_more']
+        assert client.get('/api/registry/changes/').status_code == 400
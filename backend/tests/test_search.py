@@ -0,0 +1,203 @@
+import io
+import pytest
+from rest_framework.test import APIClient
+from registry.models import ChemicalElement, Sec1Identification
+from registry.autocomplete import rebuild_index
+from registry.cas import normalize_cas
+from registry.services import process_file_import
+
+
+def search(params):
+    response = APIClient().get('/api/registry/elements/', params)
+    assert response.status_code == 200
+    return [row['primary_name_ru'] for row in response.data['results']]
+
+
+@pytest.mark.django_db
+class TestFullTextSearch:
+
+    def test_search_document_ranks_name_above_synonyms(self, supplier):
+        """Поиск по документу: название, синонимы, IUPAC; совпадение в названии - выше."""
+        benzene = ChemicalElement.objects.create(primary_name_ru="Бензол", created_by=supplier, status='PUBLISHED')
+        toluene = ChemicalElement.objects.create(primary_name_ru="Толуол", created_by=supplier, status='PUBLISHED')
+        ChemicalElement.objects.create(primary_name_ru="Бензол технический", created_by=supplier)  # черновик
+        Sec1Identification.objects.create(element=toluene, synonyms="Метилбензол, бензол метиловый")
+        Sec1Identification.objects.create(element=benzene, iupac_name_en="Benzene")
+
+        assert search({'search': 'бензола'}) == ["Бензол", "Толуол"]
+        assert search({'search': 'benzene'}) == ["Бензол"]
+
+        # Сохранение секции пересчитывает документ
+        Sec1Identification.objects.filter(element=toluene).delete()
+        Sec1Identification.objects.create(element=toluene, molecular_formula="C7H8")
+        assert search({'search': 'бензол'}) == ["Бензол"]
+        assert search({'search': 'c7h8'}) == ["Толуол"]
+
+    def test_import_fills_search_document(self, supplier):
+        """Пакетный импорт идет мимо сигналов, но документ заполняется."""
+        content = "Название вещества (RU);Синонимы\nАцетон;Диметилкетон\n".encode('utf-8')
+        report = process_file_import(io.BytesIO(content), 'import.csv', supplier)
+        assert report['success'] == 1
+        ChemicalElement.objects.update(status='PUBLISHED')
+        assert search({'search': 'диметилкетон'}) == ["Ацетон"]
+
+    def test_fuzzy_fallback_tolerates_typos(self, supplier):
+        """Мало точных совпадений - подключается триграммный поиск по названию, синонимам и CAS."""
+        benzene = ChemicalElement.objects.create(primary_name_ru="Бензол технический", cas_number="71-43-2", created_by=supplier, status='PUBLISHED')
+        ammonia = ChemicalElement.objects.create(primary_name_ru="Аммиак водный", created_by=supplier, status='PUBLISHED')
+        ChemicalElement.objects.create(primary_name_ru="Толуол", created_by=supplier, status='PUBLISHED')
+        Sec1Identification.objects.create(element=ammonia, synonyms="Нашатырный спирт")
+        Sec1Identification.objects.create(element=benzene)
+
+        assert search({'search': 'бензолл'}) == ["Бензол технический"]
+        assert search({'search': 'Амиак'}) == ["Аммиак водный"]
+        assert search({'search': 'нашатырны спирт'}) == ["Аммиак водный"]
+        assert search({'search': '71-43-3'}) == ["Бензол технический"]
+        # Нечеткий режим можно выключить
+        assert search({'search': 'бензолл', 'fuzzy': '0'}) == []
+
+    def test_exact_matches_rank_above_fuzzy(self, supplier):
+        ChemicalElement.objects.create(primary_name_ru="Бензол", created_by=supplier, status='PUBLISHED')
+        ChemicalElement.objects.create(primary_name_ru="Бензин", created_by=supplier, status='PUBLISHED')
+        assert search({'search': 'бензол', 'fuzzy': '1'}) == ["Бензол", "Бензин"]
+
+
+@pytest.mark.django_db(transaction=True)  # SET LOCAL живет до конца транзакции - нужна настоящая
+class TestFuzzyThreshold:
+
+    def test_threshold_does_not_leak_into_connection(self, supplier):
+        """Пороги pg_trgm действуют только в транзакции нечеткого запроса."""
+        from django.db import connection
+        from registry.search import SEARCH_FUZZY_THRESHOLD
+
+        ChemicalElement.objects.create(primary_name_ru="Бензол технический", created_by=supplier, status='PUBLISHED')
+        assert search({'search': 'бензолл'}) == ["Бензол технический"]
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT current_setting('pg_trgm.word_similarity_threshold')")
+            assert cursor.fetchone()[0] != str(SEARCH_FUZZY_THRESHOLD)
+
+
+@pytest.mark.django_db
+class TestAutocomplete:
+
+    @pytest.fixture(autouse=True)
+    def empty_index(self, db):
+        rebuild_index()  # В тестовой БД пусто - индекс очищается
+
+    def suggest(self, q):
+        response = APIClient().get('/api/registry/elements/suggest/', {'search': q})
+        assert response.status_code == 200
+        return [(row['label'], row['type']) for row in response.data]
+
+    def test_index_follows_publication(self, supplier, django_capture_on_commit_callbacks):
+        """В подсказках только опубликованные; индекс обновляется при публикации, правке и удалении."""
+        with django_capture_on_commit_callbacks(execute=True):
+            benzene = ChemicalElement.objects.create(primary_name_ru="Бензол", cas_number="71-43-2", created_by=supplier)
+            ChemicalElement.objects.create(primary_name_ru="Бензин", created_by=supplier, status='PUBLISHED')
+        assert self.suggest("бенз") == [("Бензин", "Вещество")]
+
+        with django_capture_on_commit_callbacks(execute=True):
+            benzene.status = 'PUBLISHED'
+            benzene.save()
+            Sec1Identification.objects.create(element=benzene, synonyms="Циклогексатриен, Бензен")
+        assert self.suggest("бенз") == [("Бензин", "Вещество"), ("Бензол", "Вещество")]
+        assert self.suggest("71-4") == [("71-43-2 (Бензол)", "CAS")]
+        assert self.suggest("циклогекс") == [("Циклогексатриен (Бензол)", "Синоним")]
+
+        with django_capture_on_commit_callbacks(execute=True):
+            benzene.primary_name_ru = "Бензол технический"
+            benzene.save()
+        assert self.suggest("техн") == [("Бензол технический", "Вещество")]
+        assert self.suggest("бензол") == [("Бензол технический", "Вещество")]
+
+        with django_capture_on_commit_callbacks(execute=True):
+            benzene.delete()
+        assert self.suggest("бенз") == [("Бензин", "Вещество")]
+        assert self.suggest("циклогекс") == []
+
+    def test_rebuild_indexes_published_elements(self, supplier):
+        ChemicalElement.objects.create(primary_name_ru="Ацетон", created_by=supplier, status='PUBLISHED')
+        ChemicalElement.objects.create(primary_name_ru="Ацетилен", created_by=supplier)
+        assert rebuild_index() == 1
+        assert self.suggest("ацет") == [("Ацетон", "Вещество")]
+
+
+@pytest.mark.django_db
+class TestCasNumbers:
+
+    def test_normalize_checks_digit(self):
+        assert normalize_cas("50-00-0") == "50000"
+        assert normalize_cas(" 7732185 ") == "7732185"
+        assert normalize_cas("50-00-1") is None  # Неверная контрольная цифра
+        assert normalize_cas("111-22-33") is None
+
+    def test_cas_queries_use_normalized_column(self, supplier):
+        """Номер в любой записи хранится канонически; CAS-запрос ищет по цифрам точно или по началу."""
+        formaldehyde = ChemicalElement.objects.create(primary_name_ru="Формальдегид", cas_number=" 50000", created_by=supplier, status='PUBLISHED')
+        ChemicalElement.objects.create(primary_name_ru="Вода", cas_number="7732-18-5", created_by=supplier, status='PUBLISHED')
+        ChemicalElement.objects.create(primary_name_ru="Старый номер", cas_number="111-22-33", created_by=supplier, status='PUBLISHED')
+        formaldehyde.refresh_from_db()
+        assert (formaldehyde.cas_number, formaldehyde.cas_normalized) == ("50-00-0", "50000")
+
+        assert search({'search': '50-00-0'}) == ["Формальдегид"]
+        assert search({'search': '50000'}) == ["Формальдегид"]
+        assert search({'search': '7732-'}) == ["Вода"]
+        # Номер без верной контрольной цифры ищется как раньше, полнотекстово
+        assert search({'search': '111-22-33'}) == ["Старый номер"]
+
+    def test_import_finds_duplicates_in_any_notation(self, supplier):
+        ChemicalElement.objects.create(primary_name_ru="Формальдегид", cas_number="50-00-0", created_by=supplier)
+        content = "Название вещества (RU);CAS номер\nФормалин;50000\nВода;7732185\n".encode('utf-8')
+        report = process_file_import(io.BytesIO(content), 'import.csv', supplier)
+        assert report['success'] == 1
+        assert "Вещество с CAS '50-00-0' уже есть в реестре" in report['errors'][0]
+        assert ChemicalElement.objects.get(cas_normalized="7732185").cas_number == "7732-18-5"
+
+    def test_import_matches_legacy_notation_by_digits(self, supplier, tmp_path):
+        """Старая запись номера ("50000" - миграция такие не переписывала) находится по cas_normalized во всех путях импорта."""
+        from django.core.management import call_command
+        from registry.readers import CsvRowReader
+        from registry.services import IMPORT_MODE_MERGE, validate_rows
+
+        legacy = ChemicalElement.objects.create(primary_name_ru="Формальдегид", created_by=supplier)
+        ChemicalElement.objects.filter(pk=legacy.pk).update(cas_number="50000", cas_normalized="50000")
+        content = "Название вещества (RU);CAS номер\nФормалин;50-00-0\n".encode('utf-8')
+
+        report = process_file_import(io.BytesIO(content), 'import.csv', supplier)
+        assert report['success'] == 0 and "уже есть в реестре" in report['errors'][0]
+        with CsvRowReader(io.BytesIO(content)) as reader:
+            assert validate_rows(reader)['valid_rows'] == 0
+
+        path = tmp_path / "legacy.csv"
+        path.write_bytes(content)
+        err = io.StringIO()
+        call_command('load_registry', str(path), user=supplier.username, stdout=io.StringIO(), stderr=err)
+        assert "уже есть в реестре" in err.getvalue()
+
+        # merge обновляет найденное вещество, а не создает второе
+        report = process_file_import(io.BytesIO(content), 'import.csv', supplier, mode=IMPORT_MODE_MERGE)
+        assert report['updated'] == 1
+        assert ChemicalElement.objects.get().primary_name_ru == "Формалин"
+
+
+@pytest.mark.django_db
+class TestSynonymIndex:
+
+    def test_synonyms_synced_and_found_by_prefix(self, supplier):
+        """Синонимы раскладываются по строкам с ключом; поиск находит синоним целиком и по началу."""
+        toluene = ChemicalElement.objects.create(primary_name_ru="Толуол", created_by=supplier, status='PUBLISHED')
+        sec1 = Sec1Identification.objects.create(element=toluene, synonyms="Метилбензол, ТОЛУОЛ-НЕФРАС;  метилбензол")
+        assert sorted(toluene.synonym_index.values_list('key', flat=True)) == ["метилбензол", "толуол-нефрас"]
+
+        assert search({'search': 'Толуол-Нефрас'}) == ["Толуол"]
+        assert search({'search': 'метилбенз', 'fuzzy': '0'}) == ["Толуол"]
+
+        sec1.synonyms = "Торговое Имя"
+        sec1.save()
+        assert list(toluene.synonym_index.values_list('name', flat=True)) == ["Торговое Имя"]
+        assert search({'search': 'метилбенз', 'fuzzy': '0'}) == []
+
+    def test_import_fills_synonym_rows(self, supplier):
+        content = "Название вещества (RU);Синонимы\nАцетон;Диметилкетон, Пропанон\n".encode('utf-8')
+        process_file_import(io.BytesIO(content), 'import.csv', supplier)
+        assert ChemicalElement.objects.get(primary_name_ru="Ацетон").synonym_index.count() == 2
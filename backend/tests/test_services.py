@@ -65,4 +65,136 @@ class TestExcelImportService:
         # Должна быть ошибка
         assert report['success'] == 0
         assert len(report['errors']) == 1
-        assert "CAS номер" in report['errors'][0]
\ No newline at end of file
+        assert "CAS номер" in report['errors'][0]
+
+    def test_import_batches_rows(self, supplier, django_assert_max_num_queries):
+        """
+        Пакетный импорт:
+        1. Число запросов не растет со строками (bulk_create на модель).
+        2. Ошибки остаются построчными (дубль CAS, нет названия).
+        3. У каждого вещества есть все секции и запись в истории.
+        """
+        rows = [{'Название вещества (RU)': f'Вещество {i}', 'CAS номер': f'100-00-{i}', 'Цвет': 'Белый'} for i in range(50)]
+        rows.append({'Название вещества (RU)': 'Дубль', 'CAS номер': '100-00-1', 'Цвет': ''})
+        rows.append({'Название вещества (RU)': '', 'CAS номер': '200-00-0', 'Цвет': 'Красный'})
+        df = pd.DataFrame(rows)
+        output = io.BytesIO()
+        df.to_excel(output, index=False)
+        output.seek(0)
+
+        with django_assert_max_num_queries(60):
+            report = process_excel_import(output, supplier)
+
+        assert report['success'] == 50
+        assert len(report['errors']) == 2
+        assert report['errors'][0].startswith('Строка 52:')
+        assert 'CAS' in report['errors'][0]
+        assert report['errors'][1].startswith('Строка 53:')
+
+        elem = ChemicalElement.objects.get(cas_number='100-00-7')
+        assert elem.sec2_physical.color == 'Белый'
+        assert hasattr(elem, 'sec23_extra')
+        assert elem.history.count() == 1
+        assert elem.history.first().history_user == supplier
+
+    def test_streaming_reader_rows(self):
+        """Потоковое чтение: числа без '.0', короткие строки дополняются пустыми значениями."""
+        from registry.readers import ExcelRowReader
+
+        df = pd.DataFrame({'Название вещества (RU) *': ['А', 'Б'], 'pH': [7, None]})
+        output = io.BytesIO()
+        df.to_excel(output, index=False)
+        output.seek(0)
+
+        with ExcelRowReader(output) as reader:
+            assert reader.columns == ['Название вещества (RU)', 'pH']
+            assert list(reader) == [(2, ['А', '7']), (3, ['Б', ''])]
+
+    def test_import_plan_converts_columns(self):
+        """План колонок: подписи choices -> ключи, булевы значения, пропуск пустых ячеек."""
+        from registry.models import Sec8EcoTox
+        from registry.services import ImportPlan
+
+        plan = ImportPlan(['Название вещества (RU)', 'Агрегатное состояние', 'Биоаккумуляция (+/-)', 'Лишняя колонка'])
+        rows = plan.convert([
+            (2, ['Ацетон', 'жидкость', 'да', 'x']),
+            (3, ['Бензол', 'GAS', '-', '']),
+            (4, ['', '', '', '']),
+        ])
+
+        assert rows[0] == (2, {
+            ChemicalElement: {'primary_name_ru': 'Ацетон'},
+            Sec2Physical: {'appearance': 'LIQUID'},
+            Sec8EcoTox: {'bioaccumulation': True},
+        }, False)
+        assert rows[1][1][Sec2Physical] == {'appearance': 'GAS'}
+        assert rows[1][1][Sec8EcoTox] == {'bioaccumulation': False}
+        assert rows[2] == (4, {}, True)
+
+    def test_import_merge_by_cas(self, supplier):
+        """Режим merge: обновляет найденные по CAS, пропускает неизменные, создает новые."""
+        from registry.services import IMPORT_MODE_MERGE
+
+        def excel(rows):
+            output = io.BytesIO()
+            pd.DataFrame(rows).to_excel(output, index=False)
+            output.seek(0)
+            return output
+
+        process_excel_import(excel([
+            {'Название вещества (RU)': 'Ацетон', 'CAS номер': '67-64-1', 'Цвет': 'Бесцветный'},
+            {'Название вещества (RU)': 'Бензол', 'CAS номер': '71-43-2', 'Цвет': 'Бесцветный'},
+        ]), supplier)
+        acetone = ChemicalElement.objects.get(cas_number='67-64-1')
+        history_before = acetone.sec2_physical.history.count()
+
+        report = process_excel_import(excel([
+            {'Название вещества (RU)': 'Ацетон', 'CAS номер': '67-64-1', 'Цвет': 'Бесцветный'},
+            {'Название вещества (RU)': 'Бензол', 'CAS номер': '71-43-2', 'Цвет': 'Желтый'},
+            {'Название вещества (RU)': 'Толуол', 'CAS номер': '108-88-3', 'Цвет': ''},
+        ]), supplier, mode=IMPORT_MODE_MERGE)
+
+        assert report == {'success': 2, 'errors': [], 'updated': 1, 'unchanged': 1}
+        assert ChemicalElement.objects.count() == 3
+        assert ChemicalElement.objects.get(cas_number='71-43-2').sec2_physical.color == 'Желтый'
+        # Неизмененная строка не плодит версии в истории
+        assert acetone.sec2_physical.history.count() == history_before
+
+    def test_validate_rows_dry_run(self, supplier, django_assert_max_num_queries):
+        """Dry-run: ошибки по строкам и колонкам за один проход, без записи в БД."""
+        from registry.readers import ExcelRowReader
+        from registry.services import validate_rows
+
+        RegistryConfig.objects.create(required_fields=['color'])
+        ChemicalElement.objects.create(primary_name_ru='Ацетон', cas_number='67-64-1', created_by=supplier)
+
+        df = pd.DataFrame([
+            {'Название вещества (RU)': 'Бензол', 'CAS номер': '71-43-2', 'Цвет': 'Белый', 'Агрегатное состояние': 'Жидкость', 'Биоаккумуляция (+/-)': 'да'},
+            {'Название вещества (RU)': 'Ацетон', 'CAS номер': '67-64-1', 'Цвет': 'Белый', 'Агрегатное состояние': 'Плазма', 'Биоаккумуляция (+/-)': 'нет'},
+            {'Название вещества (RU)': '', 'CAS номер': '71-43-2', 'Цвет': '', 'Агрегатное состояние': '', 'Биоаккумуляция (+/-)': 'может быть'},
+            {'Название вещества (RU)': '', 'CAS номер': '', 'Цвет': '', 'Агрегатное состояние': '', 'Биоаккумуляция (+/-)': ''},
+        ])
+        output = io.BytesIO()
+        df.to_excel(output, index=False)
+        output.seek(0)
+
+        # Настройки + один запрос на все CAS файла
+        with django_assert_max_num_queries(2):
+            with ExcelRowReader(output) as reader:
+                report = validate_rows(reader)
+
+        assert report['rows'] == 3
+        assert report['valid_rows'] == 1
+        assert report['file_errors'] == []
+        assert report['matrix'][0] == {'row': 3, 'cells': {
+            'Агрегатное состояние': "Значение 'Плазма' нет в списке допустимых",
+            'CAS номер': "Вещество с CAS '67-64-1' уже есть в реестре",
+        }}
+        row4 = report['matrix'][1]['cells']
+        assert row4['Название вещества (RU)'] == "Отсутствует 'Название вещества (RU)'"
+        assert row4['Цвет'] == "Поле 'Цвет' обязательно для заполнения."
+        assert 'Да/Нет' in row4['Биоаккумуляция (+/-)']
+        assert 'строке 2' in row4['CAS номер']
+        assert report['columns']['CAS номер'] == 2
+        assert report['errors'][0].startswith('Строка 3: ')
+        assert ChemicalElement.objects.count() == 1
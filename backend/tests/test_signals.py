@@ -43,4 +43,31 @@ class TestSignalsAndTasks:
         assert len(mail.outbox) == 1
         assert mail.outbox[0].subject == subject
         assert mail.outbox[0].to == [email]
-        assert "Email sent" in result
\ No newline at end of file
+        assert "Email sent" in result
+
+@pytest.mark.django_db
+class TestElementRefresh:
+
+    def test_nested_save_refreshes_element_once(self, supplier):
+        """Вложенное сохранение (вещество + секции) обновляет вещество один раз, а не на каждую секцию."""
+        from registry import refresh
+        from registry.models import Sec1Identification, Sec2Physical
+        from registry.serializers import ChemicalElementDetailSerializer
+
+        serializer = ChemicalElementDetailSerializer(data={
+            'primary_name_ru': "Вложенное",
+            'sec1_identification': {'synonyms': "Торговое имя"},
+            'sec2_physical': {'color': "Белый"},
+        })
+        assert serializer.is_valid(), serializer.errors
+        with patch.object(refresh, 'refresh_elements', wraps=refresh.refresh_elements) as refresh_elements, \
+                patch.object(refresh, 'update_search_vectors', wraps=refresh.update_search_vectors) as update_vectors:
+            element = serializer.save(created_by=supplier)
+
+        # Поисковый документ - один пересчет на вещество и его секции
+        refresh_elements.assert_called_once()
+        update_vectors.assert_called_once()
+        sections, saved = refresh_elements.call_args[0]
+        assert list(sections) == [element.pk] and saved == {element.pk}
+        assert {Sec1Identification, Sec2Physical} <= sections[element.pk]
+        assert list(element.synonym_index.values_list('name', flat=True)) == ["Торговое имя"]
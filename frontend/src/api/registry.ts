@@ -24,7 +24,21 @@ export interface TaskResponse {
     result?: {
         status?: string;
         imported?: number;
+        updated?: number;
+        unchanged?: number;
         errors?: string[];
+        // Проверка без записи (dry-run)
+        dry_run?: boolean;
+        rows?: number;
+        valid_rows?: number;
+        matrix?: { row: number; cells: Record<string, string> }[];
+    };
+    progress?: {
+        progress?: number | null;
+        processed?: number;
+        total?: number | null;
+        eta?: number | null;
+        message?: string;
     };
 }
 
@@ -67,9 +81,11 @@ export const downloadTemplate = async () => {
 };
 
 // Загрузка файла (Начало импорта)
-export const uploadFile = async (file: File) => {
+// mode: 'create' - только новые вещества, 'merge' - обновить существующие по CAS
+export const uploadFile = async (file: File, mode: 'create' | 'merge' = 'create') => {
     const formData = new FormData();
     formData.append('file', file);
+    formData.append('mode', mode);
 
     const response = await client.post<{task_id: string}>('/registry/import/upload/', formData, {
         headers: { 'Content-Type': 'multipart/form-data' }
@@ -77,6 +93,18 @@ export const uploadFile = async (file: File) => {
     return response.data;
 };
 
+// Проверка файла без записи в базу (dry-run), результат - через checkTask
+export const validateFile = async (file: File, mode: 'create' | 'merge' = 'create') => {
+    const formData = new FormData();
+    formData.append('file', file);
+    formData.append('mode', mode);
+
+    const response = await client.post<{task_id: string}>('/registry/import/validate/', formData, {
+        headers: { 'Content-Type': 'multipart/form-data' }
+    });
+    return response.data;
+};
+
 // Проверка статуса задачи (Polling)
 export const checkTask = async (taskId: string) => {
     const response = await client.get<TaskResponse>(`/registry/tasks/${taskId}/`);
@@ -90,10 +118,26 @@ export const getElementById = async (id: string | number) => {
 
 // Скачать Паспорт (PDF)
 export const downloadPassport = async (id: number | string, filename?: string) => {
-    const response = await client.get(`/registry/elements/${id}/pdf/`, {
+    let response = await client.get(`/registry/elements/${id}/pdf/`, {
         responseType: 'blob'
     });
 
+    // 202: паспорт рендерится в фоне - ждем задачу и запрашиваем готовый файл
+    if (response.status === 202) {
+        const { task_id } = JSON.parse(await (response.data as Blob).text());
+        let task = await checkTask(task_id);
+        while (task.status === 'PENDING' || task.status === 'PROGRESS') {
+            await new Promise(resolve => setTimeout(resolve, 1000));
+            task = await checkTask(task_id);
+        }
+        if (task.status !== 'SUCCESS') {
+            throw new Error('Не удалось сформировать паспорт');
+        }
+        response = await client.get(`/registry/elements/${id}/pdf/`, {
+            responseType: 'blob'
+        });
+    }
+
     const url = window.URL.createObjectURL(new Blob([response.data]));
     const link = document.createElement('a');
     link.href = url;
@@ -1,12 +1,12 @@
 import { useState, useRef, useEffect } from 'react';
 import {
     Paper, Typography, Box, Button, LinearProgress, Alert,
-    List, ListItem, ListItemIcon, ListItemText, Divider
+    List, ListItem, ListItemIcon, ListItemText, Divider, FormControlLabel, Checkbox
 } from '@mui/material';
 import {
     CloudUpload, Download, InsertDriveFile, CheckCircle, Error as ErrorIcon
 } from '@mui/icons-material';
-import { downloadTemplate, uploadFile, checkTask, type TaskResponse } from '../../api/registry';
+import { downloadTemplate, uploadFile, validateFile, checkTask, type TaskResponse } from '../../api/registry';
 import { useSnackbar } from 'notistack';
 
 const ImportPage = () => {
@@ -17,6 +17,7 @@ const ImportPage = () => {
     const [uploading, setUploading] = useState(false);
     const [taskId, setTaskId] = useState<string | null>(null);
     const [taskData, setTaskData] = useState<TaskResponse | null>(null);
+    const [mergeMode, setMergeMode] = useState(false);
 
     const fileInputRef = useRef<HTMLInputElement>(null);
 
@@ -33,7 +34,9 @@ const ImportPage = () => {
                     // Если готово - останавливаем
                     if (['SUCCESS', 'DONE', 'FAILURE', 'ERROR'].includes(data.status)) {
                         setUploading(false);
-                        if (data.result?.errors && data.result.errors.length === 0) {
+                        if (data.result?.dry_run) {
+                            enqueueSnackbar('Проверка файла завершена', { variant: 'info' });
+                        } else if (data.result?.errors && data.result.errors.length === 0) {
                             enqueueSnackbar('Импорт успешно завершен!', { variant: 'success' });
                         } else {
                             enqueueSnackbar('Импорт завершен с замечаниями', { variant: 'warning' });
@@ -60,11 +63,13 @@ const ImportPage = () => {
         }
     };
 
-    const handleStartUpload = async () => {
+    const handleStartUpload = async (dryRun = false) => {
         if (!selectedFile) return;
         setUploading(true);
+        setTaskData(null);
         try {
-            const res = await uploadFile(selectedFile);
+            const send = dryRun ? validateFile : uploadFile;
+            const res = await send(selectedFile, mergeMode ? 'merge' : 'create');
             setTaskId(res.task_id);
         } catch (e) {
             setUploading(false);
@@ -112,7 +117,7 @@ const ImportPage = () => {
                 >
                     <input
                         type="file"
-                        accept=".xlsx"
+                        accept=".xlsx,.csv,.jsonl,.ndjson,.parquet"
                         hidden
                         ref={fileInputRef}
                         onChange={handleFileChange}
@@ -127,45 +132,77 @@ const ImportPage = () => {
                         <>
                             <CloudUpload color="action" sx={{ fontSize: 48, mb: 1 }} />
                             <Typography>Нажмите или перетащите файл сюда</Typography>
-                            <Typography variant="caption" color="text.secondary">Только .xlsx файлы</Typography>
+                            <Typography variant="caption" color="text.secondary">Excel (.xlsx), CSV, JSON Lines или Parquet</Typography>
                         </>
                     )}
                 </Box>
 
-                <Box sx={{ mt: 3, display:'flex', justifyContent:'flex-end' }}>
+                <Box sx={{ mt: 3, display:'flex', justifyContent:'space-between', alignItems:'center' }}>
+                    <FormControlLabel
+                        control={<Checkbox checked={mergeMode} onChange={(e) => setMergeMode(e.target.checked)} disabled={uploading} />}
+                        label="Обновить существующие вещества (по CAS)"
+                    />
+                    <Box sx={{ display:'flex', gap: 1 }}>
+                    <Button
+                        variant="outlined"
+                        size="large"
+                        disabled={!selectedFile || uploading}
+                        onClick={() => handleStartUpload(true)}
+                    >
+                        Проверить файл
+                    </Button>
                     <Button
                         variant="contained"
                         size="large"
                         disabled={!selectedFile || uploading}
-                        onClick={handleStartUpload}
+                        onClick={() => handleStartUpload()}
                         startIcon={uploading && <CircularProgress size={20} color="inherit"/>}
                     >
                         {uploading ? 'Обработка...' : 'Начать Импорт'}
                     </Button>
+                    </Box>
                 </Box>
 
                 {/* ПРОГРЕСС БАР */}
                 {uploading && (
                     <Box sx={{ mt: 3 }}>
-                        <Typography variant="body2" gutterBottom>Сервер обрабатывает файл...</Typography>
-                        <LinearProgress variant="indeterminate" />
+                        <Typography variant="body2" gutterBottom>
+                            {taskData?.progress?.message || 'Сервер обрабатывает файл...'}
+                            {taskData?.progress?.eta != null && ` (осталось ~${Math.ceil(taskData.progress.eta / 60)} мин.)`}
+                        </Typography>
+                        {taskData?.progress?.progress != null ? (
+                            <LinearProgress variant="determinate" value={taskData.progress.progress} />
+                        ) : (
+                            <LinearProgress variant="indeterminate" />
+                        )}
                     </Box>
                 )}
             </Paper>
 
             {/* ШАГ 3: РЕЗУЛЬТАТЫ */}
             {taskData && ['DONE', 'SUCCESS', 'FINISHED'].includes(taskData.status) && taskData.result && (
-                <Paper sx={{ p: 3, borderLeft: '6px solid', borderColor: (taskData.result.imported || 0) > 0 ? 'success.main' : 'warning.main' }}>
+                <Paper sx={{ p: 3, borderLeft: '6px solid', borderColor: ((taskData.result.imported || taskData.result.valid_rows) || 0) > 0 ? 'success.main' : 'warning.main' }}>
                     <Box sx={{ display:'flex', alignItems:'center', gap: 2, mb: 2 }}>
-                        {(taskData.result.imported || 0) > 0
+                        {((taskData.result.imported || taskData.result.valid_rows) || 0) > 0
                             ? <CheckCircle color="success" sx={{ fontSize: 40 }} />
                             : <ErrorIcon color="warning" sx={{ fontSize: 40 }} />
                         }
                         <Box>
-                            <Typography variant="h6">Обработка завершена</Typography>
+                            <Typography variant="h6">{taskData.result.dry_run ? 'Проверка завершена (без записи в базу)' : 'Обработка завершена'}</Typography>
+                            {taskData.result.dry_run ? (
+                                <Typography variant="body2">
+                                    Строк в файле: <b>{taskData.result.rows ?? 0}</b>, без ошибок: <b>{taskData.result.valid_rows ?? 0}</b>.
+                                </Typography>
+                            ) : (
                             <Typography variant="body2">
                                 Успешно создано: <b>{taskData.result.imported ?? 0}</b> элементов.
                             </Typography>
+                            )}
+                            {taskData.result.updated !== undefined && (
+                                <Typography variant="body2">
+                                    Из них обновлено: <b>{taskData.result.updated}</b>, без изменений: <b>{taskData.result.unchanged ?? 0}</b>.
+                                </Typography>
+                            )}
                         </Box>
                     </Box>
 